@@ -1,3 +1,5 @@
+from .delta import PartialResultDecoder
 from .elbow import ProgressiveEnsembleElbow, ProgressiveEnsembleElbowProcess
 from .ensemble import ProgressiveEnsembleKMeans, ProgressiveEnsembleKMeansProcess
 from .run import ProgressiveKMeans
+from .shared import SharedData
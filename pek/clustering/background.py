@@ -0,0 +1,80 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+"""Background computation of the metrics of the ensemble.
+The metrics of an iteration are computed by a worker (a thread, or a process holding its own copy of the metrics
+calculator) while the ensemble already computes the next iterations. The inputs are the read-only snapshots of the
+partial result, so they are not modified meanwhile. The calculator is stateful (histories, previous labels, cache),
+so the iterations are processed in order by a single worker.
+Each partial result carries the metrics of the latest iteration whose computation is completed (metrics.iteration).
+The first partial result waits for its own metrics. The metrics checked by the early terminators, and the ones of
+the last partial result, are computed by the ensemble after closing the worker: the worker is used only while no
+early terminator is enabled."""
+
+_MAX_PENDING = 4  # max number of iterations waiting for their metrics, bounds the memory of the snapshots
+
+_workerCalculator = None
+
+
+def _initMetricsWorker(calculator, data):
+    global _workerCalculator
+    calculator._X = data.X
+    _workerCalculator = calculator
+
+
+def _workerGetMetrics(iteration, args):
+    return _workerCalculator.getMetrics(*args, iteration=iteration)
+
+
+def _workerGetCalculator():
+    return _workerCalculator
+
+
+class _BackgroundMetrics:
+    """Computes the metrics of the ensemble with the calculator in a worker thread ('threads') or process
+    ('processes'). shared is the SharedData of the ensemble in shared memory, sent to the worker process (None for
+    the 'threads' mode)."""
+
+    def __init__(self, calculator, shared, executor):
+        # in the processes mode, the calculator of this process is updated only when the worker is closed
+        self._calculator = calculator
+        self._inWorker = executor == "processes"
+        if self._inWorker:
+            self._pool = ProcessPoolExecutor(
+                max_workers=1, initializer=_initMetricsWorker, initargs=(calculator, shared)
+            )
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=1)
+        self._pending = deque()
+        self._latest = None
+
+    def submit(self, iteration, args):
+        """Submits the computation of the metrics of the iteration, args are the arguments of getMetrics.
+        Returns the metrics of the latest completed iteration."""
+        if self._inWorker:
+            future = self._pool.submit(_workerGetMetrics, iteration, args)
+        else:
+            future = self._pool.submit(self._calculator.getMetrics, *args, iteration=iteration)
+        self._pending.append(future)
+
+        while len(self._pending) > 0 and (
+            self._pending[0].done() or len(self._pending) > _MAX_PENDING or self._latest is None
+        ):
+            self._latest = self._pending.popleft().result()
+        return self._latest
+
+    def calculator(self):
+        """Returns the calculator, after the computation of the pending iterations."""
+        while len(self._pending) > 0:
+            self._latest = self._pending.popleft().result()
+        if self._inWorker:
+            calculator = self._pool.submit(_workerGetCalculator).result()
+            calculator._X = self._calculator._X
+            return calculator
+        return self._calculator
+
+    def close(self):
+        """Waits for the pending iterations and stops the worker."""
+        self._calculator = self.calculator()
+        self._inWorker = False
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,60 @@
+import gzip
+import os
+import pickle
+
+from .shared import SharedData
+
+"""Checkpoints of the progressive objects (ensemble, elbow).
+A checkpoint is the gzip-compressed pickle of the object, without the dataset: the SharedData and its buffers
+are pickled by reference (persistent ids), and are bound to the dataset of the resuming object when loaded."""
+
+_CHECKPOINT_VERSION = 1
+_COMPRESS_LEVEL = 1  # labels and histories compress well even at the fastest level
+
+
+def _dataBuffers(data):
+    """Dict {persistent id: object} of the data objects not saved in the checkpoint."""
+    return {"data": data, "X": data.X, "x_squared_norms": data.x_squared_norms, "sample_weight": data.sample_weight}
+
+
+class _CheckpointPickler(pickle.Pickler):
+    def __init__(self, file, data):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._ids = {id(obj): key for key, obj in _dataBuffers(data).items()}
+
+    def persistent_id(self, obj):
+        if isinstance(obj, SharedData):
+            return "data"
+        return self._ids.get(id(obj))
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    def __init__(self, file, data):
+        super().__init__(file)
+        self._buffers = _dataBuffers(data)
+
+    def persistent_load(self, pid):
+        return self._buffers[pid]
+
+
+def _saveCheckpoint(obj, path, data):
+    """Saves the checkpoint of obj in path. The file is written atomically (temporary file and rename),
+    so a crash during the save leaves the previous checkpoint intact."""
+    tmpPath = f"{path}.tmp"
+    with gzip.open(tmpPath, "wb", compresslevel=_COMPRESS_LEVEL) as f:
+        pickle.dump({"version": _CHECKPOINT_VERSION, "class": type(obj).__name__, "shape": data.shape}, f)
+        _CheckpointPickler(f, data).dump(obj)
+    os.replace(tmpPath, path)
+
+
+def _loadCheckpoint(path, cls, data):
+    """Loads the checkpoint of an instance of cls from path, binding it to data. Returns the loaded object."""
+    with gzip.open(path, "rb") as f:
+        header = pickle.load(f)
+        if header["version"] != _CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {header['version']}.")
+        if header["class"] != cls.__name__:
+            raise ValueError(f"The checkpoint contains a {header['class']}, not a {cls.__name__}.")
+        if tuple(header["shape"]) != tuple(data.shape):
+            raise ValueError(f"The checkpoint was created on a dataset of shape {header['shape']}, got {data.shape}.")
+        return _CheckpointUnpickler(f, data).load()
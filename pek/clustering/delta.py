@@ -0,0 +1,103 @@
+import copy
+
+import numpy as np
+
+from .results import ArrayDelta
+
+"""Delta encoding of the partial results stream.
+In delta mode the arrays of a partial result (labels, partitions, centroids) are sent in full only in the
+keyframes (the first result, every keyframeFreq results and the last one). The other results carry, for each array,
+an ArrayDelta with the flat indices of the elements changed since the previous result and their new values.
+Labels change for a small fraction of the samples after the first iterations, so the deltas are much smaller
+than the arrays. PartialResultDecoder rebuilds the full arrays on the consumer side."""
+
+DELTA_FIELDS = ["labels", "partitions", "centroids"]
+
+
+class _DeltaEncoder:
+    """Encodes the successive values of named arrays as ArrayDelta w.r.t. their previous values.
+    The previous values are private copies, made at the keyframes and updated with the deltas: the encoded arrays
+    (e.g. snapshots) are not referenced after encode, so their buffers can be written in place."""
+
+    def __init__(self, keyframeFreq):
+        self._keyframeFreq = keyframeFreq
+        self._prev = None
+        self._count = 0
+
+    def encode(self, arrays, keyframe=False):
+        """arrays: dict {name: array}. Returns (keyframe, dict {name: array or ArrayDelta})."""
+        keyframe = (
+            keyframe
+            or self._prev is None
+            or self._count % self._keyframeFreq == 0
+            or any(self._prev[name].shape != a.shape for name, a in arrays.items())
+        )
+        self._count += 1
+
+        if keyframe:
+            encoded = arrays
+            self._prev = {name: np.array(a) for name, a in arrays.items()}
+        else:
+            encoded = {name: _arrayDelta(self._prev[name], a) for name, a in arrays.items()}
+            for name, delta in encoded.items():
+                self._prev[name].ravel()[delta["indices"]] = delta["values"]
+        return keyframe, encoded
+
+    def reset(self):
+        """The next encoded result is a keyframe."""
+        self._prev = None
+
+    def __getstate__(self):
+        # the previous values are not saved, the first result after a resume is a keyframe
+        state = self.__dict__.copy()
+        state["_prev"] = None
+        return state
+
+
+def _arrayDelta(prev, curr):
+    flat = curr.ravel()
+    indices = np.flatnonzero(flat != prev.ravel())
+    if flat.size <= np.iinfo(np.int32).max:
+        indices = indices.astype(np.int32)
+    return ArrayDelta(indices=indices, values=flat[indices])
+
+
+class PartialResultDecoder:
+    """Rebuilds the full partial results of a delta-encoded stream (ensemble or elbow created with delta=True).
+    The results must be decoded in order, starting from a keyframe. Accepts the partial results or their
+    JSON-decoded dicts.
+
+    Example
+    -------
+    decoder = PartialResultDecoder()
+    while ...:
+        r = decoder.decode(queue.get())  # r.labels, r.partitions, r.centroids are full arrays
+    """
+
+    def __init__(self):
+        self._state = None
+
+    def decode(self, partialResult):
+        """Returns a copy of partialResult with the full arrays. The arrays are shared with the following decoded
+        results that do not change them, and must not be modified."""
+        decoded = copy.copy(partialResult)
+        if partialResult["keyframe"]:
+            self._state = {
+                name: np.asarray(partialResult[name]) for name in DELTA_FIELDS if partialResult.get(name) is not None
+            }
+        elif self._state is None:
+            raise ValueError("The first decoded partial result must be a keyframe.")
+        else:
+            for name in DELTA_FIELDS:
+                delta = partialResult.get(name)
+                if delta is None:
+                    continue
+                indices, values = np.asarray(delta["indices"], dtype=np.intp), delta["values"]
+                if len(indices) > 0:
+                    # copy-on-write: the arrays of the previous decoded results are not modified
+                    a = self._state[name].copy()
+                    a.ravel()[indices] = values
+                    self._state[name] = a
+        decoded.update(self._state)
+        decoded["keyframe"] = True
+        return decoded
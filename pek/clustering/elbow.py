@@ -1,7 +1,10 @@
+import copy
+import os
 import time
 import warnings
 from abc import ABC
 from multiprocessing import Process, Queue
+from queue import Empty
 
 import numpy as np
 from kneed import KneeLocator
@@ -15,34 +18,60 @@ from sklearn.utils._param_validation import (
 )
 
 from ..metrics.comparison import _toComparisonMetricDict
-from ..metrics.validation import _toValidationMetricDict
+from ..metrics.validation import (
+    _STATISTICS_VALIDATION_METRICS,
+    _toValidationMetricDict,
+)
 from ..utils.process import (
     ProcessControlMessage,
     ProcessControlMessageType,
     ProcessStatus,
 )
 from ..utils.random import get_random_state
-from .ensemble import ProgressiveEnsembleKMeans
+from .ensemble import ProgressiveEnsembleKMeans, _metricsSample
+from .engines import ALL_ALGORITHMS
+from .executors import ALL_EXECUTORS, _checkBatched
+from .outofcore import _checkOutOfCoreMetrics
+from .parallel import ALL_ELBOW_EXECUTORS, _ParallelElbow
+from .checkpoint import _loadCheckpoint, _saveCheckpoint
+from .delta import _DeltaEncoder
 from .results import (
     ElbowPartialResult,
     ElbowPartialResultInfo,
     ElbowPartialResultMetrics,
     MetricGroup,
+    ProcessErrorResult,
 )
+from .seeding import ALL_INITS
+from .shared import SharedData
 
 
 class _AbstractElbow(ABC):
     @validate_params(
         {
-            "X": ["array-like", "sparse matrix"],
+            "X": [SharedData, "array-like", "sparse matrix"],
             "n_clusters_arr": [None, "array-like"],
             "n_runs": [Interval(Integral, 1, None, closed="left")],
-            "init": [StrOptions({"k-means++", "random"})],
+            "init": [StrOptions(set(ALL_INITS))],
+            "algorithm": [StrOptions(set(ALL_ALGORITHMS))],
+            "batch_size": [None, Interval(Integral, 1, None, closed="left")],
+            "reassignment_ratio": [Interval(Real, 0, None, closed="left")],
+            "full_assignment_freq": [None, Interval(Integral, 1, None, closed="left")],
+            "batched": [bool],
+            "executor": [StrOptions(set(ALL_EXECUTORS))],
+            "n_jobs": [None, Interval(Integral, 1, None, closed="left")],
+            "elbowExecutor": [StrOptions(set(ALL_ELBOW_EXECUTORS))],
+            "elbowJobs": [None, Interval(Integral, 1, None, closed="left")],
+            "checkpointPath": [None, str, os.PathLike],
+            "checkpointFreq": [None, Interval(Real, 0, None, closed="left")],
+            "delta": [bool],
+            "keyframeFreq": [Interval(Integral, 1, None, closed="left")],
             "max_iter": [Interval(Integral, 1, None, closed="left")],
             "tol": [Interval(Real, 0, None, closed="left")],
             "random_state": ["random_state"],
             "validationMetrics": [None, str, "array-like"],
             "freq": [None, Interval(Real, 0, None, closed="left")],
+            "metricsSampleSize": [None, Interval(Integral, 1, None, closed="left")],
         },
         prefer_skip_nested_validation=True,
     )
@@ -52,6 +81,19 @@ class _AbstractElbow(ABC):
         n_clusters_arr=None,
         n_runs=4,
         init="k-means++",
+        algorithm="lloyd",
+        batch_size=None,
+        reassignment_ratio=0.01,
+        full_assignment_freq=10,
+        batched=False,
+        executor="serial",
+        n_jobs=None,
+        elbowExecutor="serial",
+        elbowJobs=None,
+        checkpointPath=None,
+        checkpointFreq=None,
+        delta=False,
+        keyframeFreq=50,
         max_iter=300,
         tol=1e-4,
         random_state=None,
@@ -60,23 +102,40 @@ class _AbstractElbow(ABC):
         labelsValidationMetrics=None,
         partitionsValidationMetrics=None,
         partitionsComparisonMetrics=None,
+        metricsSampleSize=None,
         taskId=None,
     ):
-        self._X = X
+        self._data = SharedData.wrap(X)
+        self._X = self._data.X
         self._n_clusters_arr = n_clusters_arr
         self._n_runs = n_runs
         self._init = init
+        self._algorithm = algorithm
+        self._batch_size = batch_size
+        self._reassignment_ratio = reassignment_ratio
+        self._full_assignment_freq = full_assignment_freq
+        self._batched = batched
+        self._executor = executor
+        self._n_jobs = n_jobs
+        self._elbowExecutor = elbowExecutor
+        self._elbowJobs = elbowJobs
+        self._checkpointPath = checkpointPath
+        self._checkpointFreq = checkpointFreq
+        self._lastCheckpointTimestamp = time.time()
         self._max_iter = max_iter
         self._tol = tol
         self._random_state = get_random_state(random_state)
         self._et = et
         self._freq = freq
+        self._deltaEncoder = _DeltaEncoder(keyframeFreq) if delta else None
         self._taskId = taskId
         self._metricsCalculator = _ElbowMetricsCalculator(
-            X,
+            self._X,
             labelsValidationMetrics=labelsValidationMetrics,
             partitionsValidationMetrics=partitionsValidationMetrics,
             partitionsComparisonMetrics=partitionsComparisonMetrics,
+            metricsSampleSize=metricsSampleSize,
+            random_state=self._random_state,
         )
         self._etArray = [] if et is None else [et]
 
@@ -89,6 +148,11 @@ class _AbstractElbow(ABC):
         if len(self._n_clusters_arr) <= 2:
             raise InvalidParameterError(f"The 'n_clusters_arr' must have length >=2. Got {len(self._n_clusters_arr)}.")
 
+        _checkBatched(executor, batched)
+
+        if elbowExecutor == "processes" and self._data.outOfCore:
+            raise ValueError("Out-of-core data cannot be shared with worker processes, use the 'serial' elbowExecutor.")
+
     """def _generateHash(self, params):
         if self._cache:
             _d = Bunch(X=hashlib.md5(self._X).hexdigest())
@@ -112,6 +176,19 @@ class ProgressiveEnsembleElbow(_AbstractElbow):
         n_clusters_arr=None,
         n_runs=4,
         init="k-means++",
+        algorithm="lloyd",
+        batch_size=None,
+        reassignment_ratio=0.01,
+        full_assignment_freq=10,
+        batched=False,
+        executor="serial",
+        n_jobs=None,
+        elbowExecutor="serial",
+        elbowJobs=None,
+        checkpointPath=None,
+        checkpointFreq=None,
+        delta=False,
+        keyframeFreq=50,
         max_iter=300,
         tol=1e-4,
         random_state=None,
@@ -120,6 +197,7 @@ class ProgressiveEnsembleElbow(_AbstractElbow):
         labelsValidationMetrics=None,
         partitionsValidationMetrics=None,
         partitionsComparisonMetrics=None,
+        metricsSampleSize=None,
         taskId=None,
     ):
         super().__init__(
@@ -127,6 +205,19 @@ class ProgressiveEnsembleElbow(_AbstractElbow):
             n_clusters_arr=n_clusters_arr,
             n_runs=n_runs,
             init=init,
+            algorithm=algorithm,
+            batch_size=batch_size,
+            reassignment_ratio=reassignment_ratio,
+            full_assignment_freq=full_assignment_freq,
+            batched=batched,
+            executor=executor,
+            n_jobs=n_jobs,
+            elbowExecutor=elbowExecutor,
+            elbowJobs=elbowJobs,
+            checkpointPath=checkpointPath,
+            checkpointFreq=checkpointFreq,
+            delta=delta,
+            keyframeFreq=keyframeFreq,
             max_iter=max_iter,
             tol=tol,
             random_state=random_state,
@@ -135,6 +226,7 @@ class ProgressiveEnsembleElbow(_AbstractElbow):
             labelsValidationMetrics=labelsValidationMetrics,
             partitionsValidationMetrics=partitionsValidationMetrics,
             partitionsComparisonMetrics=partitionsComparisonMetrics,
+            metricsSampleSize=metricsSampleSize,
             taskId=taskId,
         )
 
@@ -146,28 +238,78 @@ class ProgressiveEnsembleElbow(_AbstractElbow):
         self._results = []
         self._prevResultTimestamp = 0.0
 
-    def _executeNextIteration(self):
-        if not self.hasNextIteration():
-            raise RuntimeError("No next iteration to execute.")
+        # ensemble of the current k, kept in the state so that a checkpoint can resume it
+        self._ensemble = None
+        self._ensembleLastResult = None
 
-        k = self._pending.pop(0)
+        # pool of the ensembles of the pending k in the processes elbowExecutor, not kept in the state
+        self._parallel = None
 
-        ensemble = ProgressiveEnsembleKMeans(
-            self._X,
+    def _ensembleParams(self, k):
+        """Arguments of the ensemble of k."""
+        return dict(
             n_clusters=k,
             n_runs=self._n_runs,
             init=self._init,
+            algorithm=self._algorithm,
+            batch_size=self._batch_size,
+            reassignment_ratio=self._reassignment_ratio,
+            full_assignment_freq=self._full_assignment_freq,
+            batched=self._batched,
+            executor=self._executor,
+            n_jobs=self._n_jobs,
             max_iter=self._max_iter,
             tol=self._tol,
             random_state=self._random_state,
             ets=self._etArray,
         )
 
-        ensembleLastResult = ensemble.executeAllIterations()
+    def _executeNextEnsemble(self):
+        """Executes the ensemble of the first pending k. Returns k and the last partial result of the ensemble."""
+        k = self._pending[0]
+
+        if self._ensemble is None:
+            self._ensemble = ProgressiveEnsembleKMeans(self._data, **self._ensembleParams(k))
+
+        while self._ensemble.hasNextIteration():
+            self._ensembleLastResult = self._ensemble.executeNextIteration()
+            if self._checkpointFreq is not None:
+                self._autoCheckpoint()
+
+        ensembleLastResult = self._ensembleLastResult
+        self._ensemble = None
+        self._ensembleLastResult = None
+        return k, ensembleLastResult
+
+    def _nextCompletedEnsemble(self):
+        """Executes the ensembles of all the pending k in parallel. Returns the first completed k and the last
+        partial result of its ensemble."""
+        if self._parallel is None:
+            self._parallel = _ParallelElbow(self._data, self._elbowJobs, len(self._pending))
+        for k in self._pending:
+            self._parallel.submit(k, self._ensembleParams(k))
+        return self._parallel.nextCompleted()
+
+    def _closeParallel(self):
+        if self._parallel is not None:
+            self._parallel.close()
+            self._parallel = None
+
+    def _executeNextIteration(self):
+        if not self.hasNextIteration():
+            raise RuntimeError("No next iteration to execute.")
+
+        if self._elbowExecutor == "processes":
+            k, ensembleLastResult = self._nextCompletedEnsemble()
+        else:
+            k, ensembleLastResult = self._executeNextEnsemble()
+        self._pending.remove(k)
 
         self._iteration += 1
         self._completed = len(self._pending) == 0
         last = not self.hasNextIteration()
+        if last:
+            self._closeParallel()
 
         elbowResultInfo = ElbowPartialResultInfo(
             self._iteration, self._random_state, k, ensembleLastResult.info.inertia, last, self._completed
@@ -186,9 +328,14 @@ class ProgressiveEnsembleElbow(_AbstractElbow):
         # set the elbow value
         elbowResultInfo.elbowPoint = self._computeElbowPoint()
 
+        # in delta mode the labels are encoded as changes w.r.t. the labels of the previous partial result
+        keyframe, arrays = True, {"labels": ensembleLastResult.labels}
+        if self._deltaEncoder is not None:
+            keyframe, arrays = self._deltaEncoder.encode(arrays, keyframe=last)
+
         # create elbow result
         elbowResult = ElbowPartialResult(
-            info=elbowResultInfo, metrics=elbowResultMetrics, taskId=self._taskId, labels=ensembleLastResult.labels
+            info=elbowResultInfo, metrics=elbowResultMetrics, taskId=self._taskId, keyframe=keyframe, **arrays
         )
         self._results.append(elbowResult)
 
@@ -200,12 +347,15 @@ class ProgressiveEnsembleElbow(_AbstractElbow):
 
         self._prevResultTimestamp = time.time()
 
+        self._autoCheckpoint()
+
         return elbowResult
 
     def _computeElbowPoint(self):
-        """Computes the elbow point using the inertia curve composed of all the past partial results.
+        """Computes the elbow point using the inertia curve composed of all the past partial results, sorted by k
+        (the k are completed out of order by the processes elbowExecutor).
         Returns the n_cluster value of the elbow, if exists. Otherwise, returns None."""
-        inertiaCurve = np.array([[r.info.n_clusters, r.info.inertia] for r in self._results])
+        inertiaCurve = np.array(sorted([r.info.n_clusters, r.info.inertia] for r in self._results))
         try:
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore", RuntimeWarning)
@@ -235,6 +385,45 @@ class ProgressiveEnsembleElbow(_AbstractElbow):
 
     def kill(self):
         self._killed = True
+        self._closeParallel()
+
+    def checkpoint(self, path):
+        """Saves the state of the elbow in path: results of the completed k, pending k, metric histories, and the
+        state of the ensemble of the current k. The dataset is not saved.
+        With the processes elbowExecutor, the ensembles running in the workers are not saved: their k are pending."""
+        _saveCheckpoint(self, path, self._data)
+        self._lastCheckpointTimestamp = time.time()
+
+    def resume(self, path):
+        """Restores the state saved in path by checkpoint. The elbow must be created on the same dataset.
+        The taskId, the auto-checkpoint parameters and the delta mode of this elbow are kept.
+        In delta mode, the next partial result is a keyframe."""
+        loaded = _loadCheckpoint(path, type(self), self._data)
+        self._closeParallel()
+        for key in ["_taskId", "_checkpointPath", "_checkpointFreq", "_lastCheckpointTimestamp", "_deltaEncoder"]:
+            setattr(loaded, key, getattr(self, key))
+        self.__dict__.update(loaded.__dict__)
+        if self._deltaEncoder is not None:
+            self._deltaEncoder.reset()
+
+    def _autoCheckpoint(self):
+        """Saves a checkpoint in checkpointPath after each partial result, or after checkpointFreq seconds
+        (also during the iterations of the ensemble of the current k)."""
+        if self._checkpointPath is None:
+            return
+        elapsed = time.time() - self._lastCheckpointTimestamp
+        if self._checkpointFreq is None or elapsed >= self._checkpointFreq or not self.hasNextIteration():
+            self.checkpoint(self._checkpointPath)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_X"]
+        state["_parallel"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._X = self._data.X
 
 
 class ProgressiveEnsembleElbowProcess(Process):
@@ -244,6 +433,19 @@ class ProgressiveEnsembleElbowProcess(Process):
         n_clusters_arr=None,
         n_runs=4,
         init="k-means++",
+        algorithm="lloyd",
+        batch_size=None,
+        reassignment_ratio=0.01,
+        full_assignment_freq=10,
+        batched=False,
+        executor="serial",
+        n_jobs=None,
+        elbowExecutor="serial",
+        elbowJobs=None,
+        checkpointPath=None,
+        checkpointFreq=None,
+        delta=False,
+        keyframeFreq=50,
         max_iter=300,
         tol=1e-4,
         random_state=None,
@@ -255,6 +457,7 @@ class ProgressiveEnsembleElbowProcess(Process):
         partitionsValidationMetrics=None,
         partitionsComparisonMetrics=None,
         partitionsProgressionMetrics=None,
+        metricsSampleSize=None,
         taskId=None,
         verbose=False,
         resultsQueue=None,
@@ -267,6 +470,19 @@ class ProgressiveEnsembleElbowProcess(Process):
             n_clusters_arr=n_clusters_arr,
             n_runs=n_runs,
             init=init,
+            algorithm=algorithm,
+            batch_size=batch_size,
+            reassignment_ratio=reassignment_ratio,
+            full_assignment_freq=full_assignment_freq,
+            batched=batched,
+            executor=executor,
+            n_jobs=n_jobs,
+            elbowExecutor=elbowExecutor,
+            elbowJobs=elbowJobs,
+            checkpointPath=checkpointPath,
+            checkpointFreq=checkpointFreq,
+            delta=delta,
+            keyframeFreq=keyframeFreq,
             max_iter=max_iter,
             tol=tol,
             random_state=random_state,
@@ -275,6 +491,7 @@ class ProgressiveEnsembleElbowProcess(Process):
             labelsValidationMetrics=labelsValidationMetrics,
             partitionsValidationMetrics=partitionsValidationMetrics,
             partitionsComparisonMetrics=partitionsComparisonMetrics,
+            metricsSampleSize=metricsSampleSize,
             taskId=taskId,
         )
 
@@ -286,26 +503,57 @@ class ProgressiveEnsembleElbowProcess(Process):
     def _waitForResume(self):
         while True:
             msg = self._controlsQueue.get(block=True)
-            if (
+            if msg.messageType == ProcessControlMessageType.CHECKPOINT:
+                self._checkpoint(msg.messageData.path)
+            elif (
                 msg.messageType == ProcessControlMessageType.RESUME
                 or msg.messageType == ProcessControlMessageType.START
             ):
+                if msg.messageData is not None:
+                    self._resume(msg.messageData.path)
                 self._status = ProcessStatus.RUNNING
                 return
 
     def _readControlMessage(self):
         try:
             msg = self._controlsQueue.get(block=False)
+        except (Empty, EOFError):
+            return
 
-            if msg.messageType == ProcessControlMessageType.PAUSE:
-                self._status = ProcessStatus.PAUSED
-                self._waitForResume()
+        if msg.messageType == ProcessControlMessageType.PAUSE:
+            self._status = ProcessStatus.PAUSED
+            self._waitForResume()
 
-            elif msg.messageType == ProcessControlMessageType.KILL:
-                self._status = ProcessStatus.KILLED
-                self._elbow.kill()
-        except:
-            pass
+        elif msg.messageType == ProcessControlMessageType.RESUME and msg.messageData is not None:
+            self._resume(msg.messageData.path)
+
+        elif msg.messageType == ProcessControlMessageType.CHECKPOINT:
+            self._checkpoint(msg.messageData.path)
+
+        elif msg.messageType == ProcessControlMessageType.KILL:
+            self._status = ProcessStatus.KILLED
+            self._elbow.kill()
+
+    def _checkpoint(self, path):
+        try:
+            self._elbow.checkpoint(path)
+        except Exception as e:
+            self._reportError(ProcessControlMessageType.CHECKPOINT, path, e)
+
+    def _resume(self, path):
+        try:
+            self._elbow.resume(path)
+        except Exception as e:
+            self._reportError(ProcessControlMessageType.RESUME, path, e)
+
+    def _reportError(self, messageType, path, error):
+        """Reports the failure of a control message on the results queue, the elbow continues from its current
+        state. Without results queue, the error is raised."""
+        if self._resultsQueue is None:
+            raise error
+        self._resultsQueue.put(
+            ProcessErrorResult(messageType.value, path=str(path), error=repr(error), taskId=self._elbow._taskId)
+        )
 
     def run(self):
         self._status = ProcessStatus.RUNNING
@@ -333,8 +581,23 @@ class ProgressiveEnsembleElbowProcess(Process):
         msg = ProcessControlMessage.PAUSE()
         self._controlsQueue.put(msg)
 
-    def resume(self):
-        msg = ProcessControlMessage.RESUME()
+    def resume(self, path=None):
+        """Resumes the paused process. If path is given, the state of the elbow is restored from the checkpoint:
+        immediately if the process is not started, otherwise by the process before its next iteration
+        (if the checkpoint cannot be loaded, a ProcessErrorResult is put on the results queue)."""
+        if path is not None and self.pid is None:
+            self._elbow.resume(path)
+            return
+        msg = ProcessControlMessage.RESUME(path)
+        self._controlsQueue.put(msg)
+
+    def checkpoint(self, path):
+        """Asks the process to save a checkpoint of the elbow in path, before its next iteration.
+        If the checkpoint fails, a ProcessErrorResult is put on the results queue."""
+        if self.pid is None:
+            self._elbow.checkpoint(path)
+            return
+        msg = ProcessControlMessage.CHECKPOINT(path)
         self._controlsQueue.put(msg)
 
     def kill(self):
@@ -349,25 +612,66 @@ class _ElbowMetricsCalculator:
         labelsValidationMetrics=None,
         partitionsValidationMetrics=None,
         partitionsComparisonMetrics=None,
+        metricsSampleSize=None,
+        random_state=None,
     ):
         self._X = X
+        self._sample = _metricsSample(X.shape[0], metricsSampleSize, random_state)
+        self._sampleSize = X.shape[0] if self._sample is None else len(self._sample)
+        self._XSample = None  # rows of the sample, read at the first use
         self._labelsValidationMetrics = _toValidationMetricDict(labelsValidationMetrics)
         self._partitionsValidationMetrics = _toValidationMetricDict(partitionsValidationMetrics)
         self._partitionsComparisonMetrics = _toComparisonMetricDict(partitionsComparisonMetrics)
+        if self._sample is None:
+            _checkOutOfCoreMetrics(X, self._labelsValidationMetrics, self._partitionsValidationMetrics)
+        self._validationMetricNames = sorted({*self._labelsValidationMetrics, *self._partitionsValidationMetrics})
+        self._statistics = {}
 
     def getMetrics(self, ensembleResult):
+        self._statistics = {}  # (statistics class, partition index) -> statistics shared by the validation metrics
+        if self._sample is not None:
+            # the metrics are computed on the entries of the sample
+            ensembleResult = copy.copy(ensembleResult)
+            ensembleResult.labels = ensembleResult.labels[self._sample]
+            ensembleResult.partitions = ensembleResult.partitions[:, self._sample]
         return ElbowPartialResultMetrics(
             labelsValidationMetrics=self._compute_labelsValidationMetrics(ensembleResult),
             partitionsValidationMetrics=self._compute_partitionsValidationMetrics(ensembleResult),
             partitionsComparisonMetrics=self._compute_partitionsComparisonMetrics(ensembleResult),
+            sampleSize=self._sampleSize,
         )
 
+    def __getstate__(self):
+        # the rows of the sample are read again after a resume
+        state = self.__dict__.copy()
+        state["_XSample"] = None
+        return state
+
+    def _metricsX(self):
+        """Data the validation metrics are computed on: X, or the rows of the metrics sample."""
+        if self._sample is None:
+            return self._X
+        if self._XSample is None:
+            self._XSample = self._X[self._sample]
+        return self._XSample
+
+    def _validationMetric(self, metricName, metricFunction, labels, partitionIndex):
+        if metricName not in _STATISTICS_VALIDATION_METRICS:
+            return metricFunction(self._metricsX(), labels)
+        statisticsClass, statisticsFunction = _STATISTICS_VALIDATION_METRICS[metricName]
+        key = (statisticsClass, partitionIndex)
+        if key not in self._statistics:
+            self._statistics[key] = statisticsClass(self._metricsX(), labels, self._validationMetricNames)
+        return statisticsFunction(self._statistics[key])
+
     def _compute_labelsValidationMetrics(self, ensembleResult):
         """Labels validation metrics are computed only on the current best labels."""
         res = {"inertia": ensembleResult.metrics.labelsValidationMetrics.inertia}
         for metricName, metricFunction in self._labelsValidationMetrics.items():
             if metricName not in res:
-                res[metricName] = metricFunction(self._X, ensembleResult.labels)
+                res[metricName] = self._validationMetric(
+                    metricName, metricFunction, ensembleResult.labels, ensembleResult.info.bestRun
+                )
 
         return MetricGroup(**res)
 
@@ -380,7 +684,9 @@ class _ElbowMetricsCalculator:
             if metricName not in res:
                 res[metricName] = np.empty(ensembleResult.partitions.shape[0], dtype=float)
                 for i in range(ensembleResult.partitions.shape[0]):
-                    res[metricName][i] = metricFunction(self._X, ensembleResult.partitions[i, :])
+                    res[metricName][i] = self._validationMetric(
+                        metricName, metricFunction, ensembleResult.partitions[i, :], i
+                    )
 
         return MetricGroup(**res)
 
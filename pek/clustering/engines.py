@@ -0,0 +1,433 @@
+import numpy as np
+import scipy.sparse as sp
+from sklearn.cluster._k_means_common import (
+    _relocate_empty_clusters_dense,
+    _relocate_empty_clusters_sparse,
+)
+from sklearn.cluster._k_means_elkan import (
+    elkan_iter_chunked_dense,
+    elkan_iter_chunked_sparse,
+    init_bounds_dense,
+    init_bounds_sparse,
+)
+from sklearn.cluster._k_means_lloyd import (
+    lloyd_iter_chunked_dense,
+    lloyd_iter_chunked_sparse,
+)
+from sklearn.cluster._k_means_minibatch import (
+    _minibatch_update_dense,
+    _minibatch_update_sparse,
+)
+from sklearn.cluster._kmeans import _labels_inertia
+from sklearn.metrics.pairwise import euclidean_distances
+from sklearn.utils.extmath import row_norms, safe_sparse_dot
+
+from .outofcore import _isOutOfCore
+
+"""Iteration engines of the progressive k-means.
+Each engine is a callable with the same signature of the sklearn Lloyd kernels
+(X, sample_weight, centers, centers_new, weight_in_clusters, labels, center_shift, n_threads, update_centers),
+so that ProgressiveKMeans can switch among them without changing the iteration logic."""
+
+ALL_ALGORITHMS = ["elkan", "hamerly", "lloyd"]
+
+_CHUNK_SIZE = 4096
+_MULTI_RUN_CHUNK_ELEMENTS = 2**20  # max number of elements of the distances block of the multi-run kernel
+
+
+def _rowsDistances(X, rows, centers, labels):
+    """Euclidean distance of each X[rows] to its assigned center centers[labels]."""
+    Xr = X[rows]
+    C = centers[labels]
+    if sp.issparse(Xr):
+        sq = row_norms(Xr, squared=True) - 2 * np.asarray(Xr.multiply(C).sum(axis=1)).ravel() + row_norms(C, squared=True)
+    else:
+        sq = row_norms(Xr - C, squared=True)
+    return np.sqrt(np.maximum(sq, 0, out=sq), out=sq)
+
+
+def _updateCenters(X, sample_weight, labels, centers, centers_new, weight_in_clusters):
+    """Update step of k-means: centers_new is the weighted mean of the points of each cluster.
+    Empty clusters keep their previous center. Outputs are written in place."""
+    n_samples = X.shape[0]
+    n_clusters = centers.shape[0]
+    W = sp.csr_matrix((sample_weight, (labels, np.arange(n_samples))), shape=(n_clusters, n_samples))
+    sums = W @ X
+    if sp.issparse(sums):
+        sums = sums.toarray()
+    weight_in_clusters[:] = np.bincount(labels, weights=sample_weight, minlength=n_clusters)
+    nonEmpty = weight_in_clusters > 0
+    centers_new[nonEmpty] = sums[nonEmpty] / weight_in_clusters[nonEmpty, None]
+    centers_new[~nonEmpty] = centers[~nonEmpty]
+
+
+def _totalScatter(X, sample_weight):
+    """Returns (mean, scatter) of X, where scatter is the weighted sum of squared distances of the points to the mean.
+    Used to compute the tolerance of the convergence without passes over X."""
+    if _isOutOfCore(X):
+        # a single pass over the chunks, as for sparse data
+        sums = np.zeros(X.shape[1], dtype=np.float64)
+        squares = 0.0
+        for start, end, Xc in X.chunks():
+            sums += Xc.T @ sample_weight[start:end]
+            squares += float(sample_weight[start:end] @ row_norms(Xc, squared=True))
+        mean = sums / sample_weight.sum()
+        return mean, max(squares - sample_weight.sum() * float(mean @ mean), 0.0)
+
+    mean = np.asarray(X.T @ sample_weight, dtype=np.float64).ravel() / sample_weight.sum()
+    if sp.issparse(X):
+        scatter = float(sample_weight @ row_norms(X, squared=True)) - sample_weight.sum() * float(mean @ mean)
+    else:
+        scatter = 0.0
+        for start in range(0, X.shape[0], _CHUNK_SIZE):
+            diff = X[start : start + _CHUNK_SIZE] - mean
+            scatter += float(sample_weight[start : start + _CHUNK_SIZE] @ row_norms(diff, squared=True))
+    return mean, max(scatter, 0.0)
+
+
+def _denseRows(X, rows=None):
+    """Yields (rows, X[rows] as dense float64) by blocks of rows, for the given increasing row indices
+    (None for all the rows). Out-of-core data is read by chunks of consecutive rows, skipping the chunks without
+    rows to read."""
+    n_samples, n_features = X.shape
+    if _isOutOfCore(X):
+        for start, end, Xc in X.chunks() if rows is None else _readChunks(X, rows):
+            chunkRows = np.arange(start, end) if rows is None else rows[(rows >= start) & (rows < end)]
+            yield chunkRows, Xc if rows is None else Xc[chunkRows - start]
+        return
+    step = max(1, _MULTI_RUN_CHUNK_ELEMENTS // max(1, n_features))
+    rows = np.arange(n_samples) if rows is None else rows
+    for i in range(0, len(rows), step):
+        blockRows = rows[i : i + step]
+        Xr = X[blockRows]
+        yield blockRows, Xr.toarray() if sp.issparse(Xr) else np.asarray(Xr, dtype=np.float64)
+
+
+def _readChunks(X, rows):
+    """Yields (start, end, X[start:end]) for the chunks of the out-of-core X that contain some of the rows."""
+    for start in range(0, X.shape[0], X.chunk_size):
+        end = min(start + X.chunk_size, X.shape[0])
+        lo, hi = np.searchsorted(rows, [start, end])
+        if lo < hi:
+            yield start, end, X[start:end]
+
+
+class _LabelsInertia:
+    """Inertia of the labels of a run with respect to the means of their clusters (as the inertia validation metric),
+    kept up to date across the iterations without passes over X.
+    The float64 sums of the clusters and the inertia are updated with the points that changed cluster since the
+    previous call only: their squared distances to the previous means are computed on the differences, so without
+    cancellation, for float32 data too. Then the inertia is moved to the new means with the parallel axis theorem,
+    sum ||x - m||^2 = sum ||x - c||^2 - W ||m - c||^2, whose correction is small as the means move little."""
+
+    def __init__(self, n_clusters, n_features, labels):
+        self._sums = np.zeros((n_clusters, n_features), dtype=np.float64)
+        self._weights = np.zeros(n_clusters, dtype=np.float64)
+        self._counts = np.zeros(n_clusters, dtype=np.int64)
+        # reference point of each cluster: its mean if not empty
+        self._means = None
+        self._inertia = 0.0
+        # buffer with the labels of the previous call
+        self.labels = labels
+
+    def _accumulate(self, Xr, w, labels, sign):
+        n_clusters = self._weights.shape[0]
+        W = sp.csr_matrix((sign * w, (labels, np.arange(len(labels)))), shape=(n_clusters, len(labels)))
+        self._sums += W @ Xr
+        self._weights += sign * np.bincount(labels, weights=w, minlength=n_clusters)
+        self._counts += sign * np.bincount(labels, minlength=n_clusters)
+
+    def __call__(self, X, sample_weight, labels, centers):
+        """Returns the inertia of labels. centers are the centers the labels were assigned to, the references of the
+        first call, that reads all of X."""
+        first = self._means is None
+        labels_old = self.labels
+        if first:
+            self._means = np.array(centers, dtype=np.float64)
+            rows = None
+        else:
+            rows = np.flatnonzero(labels != labels_old)
+        inertia = self._inertia
+        for blockRows, Xr in _denseRows(X, rows):
+            w = np.asarray(sample_weight[blockRows], dtype=np.float64)
+            newLabels = labels[blockRows]
+            inertia += float(w @ row_norms(Xr - self._means[newLabels], squared=True))
+            self._accumulate(Xr, w, newLabels, 1)
+            if not first:
+                oldLabels = labels_old[blockRows]
+                inertia -= float(w @ row_norms(Xr - self._means[oldLabels], squared=True))
+                self._accumulate(Xr, w, oldLabels, -1)
+
+        empty = self._counts == 0
+        self._sums[empty] = 0
+        self._weights[empty] = 0
+        nonEmpty = self._weights > 0
+        means = self._sums[nonEmpty] / self._weights[nonEmpty, None]
+        inertia -= float(self._weights[nonEmpty] @ row_norms(means - self._means[nonEmpty], squared=True))
+        self._means[nonEmpty] = means
+        self._inertia = max(inertia, 0.0)
+        labels_old[:] = labels
+        return self._inertia
+
+
+class _ElkanIter:
+    """Elkan iteration engine. Keeps, for each point, an upper bound to the distance to its center
+    and a lower bound to the distance to every other center (n x k memory)."""
+
+    def __init__(self, X, n_clusters):
+        self._sparse = sp.issparse(X)
+        self._upper_bounds = np.zeros(X.shape[0], dtype=X.dtype)
+        self._lower_bounds = np.zeros((X.shape[0], n_clusters), dtype=X.dtype)
+        self._initialized = False
+
+    def __call__(
+        self, X, sample_weight, centers, centers_new, weight_in_clusters, labels, center_shift, n_threads, update_centers
+    ):
+        center_half_distances = euclidean_distances(centers) / 2
+        if centers.shape[0] > 1:
+            distance_next_center = np.partition(np.asarray(center_half_distances), kth=1, axis=0)[1]
+        else:
+            distance_next_center = np.full(1, np.inf, dtype=centers.dtype)
+
+        if not self._initialized:
+            init_bounds = init_bounds_sparse if self._sparse else init_bounds_dense
+            init_bounds(
+                X, centers, center_half_distances, labels, self._upper_bounds, self._lower_bounds, n_threads=n_threads
+            )
+            self._initialized = True
+            if not update_centers:
+                return
+
+        elkan_iter = elkan_iter_chunked_sparse if self._sparse else elkan_iter_chunked_dense
+        elkan_iter(
+            X,
+            sample_weight,
+            centers,
+            centers_new,
+            weight_in_clusters,
+            center_half_distances,
+            distance_next_center,
+            self._upper_bounds,
+            self._lower_bounds,
+            labels,
+            center_shift,
+            n_threads,
+            update_centers=update_centers,
+        )
+
+
+class _HamerlyIter:
+    """Hamerly iteration engine. Keeps, for each point, an upper bound to the distance to its center
+    and a single lower bound to the distance to the second closest center (linear memory)."""
+
+    def __init__(self, X, n_clusters):
+        self._upper_bounds = np.zeros(X.shape[0], dtype=X.dtype)
+        self._lower_bounds = np.zeros(X.shape[0], dtype=X.dtype)
+        self._initialized = False
+
+    def _assignRows(self, X, rows, centers, labels):
+        """Exact assignment of X[rows], updating labels and both bounds."""
+        for start in range(0, len(rows), _CHUNK_SIZE):
+            chunk = rows[start : start + _CHUNK_SIZE]
+            dist = euclidean_distances(X[chunk], centers)
+            if centers.shape[0] > 1:
+                part = np.partition(dist, kth=1, axis=1)
+                self._lower_bounds[chunk] = part[:, 1]
+            else:
+                self._lower_bounds[chunk] = np.inf
+            labels[chunk] = np.argmin(dist, axis=1)
+            self._upper_bounds[chunk] = dist[np.arange(len(chunk)), labels[chunk]]
+
+    def __call__(
+        self, X, sample_weight, centers, centers_new, weight_in_clusters, labels, center_shift, n_threads, update_centers
+    ):
+        if not self._initialized:
+            self._assignRows(X, np.arange(X.shape[0]), centers, labels)
+            self._initialized = True
+        elif centers.shape[0] > 1:
+            # half distance of each center to its closest other center
+            half = euclidean_distances(centers) / 2
+            np.fill_diagonal(half, np.inf)
+            s = half.min(axis=1)
+
+            bound = np.maximum(s[labels], self._lower_bounds)
+            candidates = np.flatnonzero(self._upper_bounds > bound)
+            if len(candidates) > 0:
+                # tighten the upper bound, then compute all distances only for the remaining points
+                self._upper_bounds[candidates] = _rowsDistances(X, candidates, centers, labels[candidates])
+                candidates = candidates[self._upper_bounds[candidates] > bound[candidates]]
+                self._assignRows(X, candidates, centers, labels)
+
+        if update_centers:
+            _updateCenters(X, sample_weight, labels, centers, centers_new, weight_in_clusters)
+            center_shift[:] = row_norms(centers_new - centers, squared=False)
+
+            # move the bounds according to the centers shift
+            self._upper_bounds += center_shift[labels]
+            if centers.shape[0] > 1:
+                top = np.argmax(center_shift)
+                m1 = center_shift[top]
+                m2 = np.max(np.delete(center_shift, top))
+                self._lower_bounds -= np.where(labels == top, m2, m1).astype(self._lower_bounds.dtype)
+
+
+def _multiRunLloydIter(X, sample_weight, centers, centers_new, weight_in_clusters, labels, center_shift, update_centers):
+    """Lloyd iteration of many runs (same number of clusters) with a single chunked pass over X.
+    Each parameter after sample_weight is a list with an element per run, with the same meaning of the sklearn
+    Lloyd kernel parameters. The centers of all runs are stacked, so that each chunk of X is read once
+    and the distances to the centers of every run are computed with a single matrix product.
+    Runs with update_centers[r] False only get their labels assigned. Empty clusters are relocated to the points
+    farthest from their centers, as in the sklearn Lloyd kernel.
+    The single product pays off on high-dimensional data (about 100 features or more) with few clusters, where it
+    is faster than the small products of the runs taken one at a time. Otherwise the assignment dominates, and the
+    sklearn kernel, which fuses it with the distances, is faster run by run."""
+    n_runs = len(centers)
+    n_samples = X.shape[0]
+    n_clusters = centers[0].shape[0]
+
+    C = np.vstack(centers)
+    C_squared_norms = row_norms(C, squared=True)
+    C_minus2_T = np.ascontiguousarray(-2 * C.T)
+    offsets = np.arange(n_runs) * n_clusters
+    sums = np.zeros(C.shape, dtype=np.float64)
+    weights = np.zeros(C.shape[0], dtype=np.float64)
+    anyUpdate = any(update_centers)
+
+    chunk_size = max(256, _MULTI_RUN_CHUNK_ELEMENTS // C.shape[0])
+    for start in range(0, n_samples, chunk_size):
+        Xc = X[start : start + chunk_size]
+        n_chunk = Xc.shape[0]
+        # squared distances up to the constant ||x||^2, which does not change the argmin
+        D = safe_sparse_dot(Xc, C_minus2_T, dense_output=True)
+        D += C_squared_norms
+        L = D.reshape(n_chunk, n_runs, n_clusters).argmin(axis=2)
+        # a single transposition, then a contiguous copy for each run
+        runsLabels = L.T.astype(np.int32)
+        for r in range(n_runs):
+            labels[r][start : start + n_chunk] = runsLabels[r]
+
+        if anyUpdate:
+            # one-hot matrix of the stacked labels (run offset + label), a column of n_runs entries for each point:
+            # a single sparse product gives the sums of the points of every cluster of every run
+            L += offsets
+            w = np.repeat(sample_weight[start : start + n_chunk], n_runs)
+            indptr = np.arange(0, n_runs * n_chunk + 1, n_runs)
+            W = sp.csc_matrix((w, L.ravel(), indptr), shape=(C.shape[0], n_chunk))
+            s = W @ Xc
+            sums += s.toarray() if sp.issparse(s) else s
+            weights += np.bincount(L.ravel(), weights=w, minlength=C.shape[0])
+
+    for r in range(n_runs):
+        if not update_centers[r]:
+            continue
+        run = slice(offsets[r], offsets[r] + n_clusters)
+        weight_in_clusters[r][:] = weights[run]
+        centers_new[r][:] = sums[run]
+        # the relocation works on the sums of the clusters, before they are averaged
+        if sp.issparse(X):
+            _relocate_empty_clusters_sparse(
+                X.data, X.indices, X.indptr, sample_weight, centers[r], centers_new[r], weight_in_clusters[r], labels[r]
+            )
+        else:
+            _relocate_empty_clusters_dense(
+                X, sample_weight, centers[r], centers_new[r], weight_in_clusters[r], labels[r]
+            )
+        nonEmpty = weight_in_clusters[r] > 0
+        centers_new[r][nonEmpty] /= weight_in_clusters[r][nonEmpty, None]
+        center_shift[r][:] = row_norms(centers_new[r] - centers[r], squared=False)
+
+
+class _OutOfCoreLloydIter:
+    """Lloyd iteration engine for out-of-core data: the chunks of X are streamed once per iteration.
+    Each chunk is assigned by the sklearn Lloyd kernel, and the cluster sums are accumulated over the chunks."""
+
+    def __init__(self, X, n_clusters):
+        n_features = X.shape[1]
+        self._sums = np.zeros((n_clusters, n_features), dtype=np.float64)
+        # unused outputs of the kernel, which only assigns the labels
+        self._centers_new = np.zeros((n_clusters, n_features), dtype=np.float64)
+        self._weight_in_clusters = np.zeros(n_clusters, dtype=np.float64)
+        self._center_shift = np.zeros(n_clusters, dtype=np.float64)
+
+    def __call__(
+        self, X, sample_weight, centers, centers_new, weight_in_clusters, labels, center_shift, n_threads, update_centers
+    ):
+        n_clusters = centers.shape[0]
+        self._sums[:] = 0
+        weight_in_clusters[:] = 0
+        for start, end, Xc in X.chunks():
+            chunkLabels = np.empty(end - start, dtype=np.int32)
+            chunkWeight = np.ascontiguousarray(sample_weight[start:end])
+            lloyd_iter_chunked_dense(
+                Xc,
+                chunkWeight,
+                centers,
+                self._centers_new,
+                self._weight_in_clusters,
+                chunkLabels,
+                self._center_shift,
+                n_threads,
+                update_centers=False,
+            )
+            labels[start:end] = chunkLabels
+            if update_centers:
+                W = sp.csr_matrix((chunkWeight, (chunkLabels, np.arange(end - start))), shape=(n_clusters, end - start))
+                self._sums += W @ Xc
+                weight_in_clusters += np.bincount(chunkLabels, weights=chunkWeight, minlength=n_clusters)
+
+        if update_centers:
+            nonEmpty = weight_in_clusters > 0
+            centers_new[nonEmpty] = self._sums[nonEmpty] / weight_in_clusters[nonEmpty, None]
+            centers_new[~nonEmpty] = centers[~nonEmpty]
+            center_shift[:] = row_norms(centers_new - centers, squared=False)
+
+
+def _miniBatchStep(
+    X, sample_weight, batch, centers, centers_new, weight_sums, random_state, random_reassign, reassignment_ratio, n_threads
+):
+    """Mini-batch step on the rows X[batch]. Code edited from sklearn 1.3.0 (_mini_batch_step).
+    Returns the labels of the batch and the inertia of the batch, computed before the centers update.
+    Centers with very low accumulated weight are moved to random batch points if random_reassign is True."""
+    Xb = X[batch]
+    sample_weight_b = sample_weight[batch]
+    labels, inertia = _labels_inertia(Xb, sample_weight_b, centers, n_threads=n_threads)
+
+    if sp.issparse(Xb):
+        _minibatch_update_sparse(Xb, sample_weight_b, centers, centers_new, weight_sums, labels, n_threads)
+    else:
+        _minibatch_update_dense(Xb, sample_weight_b, centers, centers_new, weight_sums, labels, n_threads)
+
+    if random_reassign and reassignment_ratio > 0:
+        to_reassign = weight_sums < reassignment_ratio * weight_sums.max()
+
+        # pick at most .5 * batch_size samples as new centers
+        if to_reassign.sum() > 0.5 * Xb.shape[0]:
+            indices_dont_reassign = np.argsort(weight_sums)[int(0.5 * Xb.shape[0]) :]
+            to_reassign[indices_dont_reassign] = False
+        n_reassigns = to_reassign.sum()
+
+        if n_reassigns > 0:
+            new_centers = random_state.choice(Xb.shape[0], replace=False, size=n_reassigns)
+            if sp.issparse(Xb):
+                centers_new[to_reassign] = Xb[new_centers].toarray()
+            else:
+                centers_new[to_reassign] = Xb[new_centers]
+            # reset counts of reassigned centers, but don't reset them too small to avoid instant reassignment
+            weight_sums[to_reassign] = np.min(weight_sums[~to_reassign])
+
+    return labels, inertia
+
+
+def _getIterFn(algorithm, X, n_clusters):
+    """Returns the iteration engine for the given algorithm name."""
+    if _isOutOfCore(X):
+        if algorithm != "lloyd":
+            raise ValueError(f"The algorithm '{algorithm}' does not support out-of-core data, use 'lloyd'.")
+        return _OutOfCoreLloydIter(X, n_clusters)
+    if algorithm == "lloyd":
+        return lloyd_iter_chunked_sparse if sp.issparse(X) else lloyd_iter_chunked_dense
+    elif algorithm == "elkan":
+        return _ElkanIter(X, n_clusters)
+    elif algorithm == "hamerly":
+        return _HamerlyIter(X, n_clusters)
+    raise ValueError(f"The algorithm '{algorithm}' does not exist.")
@@ -1,9 +1,10 @@
+import os
 import time
 from abc import ABC
 from multiprocessing import Process, Queue
+from queue import Empty
 
 import numpy as np
-from sklearn.metrics.pairwise import euclidean_distances
 from sklearn.utils._param_validation import (
     Integral,
     Interval,
@@ -14,11 +15,18 @@ from sklearn.utils._param_validation import (
 
 from pek.termination.earlyTermination import EarlyTerminationAction
 
-from ..metrics.comparison import _toComparisonMetricDict
-from ..metrics.progression import _toProgressionMetricDict
-from ..metrics.validation import _toValidationMetricDict
+from ..metrics.comparison import (
+    _BATCHED_COMPARISON_METRICS,
+    _pairwiseComparison,
+    _toComparisonMetricDict,
+)
+from ..metrics.progression import _StabilityTracker, _toProgressionMetricDict
+from ..metrics.validation import (
+    _STATISTICS_VALIDATION_METRICS,
+    _toValidationMetricDict,
+)
 from ..termination.earlyTermination import _check_et_list
-from ..utils.clustering import adjustLabels  # , best_labels_dtype
+from ..utils.clustering import adjustPartitions, alignCentroids, best_labels_dtype
 from ..utils.params import checkInstance
 from ..utils.process import (
     ProcessControlMessage,
@@ -26,6 +34,12 @@ from ..utils.process import (
     ProcessStatus,
 )
 from ..utils.random import get_random_state
+from .background import _BackgroundMetrics
+from .checkpoint import _loadCheckpoint, _saveCheckpoint
+from .delta import _DeltaEncoder
+from .engines import ALL_ALGORITHMS
+from .executors import ALL_EXECUTORS, _checkBatched, _getExecutor
+from .outofcore import _checkOutOfCoreMetrics
 from .results import (
     EnsemblePartialResult,
     EnsemblePartialResultEarlyTermination,
@@ -33,49 +47,37 @@ from .results import (
     EnsemblePartialResultMetrics,
     EnsemblePartialResultRunsStatus,
     MetricGroup,
+    ProcessErrorResult,
 )
 from .run import ProgressiveKMeans
+from .scheduling import _MetricsScheduler
+from .seeding import ALL_INITS
+from .shared import SharedData, _readOnlyView
+from .snapshots import _SnapshotBuffer
 
 
 def _adjustCentroids_fn(runs):
     """Adjust initial centroids to minimize difference of labeling among runs.
-    The first centroid of run1 must be the closest centroid to the first centroid of run0.
-    Run0 is the one that guides the assignments. Complexity: r^2 * k"""
-    A = runs[0]._centers  # centroids of run[0]
-    B = [
-        runs[j]._centers for j in range(1, len(runs))
-    ]  # list of centroids for each remaining run. B[j] = centroids of run [j+1]
-
-    assigned = [[None for z in range(len(A))] for j in range(len(B))]
-
-    for i in range(len(A)):
-        for j in range(len(B)):
-            dist = euclidean_distances(
-                B[j], [A[i]]
-            ).flatten()  # distances for each centroids in B[j] to centroid A[i], array 1D
-            candidates = np.argsort(dist)
-            for z in candidates:
-                if assigned[j][z] is None:
-                    assigned[j][z] = i
-                    break
-
-    for j in range(len(B)):
-        newCenters = np.empty_like(B[j])
-        for z in range(len(newCenters)):
-            t = assigned[j][z]
-            newCenters[z] = B[j][t]
-
-        i = j + 1
-        runs[i]._centers = newCenters
+    The centroids of each run are reordered to be optimally aligned to the centroids of run0 (see alignCentroids).
+    Run0 is the one that guides the assignments. Complexity: r * k^3"""
+    if len(runs) < 2:
+        return
+    perms = alignCentroids(runs[0]._centers, np.stack([r._centers for r in runs[1:]]))
+    for r, perm in zip(runs[1:], perms):
+        r._centers = r._centers[perm]
 
 
 class _AbstractProgressiveEnsembleKMeans(ABC):
     @validate_params(
         {
-            "X": ["array-like", "sparse matrix"],
+            "X": [SharedData, "array-like", "sparse matrix"],
             "n_clusters": [Interval(Integral, 1, None, closed="left")],
             "n_runs": [Interval(Integral, 1, None, closed="left")],
-            "init": [StrOptions({"k-means++", "random"})],
+            "init": [StrOptions(set(ALL_INITS))],
+            "algorithm": [StrOptions(set(ALL_ALGORITHMS))],
+            "batch_size": [None, Interval(Integral, 1, None, closed="left")],
+            "reassignment_ratio": [Interval(Real, 0, None, closed="left")],
+            "full_assignment_freq": [None, Interval(Integral, 1, None, closed="left")],
             "max_iter": [Interval(Integral, 1, None, closed="left")],
             "tol": [Interval(Real, 0, None, closed="left")],
             "random_state": ["random_state"],
@@ -89,6 +91,18 @@ class _AbstractProgressiveEnsembleKMeans(ABC):
             # "partitionsProgressionMetrics": [None, str, "array-like"],
             "adjustCentroids": [bool],
             "adjustLabels": [bool],
+            "batched": [bool],
+            "executor": [StrOptions(set(ALL_EXECUTORS))],
+            "n_jobs": [None, Interval(Integral, 1, None, closed="left")],
+            "asynchronous": [bool],
+            "checkpointPath": [None, str, os.PathLike],
+            "checkpointFreq": [None, Interval(Real, 0, None, closed="left")],
+            "delta": [bool],
+            "keyframeFreq": [Interval(Integral, 1, None, closed="left")],
+            "metricsCadence": [None, dict],
+            "metricsBudget": [None, Interval(Real, 0, None, closed="left")],
+            "metricsExecutor": [StrOptions(set(ALL_EXECUTORS))],
+            "metricsSampleSize": [None, Interval(Integral, 1, None, closed="left")],
         },
         prefer_skip_nested_validation=True,
     )
@@ -98,6 +112,10 @@ class _AbstractProgressiveEnsembleKMeans(ABC):
         n_clusters=2,
         n_runs=4,
         init="k-means++",
+        algorithm="lloyd",
+        batch_size=None,
+        reassignment_ratio=0.01,
+        full_assignment_freq=10,
         max_iter=300,
         tol=1e-4,
         random_state=None,
@@ -109,30 +127,63 @@ class _AbstractProgressiveEnsembleKMeans(ABC):
         partitionsValidationMetrics=None,
         partitionsComparisonMetrics=None,
         partitionsProgressionMetrics=None,
+        metricsCadence=None,
+        metricsBudget=None,
+        metricsExecutor="serial",
+        metricsSampleSize=None,
         adjustCentroids=True,
         adjustLabels=True,
+        batched=False,
+        executor="serial",
+        n_jobs=None,
+        asynchronous=False,
+        checkpointPath=None,
+        checkpointFreq=None,
+        delta=False,
+        keyframeFreq=50,
         taskId=None,
     ):
-        self._X = X
+        self._data = SharedData.wrap(X)
+        self._X = self._data.X
         self._n_clusters = n_clusters
         self._n_runs = n_runs
         self._init = init
+        self._algorithm = algorithm
+        self._batch_size = batch_size
+        self._reassignment_ratio = reassignment_ratio
+        self._full_assignment_freq = full_assignment_freq
         self._max_iter = max_iter
         self._tol = tol
         self._random_state = get_random_state(random_state)
         self._freq = freq
         self._ets = _check_et_list(ets)
         self._metricsCalculator = _EnsembleMetricsCalculator(
-            X,
+            self._X,
             labelsValidationMetrics=labelsValidationMetrics,
             labelsComparisonMetrics=labelsComparisonMetrics,
             labelsProgressionMetrics=labelsProgressionMetrics,
             partitionsValidationMetrics=partitionsValidationMetrics,
             partitionsComparisonMetrics=partitionsComparisonMetrics,
             partitionsProgressionMetrics=partitionsProgressionMetrics,
+            metricsCadence=metricsCadence,
+            metricsBudget=metricsBudget,
+            metricsSampleSize=metricsSampleSize,
+            random_state=self._random_state,
         )
+        self._metricsExecutor = metricsExecutor
+        self._backgroundMetrics = None  # created at the first iteration
         self._adjustCentroids = adjustCentroids
         self._adjustLabels = adjustLabels
+        _checkBatched(executor, batched)
+        self._batched = batched
+        self._executorName = executor
+        self._shared = None  # the data in shared memory, created for the first worker process
+        self._n_jobs = n_jobs
+        self._asynchronous = asynchronous
+        self._checkpointPath = checkpointPath
+        self._checkpointFreq = checkpointFreq
+        self._lastCheckpointTimestamp = time.time()
+        self._deltaEncoder = _DeltaEncoder(keyframeFreq) if delta else None
         self._taskId = taskId
 
 
@@ -143,6 +194,10 @@ class ProgressiveEnsembleKMeans(_AbstractProgressiveEnsembleKMeans):
         n_clusters=2,
         n_runs=4,
         init="k-means++",
+        algorithm="lloyd",
+        batch_size=None,
+        reassignment_ratio=0.01,
+        full_assignment_freq=10,
         max_iter=300,
         tol=1e-4,
         random_state=None,
@@ -154,8 +209,20 @@ class ProgressiveEnsembleKMeans(_AbstractProgressiveEnsembleKMeans):
         partitionsValidationMetrics=None,
         partitionsComparisonMetrics=None,
         partitionsProgressionMetrics=None,
+        metricsCadence=None,
+        metricsBudget=None,
+        metricsExecutor="serial",
+        metricsSampleSize=None,
         adjustCentroids=True,
         adjustLabels=True,
+        batched=False,
+        executor="serial",
+        n_jobs=None,
+        asynchronous=False,
+        checkpointPath=None,
+        checkpointFreq=None,
+        delta=False,
+        keyframeFreq=50,
         taskId=None,
     ):
         super().__init__(
@@ -163,6 +230,10 @@ class ProgressiveEnsembleKMeans(_AbstractProgressiveEnsembleKMeans):
             n_clusters=n_clusters,
             n_runs=n_runs,
             init=init,
+            algorithm=algorithm,
+            batch_size=batch_size,
+            reassignment_ratio=reassignment_ratio,
+            full_assignment_freq=full_assignment_freq,
             max_iter=max_iter,
             tol=tol,
             random_state=random_state,
@@ -174,8 +245,20 @@ class ProgressiveEnsembleKMeans(_AbstractProgressiveEnsembleKMeans):
             partitionsValidationMetrics=partitionsValidationMetrics,
             partitionsComparisonMetrics=partitionsComparisonMetrics,
             partitionsProgressionMetrics=partitionsProgressionMetrics,
+            metricsCadence=metricsCadence,
+            metricsBudget=metricsBudget,
+            metricsExecutor=metricsExecutor,
+            metricsSampleSize=metricsSampleSize,
             adjustCentroids=adjustCentroids,
             adjustLabels=adjustLabels,
+            batched=batched,
+            executor=executor,
+            n_jobs=n_jobs,
+            asynchronous=asynchronous,
+            checkpointPath=checkpointPath,
+            checkpointFreq=checkpointFreq,
+            delta=delta,
+            keyframeFreq=keyframeFreq,
             taskId=taskId,
         )
 
@@ -187,15 +270,23 @@ class ProgressiveEnsembleKMeans(_AbstractProgressiveEnsembleKMeans):
         self._prevResultCentroids = None
         self._prevResultTimestamp = 0.0
 
+        # the k-means|| pool of candidates is computed once, with the seed of the ensemble, and shared by the runs
+        if self._init == "k-means||":
+            self._data.candidates(self._n_clusters, self._random_state)
+
         # create run objects
         for seed in np.random.default_rng(self._random_state).integers(0, np.iinfo(np.int32).max, size=self._n_runs):
             r = ProgressiveKMeans(
-                self._X,
+                self._data,
                 n_clusters=self._n_clusters,
                 max_iter=self._max_iter,
                 tol=self._tol,
                 random_state=seed,
                 init=self._init,
+                algorithm=self._algorithm,
+                batch_size=self._batch_size,
+                reassignment_ratio=self._reassignment_ratio,
+                full_assignment_freq=self._full_assignment_freq,
             )
             self._runs.append(r)
 
@@ -205,7 +296,14 @@ class ProgressiveEnsembleKMeans(_AbstractProgressiveEnsembleKMeans):
         if self._adjustCentroids:
             _adjustCentroids_fn(self._runs)
 
-        self._partitions = np.zeros((self._n_runs, self._X.shape[0]), dtype=int)
+        # the executor (threads, worker processes) is created by the process that computes the iterations,
+        # at the first iteration (see _runsExecutor)
+        self._executor = None
+
+        # the partial results expose read-only snapshots of the partitions, copied only if still in use when modified
+        self._partitions = _SnapshotBuffer(
+            self._data.labelsBuffer, (self._n_runs, self._X.shape[0]), best_labels_dtype(self._n_clusters)
+        )
         self._centroids = np.zeros((self._n_clusters, self._X.shape[1], self._n_runs), dtype=float)
         self._runsLastPartialResultInfo = [None for _ in range(self._n_runs)]
         self._runsLastPartialResultMetrics = [None for _ in range(self._n_runs)]
@@ -213,6 +311,9 @@ class ProgressiveEnsembleKMeans(_AbstractProgressiveEnsembleKMeans):
         self._runsCompleted = [False for _ in range(self._n_runs)]
         self._runsKilled = [False for _ in range(self._n_runs)]
         self._runsInertia = [np.inf for _ in range(self._n_runs)]
+        # fingerprints of the partitions, changed at each iteration of the run (the metrics are not affected by
+        # the relabeling, they are invariant to permutations of the labels)
+        self._partitionsVersion = [0 for _ in range(self._n_runs)]
 
         self._disabledEts = [False for _ in self._ets]
 
@@ -222,33 +323,32 @@ class ProgressiveEnsembleKMeans(_AbstractProgressiveEnsembleKMeans):
 
         # compute an iteration of each run
         iterationCost = 0
-        for i in range(self._n_runs):
-            if self._runs[i].hasNextIteration():
-                iterationCost += 1
-                rp = self._runs[i].executeNextIteration()
-                self._partitions[i, :] = rp.labels
-                self._centroids[:, :, i] = rp.centroids
-                self._runsLastPartialResultInfo[i] = rp.info
-                self._runsLastPartialResultMetrics[i] = rp.metrics
-                self._runsCompleted[i] = rp.info.isLast
-                self._runsInertia[i] = rp.metrics.inertia
-                self._runsIteration[i] = rp.info.iteration
+        partitions = self._partitions.writable()
+        for i, rp in self._executeRunsNextIteration().items():
+            iterationCost += rp.info.iteration - (-1 if self._runsIteration[i] is None else self._runsIteration[i])
+            partitions[i, :] = rp.labels
+            self._centroids[:, :, i] = rp.centroids
+            self._runsLastPartialResultInfo[i] = rp.info
+            self._runsLastPartialResultMetrics[i] = rp.metrics
+            self._runsCompleted[i] = rp.info.isLast
+            self._runsInertia[i] = rp.metrics.inertia
+            self._runsIteration[i] = rp.info.iteration
+            self._partitionsVersion[i] += 1
 
         self._iteration += 1
-        self._completed = np.all([not self._runs[j].hasNextIteration() for j in range(self._n_runs)])
+        self._completed = np.all([not self._executor.hasNextIteration(j) for j in range(self._n_runs)])
 
         # choose the champion
         bestRunIndex = int(np.argmin(self._runsInertia))
-        bestCentroids = self._centroids[:, :, bestRunIndex]
-        bestLabels = self._partitions[bestRunIndex, :]
-        bestInertia = float(self._runsInertia[bestRunIndex])
-
-        # minimize label changing
+        # minimize label changing: the labels (and centroids) of all the runs are made consistent
+        # with the previous result
         if self._adjustLabels and self._prevResultCentroids is not None:
-            for i in range(self._n_runs):
-                self._partitions[i, :] = adjustLabels(self._partitions[i, :], bestCentroids, self._prevResultCentroids)
-                # self._partitions[bestRunIndex, :] = adjustLabels(bestLabels, bestCentroids, self._prevResultCentroids)
-            bestLabels = self._partitions[bestRunIndex, :]
+            adjustPartitions(partitions, self._centroids.transpose(2, 0, 1), self._prevResultCentroids)
+
+        partitions = self._partitions.snapshot()
+        bestCentroids = _readOnlyView(self._centroids[:, :, bestRunIndex].copy())
+        bestLabels = partitions[bestRunIndex, :]
+        bestInertia = float(self._runsInertia[bestRunIndex])
 
         # create the partial result (info)
         last = not self.hasNextIteration()
@@ -272,17 +372,30 @@ class ProgressiveEnsembleKMeans(_AbstractProgressiveEnsembleKMeans):
         )
 
         # create the partial result (metrics)
-        metrics = self._metricsCalculator.getMetrics(bestRunIndex, self._runsInertia, self._centroids, self._partitions)
+        fingerprints = [(i, v) for i, v in enumerate(self._partitionsVersion)]
+        # the arguments are not modified by the next iterations, the metrics can be computed in background
+        args = (bestRunIndex, list(self._runsInertia), self._centroids.copy(), partitions, fingerprints)
+        checkedByEts = not all(self._disabledEts)
+        if self._metricsExecutor == "serial" or last or checkedByEts:
+            # the early terminators check the metrics of the partial result, and the last one carries its own:
+            # they are computed now, after the ones pending in background
+            self._closeBackgroundMetrics()
+            metrics = self._metricsCalculator.getMetrics(*args, last=last, iteration=self._iteration)
+        else:
+            if self._backgroundMetrics is None:
+                shared = self._sharedData() if self._metricsExecutor == "processes" else None
+                self._backgroundMetrics = _BackgroundMetrics(self._metricsCalculator, shared, self._metricsExecutor)
+            metrics = self._backgroundMetrics.submit(self._iteration, args)
 
         # create the partial result
         ensemblePartialResult = EnsemblePartialResult(
             info=ensemblePartialResultInfo,
             metrics=metrics,
-            centroids=bestCentroids,
-            labels=bestLabels,
-            partitions=self._partitions,
             runsStatus=runsStatus,
             taskId=self._taskId,
+            labels=bestLabels,
+            partitions=partitions,
+            centroids=bestCentroids,
         )
 
         # manage the early termination
@@ -300,20 +413,70 @@ class ProgressiveEnsembleKMeans(_AbstractProgressiveEnsembleKMeans):
                 ensemblePartialResult._setEarlyTermination(et.name, True)
                 ensemblePartialResult.info.last = True
                 self.kill()
+        if ensemblePartialResult.info.last and not last:
+            # killed by an early terminator: the metrics not computed in this iteration are computed as well
+            last = True
+            ensemblePartialResult.metrics = self._metricsCalculator.getMetrics(
+                *args, last=last, iteration=self._iteration
+            )
 
-        # manage results frequency
+        # in delta mode the arrays are encoded as changes w.r.t. the previous partial result
+        if self._deltaEncoder is not None:
+            keyframe, arrays = self._deltaEncoder.encode(
+                {"labels": bestLabels, "partitions": partitions, "centroids": bestCentroids}, keyframe=last
+            )
+            ensemblePartialResult.update(keyframe=keyframe, **arrays)
+
+        # manage results frequency (in asynchronous mode the runs already used the time until the deadline)
         currentTimestamp = time.time()
         elapsedFromPrevPartialResult = currentTimestamp - self._prevResultTimestamp
-        if (self._freq is not None) and (elapsedFromPrevPartialResult < self._freq):
+        if (not self._asynchronous) and (self._freq is not None) and (elapsedFromPrevPartialResult < self._freq):
             time.sleep(self._freq - elapsedFromPrevPartialResult)
 
+        if not self.hasNextIteration():
+            self._closeExecutor()
+            self._closeBackgroundMetrics()
+
         # update previous result
         self._prevResultCentroids = bestCentroids
         self._prevResultTimestamp = time.time()
 
+        self._autoCheckpoint()
+
         # return the current partial result
         return ensemblePartialResult
 
+    def _executeRunsNextIteration(self):
+        """Executes the next iteration of each active run. Returns a dict {runIndex: RunPartialResult}.
+        In asynchronous mode, the runs advance independently until freq seconds are elapsed from the previous
+        partial result, and the dict contains the latest result of the runs that advanced."""
+        executor = self._runsExecutor()
+        active = [i for i in range(self._n_runs) if executor.hasNextIteration(i)]
+        if self._asynchronous:
+            deadline = self._prevResultTimestamp + (0 if self._freq is None else self._freq)
+            return executor.executeUntil(active, deadline)
+        return executor.executeNextIterations(active)
+
+    def _runsExecutor(self):
+        """Returns the executor of the runs, created at the first call. The executor is not created in __init__,
+        because the ensemble can be created in a process and iterated in another one (ProgressiveEnsembleKMeansProcess),
+        and the threads or worker processes of an executor can be used and stopped only by the process starting them.
+        """
+        if self._executor is None:
+            executor = self._executorName if self.hasNextIteration() else "serial"
+            shared = self._sharedData() if executor == "processes" else None
+            self._executor = _getExecutor(
+                executor, self._runs, n_jobs=self._n_jobs, batched=self._batched, shared=shared
+            )
+            for i in range(self._n_runs):
+                if self._runsKilled[i]:
+                    self._executor.kill(i)
+        return self._executor
+
+    def _closeExecutor(self):
+        if self._executor is not None:
+            self._executor.close()
+
     def hasNextIteration(self) -> bool:
         return not self._completed and not self._killed
 
@@ -328,10 +491,107 @@ class ProgressiveEnsembleKMeans(_AbstractProgressiveEnsembleKMeans):
 
     def kill(self):
         self._killed = True
+        self._closeExecutor()
+        self._closeBackgroundMetrics()
 
     def killRun(self, run):
         self._runsKilled[run] = True
-        self._runs[run].kill()
+        if self._executor is not None:
+            self._executor.kill(run)
+
+    def checkpoint(self, path):
+        """Saves the state of the ensemble in path: centroids and labels of the runs, iteration counters,
+        early terminators, metric histories and random states. The dataset is not saved."""
+        _saveCheckpoint(self, path, self._data)
+        self._lastCheckpointTimestamp = time.time()
+
+    def resume(self, path):
+        """Restores the state saved in path by checkpoint. The ensemble must be created on the same dataset.
+        The taskId, the auto-checkpoint parameters and the delta mode of this ensemble are kept.
+        In delta mode, the next partial result is a keyframe."""
+        loaded = _loadCheckpoint(path, type(self), self._data)
+        self._closeExecutor()
+        self._closeBackgroundMetrics()
+        for key in ["_taskId", "_checkpointPath", "_checkpointFreq", "_lastCheckpointTimestamp", "_deltaEncoder"]:
+            setattr(loaded, key, getattr(self, key))
+        self.__dict__.update(loaded.__dict__)
+        if self._deltaEncoder is not None:
+            self._deltaEncoder.reset()
+
+    def _autoCheckpoint(self):
+        """Saves a checkpoint in checkpointPath after each partial result, or after checkpointFreq seconds."""
+        if self._checkpointPath is None:
+            return
+        elapsed = time.time() - self._lastCheckpointTimestamp
+        if self._checkpointFreq is None or elapsed >= self._checkpointFreq or not self.hasNextIteration():
+            self.checkpoint(self._checkpointPath)
+
+    def _sharedData(self):
+        """Returns the data in shared memory, created once and sent to all the worker processes (of the runs and of
+        the background metrics), so that X is copied in shared memory only once."""
+        if self._shared is None:
+            self._shared = self._data.share()
+        return self._shared
+
+    def _closeBackgroundMetrics(self):
+        """Waits for the metrics computed in background and stops the worker, the calculator is updated."""
+        if self._backgroundMetrics is not None:
+            self._backgroundMetrics.close()
+            self._metricsCalculator = self._backgroundMetrics.calculator()
+            self._backgroundMetrics = None
+
+    def __getstate__(self):
+        # the runs are taken from the executor (they can live in worker processes), X from the SharedData,
+        # the metrics calculator from the background worker (after its pending iterations)
+        state = self.__dict__.copy()
+        if self._executor is not None:
+            state["_runs"] = self._executor.runs()
+        if self._backgroundMetrics is not None:
+            state["_metricsCalculator"] = self._backgroundMetrics.calculator()
+        state["_backgroundMetrics"] = None
+        state["_executor"] = None
+        state["_shared"] = None
+        del state["_X"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._X = self._data.X
+        self._metricsCalculator._X = self._X
+
+
+def _metricsSample(n_samples, sampleSize, random_state):
+    """Sorted indices of the fixed sample of the entries the metrics are computed on (the same at each
+    iteration), None for all the entries."""
+    if sampleSize is None or sampleSize >= n_samples:
+        return None
+    return np.sort(np.random.default_rng(random_state).choice(n_samples, sampleSize, replace=False))
+
+
+class _MetricsCache:
+    """Values of the metrics, keyed on the metric name and the fingerprints of the partitions they are computed on.
+    The entries not used in an iteration are dropped at the beginning of the next one."""
+
+    def __init__(self):
+        self._values = {}
+        self._used = set()
+
+    def get(self, key, metricFunction, *args):
+        """Returns the cached value for key, or computes it as metricFunction(*args)."""
+        if key not in self._values:
+            self._values[key] = metricFunction(*args)
+        self._used.add(key)
+        return self._values[key]
+
+    def missing(self, key):
+        return key not in self._values
+
+    def put(self, key, value):
+        self._values[key] = value
+
+    def nextIteration(self):
+        self._values = {key: value for key, value in self._values.items() if key in self._used}
+        self._used = set()
 
 
 class _EnsembleMetricsCalculator:
@@ -344,8 +604,15 @@ class _EnsembleMetricsCalculator:
         partitionsValidationMetrics=None,
         partitionsComparisonMetrics=None,
         partitionsProgressionMetrics=None,
+        metricsCadence=None,
+        metricsBudget=None,
+        metricsSampleSize=None,
+        random_state=None,
     ):
         self._X = X
+        self._sample = _metricsSample(X.shape[0], metricsSampleSize, random_state)
+        self._sampleSize = X.shape[0] if self._sample is None else len(self._sample)
+        self._XSample = None  # rows of the sample, read at the first use
         self._labelsValidationMetrics = _toValidationMetricDict(labelsValidationMetrics)
         self._labelsComparisonMetrics = _toComparisonMetricDict(labelsComparisonMetrics)
         self._labelsProgressionMetrics = _toProgressionMetricDict(labelsProgressionMetrics)
@@ -353,34 +620,138 @@ class _EnsembleMetricsCalculator:
         self._partitionsValidationMetrics = _toValidationMetricDict(partitionsValidationMetrics)
         self._partitionsComparisonMetrics = _toComparisonMetricDict(partitionsComparisonMetrics)
         self._partitionsProgressionMetrics = _toProgressionMetricDict(partitionsProgressionMetrics)
+        if self._sample is None:
+            _checkOutOfCoreMetrics(X, self._labelsValidationMetrics, self._partitionsValidationMetrics)
+        self._validationMetricNames = sorted({*self._labelsValidationMetrics, *self._partitionsValidationMetrics})
 
+        self._metricsIteration = None  # iteration of the last computed metrics
+        self._bestLabels = None
+        self._bestFingerprint = None
         self._bestLabelsPrev = None
-        self._labelsHistory = []
-        self._partitionsHistory = []
-
-    def getMetrics(self, bestRunIndex, runsInertia, centroids, partitions) -> EnsemblePartialResultMetrics:
+        self._bestFingerprintPrev = None
+        self._labelsStability = _StabilityTracker(self._labelsProgressionMetrics)
+        self._partitionsStability = _StabilityTracker(self._partitionsProgressionMetrics)
+        self._cache = _MetricsCache()
+        self._scheduler = _MetricsScheduler(cadence=metricsCadence, budget=metricsBudget)
+        self._lastValues = {}  # (group, metricName) -> last computed value
+
+    def getMetrics(
+        self, bestRunIndex, runsInertia, centroids, partitions, fingerprints, last=False, iteration=None
+    ) -> EnsemblePartialResultMetrics:
+        """fingerprints[i] identifies the partition i: the validation and comparison metrics of the partitions
+        with the same fingerprints as in the previous iteration are taken from the cache.
+        The metrics not scheduled in this iteration keep their last value (see staleness). If last, all
+        the metrics are computed. iteration is the iteration of the ensemble the metrics refer to: the metrics
+        of the same iteration can be requested again, e.g. with last when it turns out to be the last, and only
+        the ones not computed yet are computed.
+        With a metrics sample, the validation and comparison metrics are computed on the entries of the sample."""
+        again = iteration is not None and iteration == self._metricsIteration
+        self._metricsIteration = iteration
+        args = (bestRunIndex, runsInertia, centroids, partitions, fingerprints)
+        sampledArgs = args
+        if self._sample is not None:
+            sampledArgs = (bestRunIndex, runsInertia, centroids, partitions[:, self._sample], fingerprints)
+        if not again:
+            self._cache.nextIteration()
+            self._updateHistories(bestRunIndex, partitions, sampledArgs[3], fingerprints)
+        self._scheduler.plan(self._metricSizes(partitions.shape[0]), last=last, again=again)
+        groups = {
+            "labelsValidationMetrics": self._compute_labelsValidationMetrics(*sampledArgs),
+            "labelsComparisonMetrics": self._compute_labelsComparisonMetrics(*sampledArgs),
+            "labelsProgressionMetrics": self._compute_labelsProgressionMetrics(*args),
+            "partitionsValidationMetrics": self._compute_partitionsValidationMetrics(*sampledArgs),
+            "partitionsComparisonMetrics": self._compute_partitionsComparisonMetrics(*sampledArgs),
+            "partitionsProgressionMetrics": self._compute_partitionsProgressionMetrics(*args),
+        }
+        staleness = MetricGroup(
+            **{
+                group: MetricGroup(**{name: self._scheduler.staleness((group, name)) for name in metrics.keys()})
+                for group, metrics in self._scheduledMetrics().items()
+            }
+        )
         return EnsemblePartialResultMetrics(
-            labelsValidationMetrics=self._compute_labelsValidationMetrics(
-                bestRunIndex, runsInertia, centroids, partitions
-            ),
-            labelsComparisonMetrics=self._compute_labelsComparisonMetrics(
-                bestRunIndex, runsInertia, centroids, partitions
-            ),
-            labelsProgressionMetrics=self._compute_labelsProgressionMetrics(
-                bestRunIndex, runsInertia, centroids, partitions
-            ),
-            partitionsValidationMetrics=self._compute_partitionsValidationMetrics(
-                bestRunIndex, runsInertia, centroids, partitions
-            ),
-            partitionsComparisonMetrics=self._compute_partitionsComparisonMetrics(
-                bestRunIndex, runsInertia, centroids, partitions
-            ),
-            partitionsProgressionMetrics=self._compute_partitionsProgressionMetrics(
-                bestRunIndex, runsInertia, centroids, partitions
-            ),
+            **groups, staleness=staleness, iteration=iteration, sampleSize=self._sampleSize
+        )
+
+    def _updateHistories(self, bestRunIndex, partitions, sampledPartitions, fingerprints):
+        """Adds the labels of a new iteration to the previous labels of the comparison metrics and to the histories
+        of the progression metrics."""
+        if len(self._labelsComparisonMetrics) > 0:
+            # private copy of the row: a view would keep the snapshot of the partitions alive, and the whole
+            # partitions buffer would be copied at the next iteration. The buffer of the previous labels is reused
+            bestLabels = sampledPartitions[bestRunIndex, :]
+            self._bestLabelsPrev, self._bestLabels = self._bestLabels, self._bestLabelsPrev
+            self._bestFingerprintPrev, self._bestFingerprint = self._bestFingerprint, fingerprints[bestRunIndex]
+            if self._bestLabels is None or self._bestLabels.shape != bestLabels.shape:
+                self._bestLabels = np.empty(bestLabels.shape, dtype=bestLabels.dtype)
+            np.copyto(self._bestLabels, bestLabels)
+        if len(self._labelsProgressionMetrics) > 0:
+            self._labelsStability.update(partitions[bestRunIndex : bestRunIndex + 1, :])
+        if len(self._partitionsProgressionMetrics) > 0:
+            self._partitionsStability.update(partitions)
+
+    def __getstate__(self):
+        # X is bound again by the owner (ensemble, or background worker), the rows of the sample are read again
+        state = self.__dict__.copy()
+        state["_X"] = None
+        state["_XSample"] = None
+        return state
+
+    def _metricsX(self):
+        """Data the validation metrics are computed on: X, or the rows of the metrics sample."""
+        if self._sample is None:
+            return self._X
+        if self._XSample is None:
+            self._XSample = self._X[self._sample]
+        return self._XSample
+
+    def _scheduledMetrics(self):
+        """Dict {group: metrics} of the metrics handled by the scheduler (the inertia is always up to date)."""
+        return {
+            "labelsValidationMetrics": {k: v for k, v in self._labelsValidationMetrics.items() if k != "inertia"},
+            "labelsComparisonMetrics": self._labelsComparisonMetrics,
+            "labelsProgressionMetrics": self._labelsProgressionMetrics,
+            "partitionsValidationMetrics": {
+                k: v for k, v in self._partitionsValidationMetrics.items() if k != "inertia"
+            },
+            "partitionsComparisonMetrics": self._partitionsComparisonMetrics,
+            "partitionsProgressionMetrics": self._partitionsProgressionMetrics,
+        }
+
+    def _metricSizes(self, n_runs):
+        """Dict {(group, metricName): number of partitions or pairs of partitions the metric is computed on}."""
+        sizes = {
+            "labelsValidationMetrics": 1,
+            "labelsComparisonMetrics": 1,
+            "labelsProgressionMetrics": 1,
+            "partitionsValidationMetrics": n_runs,
+            "partitionsComparisonMetrics": n_runs * (n_runs - 1) // 2,
+            "partitionsProgressionMetrics": n_runs,
+        }
+        return {(group, name): sizes[group] for group, metrics in self._scheduledMetrics().items() for name in metrics}
+
+    def _scheduled(self, group, metricName, compute):
+        """Value of the metric: compute() if the metric is scheduled in this iteration, otherwise the last value."""
+        key = (group, metricName)
+        if self._scheduler.isPlanned(key):
+            with self._scheduler.measure(key):
+                self._lastValues[key] = compute()
+        return self._lastValues.get(key)
+
+    def _validationMetric(self, metricName, metricFunction, labels, fingerprint):
+        """Value of the validation metric on the labels. The statistics of the partition are computed once and
+        shared by the metrics computed from them."""
+        key = (metricName, fingerprint)
+        if metricName not in _STATISTICS_VALIDATION_METRICS:
+            return self._cache.get(key, metricFunction, self._metricsX(), labels)
+        statisticsClass, statisticsFunction = _STATISTICS_VALIDATION_METRICS[metricName]
+        statisticsKey = (statisticsClass.__name__, fingerprint)
+        statistics = self._cache.get(
+            statisticsKey, statisticsClass, self._metricsX(), labels, self._validationMetricNames
         )
+        return self._cache.get(key, statisticsFunction, statistics)
 
-    def _compute_labelsValidationMetrics(self, bestRunIndex, runsInertia, centroids, partitions):
+    def _compute_labelsValidationMetrics(self, bestRunIndex, runsInertia, centroids, partitions, fingerprints):
         """Labels validation metrics are computed only on the current best labels."""
         bestInertia = float(runsInertia[bestRunIndex])
         bestLabels = partitions[bestRunIndex, :]
@@ -388,11 +759,16 @@ class _EnsembleMetricsCalculator:
         res = {"inertia": bestInertia}
         for metricName, metricFunction in self._labelsValidationMetrics.items():
             if metricName not in res:
-                res[metricName] = metricFunction(self._X, bestLabels)
+                key = (metricName, fingerprints[bestRunIndex])
+                res[metricName] = self._scheduled(
+                    "labelsValidationMetrics",
+                    metricName,
+                    lambda: self._validationMetric(metricName, metricFunction, bestLabels, fingerprints[bestRunIndex]),
+                )
 
         return MetricGroup(**res)
 
-    def _compute_labelsComparisonMetrics(self, bestRunIndex, runsInertia, centroids, partitions):
+    def _compute_labelsComparisonMetrics(self, bestRunIndex, runsInertia, centroids, partitions, fingerprints):
         """Labels comparison metrics are computed comparing the current best labels with the previous best labels.
         The initial iteration is Null"""
         bestLabels = partitions[bestRunIndex, :]
@@ -403,71 +779,106 @@ class _EnsembleMetricsCalculator:
                 if self._bestLabelsPrev is None:
                     res[metricName] = None
                 else:
-                    res[metricName] = metricFunction(bestLabels, self._bestLabelsPrev)
-
-        if len(self._labelsComparisonMetrics) > 0:
-            self._bestLabelsPrev = bestLabels
+                    key = (metricName, fingerprints[bestRunIndex], self._bestFingerprintPrev)
+                    res[metricName] = self._scheduled(
+                        "labelsComparisonMetrics",
+                        metricName,
+                        lambda: self._cache.get(key, metricFunction, bestLabels, self._bestLabelsPrev),
+                    )
 
         return MetricGroup(**res)
 
-    def _compute_labelsProgressionMetrics(self, bestRunIndex, runsInertia, centroids, partitions):
-        if len(self._labelsProgressionMetrics) > 0:
-            self._labelsHistory.append(partitions[bestRunIndex, :])
-
+    def _compute_labelsProgressionMetrics(self, bestRunIndex, runsInertia, centroids, partitions, fingerprints):
         res = {}
-        for metricName, metricFunction in self._labelsProgressionMetrics.items():
+        for metricName in self._labelsProgressionMetrics:
             if metricName not in res:
-                res[metricName] = metricFunction(self._labelsHistory)
+                res[metricName] = self._scheduled(
+                    "labelsProgressionMetrics", metricName, lambda: self._labelsStability.value(metricName)[0]
+                )
 
         return MetricGroup(**res)
 
-    def _compute_partitionsValidationMetrics(self, bestRunIndex, runsInertia, centroids, partitions):
+    def _compute_partitionsValidationMetrics(self, bestRunIndex, runsInertia, centroids, partitions, fingerprints):
         """Partitions validation metrics are computed on each partition.
         The result is a dictionary where each metric has an array of values, one for each partition.
         """
+
+        def compute(metricName, metricFunction):
+            values = np.empty(partitions.shape[0], dtype=float)
+            for i in range(partitions.shape[0]):
+                values[i] = self._validationMetric(metricName, metricFunction, partitions[i, :], fingerprints[i])
+            return values
+
         res = {"inertia": runsInertia}
         for metricName, metricFunction in self._partitionsValidationMetrics.items():
             if metricName not in res:
-                res[metricName] = np.empty(partitions.shape[0], dtype=float)
-                for i in range(partitions.shape[0]):
-                    res[metricName][i] = metricFunction(self._X, partitions[i, :])
+                res[metricName] = self._scheduled(
+                    "partitionsValidationMetrics", metricName, lambda: compute(metricName, metricFunction)
+                )
 
         return MetricGroup(**res)
 
-    def _compute_partitionsComparisonMetrics(self, bestRunIndex, runsInertia, centroids, partitions):
+    def _compute_partitionsComparisonMetrics(self, bestRunIndex, runsInertia, centroids, partitions, fingerprints):
         """
         Partitions comparison metrics are computed on each pair of partition.
         The result is a dictionary where each metric has a symmetric matrix RxR.
         """
         n_runs = partitions.shape[0]
+
+        def compute(metricName, metricFunction):
+            if metricName in _BATCHED_COMPARISON_METRICS:
+                self._computeBatchedComparisons(partitions, fingerprints)
+            values = np.ones((n_runs, n_runs), dtype=float)  # a partition is identical to itself
+            for i in range(n_runs):
+                for j in range(n_runs):
+                    if j >= i:
+                        continue
+                    key = (metricName, fingerprints[i], fingerprints[j])
+                    val = self._cache.get(key, metricFunction, partitions[i, :], partitions[j, :])
+                    values[i, j] = val
+                    values[j, i] = val
+            return values
+
         res = {}
         for metricName, metricFunction in self._partitionsComparisonMetrics.items():
             if metricName not in res:
-                res[metricName] = np.empty((n_runs, n_runs), dtype=float)
-
-                for i in range(n_runs):
-                    for j in range(n_runs):
-                        if j >= i:
-                            continue
-                        val = metricFunction(partitions[i, :], partitions[j, :])
-                        res[metricName][i, j] = val
-                        res[metricName][j, i] = val
+                res[metricName] = self._scheduled(
+                    "partitionsComparisonMetrics", metricName, lambda: compute(metricName, metricFunction)
+                )
 
         return MetricGroup(**res)
 
-    def _compute_partitionsProgressionMetrics(self, bestRunIndex, runsInertia, centroids, partitions):
-        if len(self._partitionsProgressionMetrics) > 0:
-            self._partitionsHistory.append(partitions)
-
+    def _computeBatchedComparisons(self, partitions, fingerprints):
+        """Computes in the cache the batched comparison metrics scheduled in this iteration, for all the pairs
+        of partitions not cached yet. The contingency tables are shared by the metrics, so the first one
+        computed takes the whole time."""
         n_runs = partitions.shape[0]
+        metricNames = [
+            metricName
+            for metricName in self._partitionsComparisonMetrics
+            if metricName in _BATCHED_COMPARISON_METRICS
+            and self._scheduler.isPlanned(("partitionsComparisonMetrics", metricName))
+        ]
+        pairs = [
+            (i, j)
+            for i in range(n_runs)
+            for j in range(i)
+            if any(self._cache.missing((m, fingerprints[i], fingerprints[j])) for m in metricNames)
+        ]
+        if len(pairs) == 0:
+            return
+        values = _pairwiseComparison(partitions, pairs, metricNames)
+        for metricName in metricNames:
+            for (i, j), value in zip(pairs, values[metricName]):
+                self._cache.put((metricName, fingerprints[i], fingerprints[j]), float(value))
+
+    def _compute_partitionsProgressionMetrics(self, bestRunIndex, runsInertia, centroids, partitions, fingerprints):
         res = {}
-        for metricName, metricFunction in self._partitionsProgressionMetrics.items():
+        for metricName in self._partitionsProgressionMetrics:
             if metricName not in res:
-                res[metricName] = [None for j in range(n_runs)]
-                for i in range(n_runs):
-                    # if len(self._partitionsHistory) > 1:
-                    hist = [p[i, :] for p in self._partitionsHistory]
-                    res[metricName][i] = metricFunction(hist)
+                res[metricName] = self._scheduled(
+                    "partitionsProgressionMetrics", metricName, lambda: self._partitionsStability.value(metricName)
+                )
 
         return MetricGroup(**res)
 
@@ -479,6 +890,10 @@ class ProgressiveEnsembleKMeansProcess(Process):
         n_clusters=2,
         n_runs=4,
         init="k-means++",
+        algorithm="lloyd",
+        batch_size=None,
+        reassignment_ratio=0.01,
+        full_assignment_freq=10,
         max_iter=300,
         tol=1e-4,
         random_state=None,
@@ -490,8 +905,20 @@ class ProgressiveEnsembleKMeansProcess(Process):
         partitionsValidationMetrics=None,
         partitionsComparisonMetrics=None,
         partitionsProgressionMetrics=None,
+        metricsCadence=None,
+        metricsBudget=None,
+        metricsExecutor="serial",
+        metricsSampleSize=None,
         adjustCentroids=True,
         adjustLabels=True,
+        batched=False,
+        executor="serial",
+        n_jobs=None,
+        asynchronous=False,
+        checkpointPath=None,
+        checkpointFreq=None,
+        delta=False,
+        keyframeFreq=50,
         taskId=None,
         verbose=False,
         resultsQueue=None,
@@ -504,6 +931,10 @@ class ProgressiveEnsembleKMeansProcess(Process):
             n_clusters=n_clusters,
             n_runs=n_runs,
             init=init,
+            algorithm=algorithm,
+            batch_size=batch_size,
+            reassignment_ratio=reassignment_ratio,
+            full_assignment_freq=full_assignment_freq,
             max_iter=max_iter,
             tol=tol,
             random_state=random_state,
@@ -515,8 +946,20 @@ class ProgressiveEnsembleKMeansProcess(Process):
             partitionsValidationMetrics=partitionsValidationMetrics,
             partitionsComparisonMetrics=partitionsComparisonMetrics,
             partitionsProgressionMetrics=partitionsProgressionMetrics,
+            metricsCadence=metricsCadence,
+            metricsBudget=metricsBudget,
+            metricsExecutor=metricsExecutor,
+            metricsSampleSize=metricsSampleSize,
             adjustCentroids=adjustCentroids,
             adjustLabels=adjustLabels,
+            batched=batched,
+            executor=executor,
+            n_jobs=n_jobs,
+            asynchronous=asynchronous,
+            checkpointPath=checkpointPath,
+            checkpointFreq=checkpointFreq,
+            delta=delta,
+            keyframeFreq=keyframeFreq,
             taskId=taskId,
         )
 
@@ -528,30 +971,61 @@ class ProgressiveEnsembleKMeansProcess(Process):
     def _waitForResume(self):
         while True:
             msg = self._controlsQueue.get(block=True)
-            if (
+            if msg.messageType == ProcessControlMessageType.CHECKPOINT:
+                self._checkpoint(msg.messageData.path)
+            elif (
                 msg.messageType == ProcessControlMessageType.RESUME
                 or msg.messageType == ProcessControlMessageType.START
             ):
+                if msg.messageData is not None:
+                    self._resume(msg.messageData.path)
                 self._status = ProcessStatus.RUNNING
                 return
 
     def _readControlMessage(self):
         try:
             msg = self._controlsQueue.get(block=False)
+        except (Empty, EOFError):
+            return
+
+        if msg.messageType == ProcessControlMessageType.PAUSE:
+            self._status = ProcessStatus.PAUSED
+            self._waitForResume()
+
+        elif msg.messageType == ProcessControlMessageType.RESUME and msg.messageData is not None:
+            self._resume(msg.messageData.path)
 
-            if msg.messageType == ProcessControlMessageType.PAUSE:
-                self._status = ProcessStatus.PAUSED
-                self._waitForResume()
+        elif msg.messageType == ProcessControlMessageType.CHECKPOINT:
+            self._checkpoint(msg.messageData.path)
 
-            elif msg.messageType == ProcessControlMessageType.KILL_RUN:
-                runId = msg.messageData.runId
-                self._ensemble.killRun(runId)
+        elif msg.messageType == ProcessControlMessageType.KILL_RUN:
+            runId = msg.messageData.runId
+            self._ensemble.killRun(runId)
 
-            elif msg.messageType == ProcessControlMessageType.KILL:
-                self._status = ProcessStatus.KILLED
-                self._ensemble.kill()
-        except:
-            pass
+        elif msg.messageType == ProcessControlMessageType.KILL:
+            self._status = ProcessStatus.KILLED
+            self._ensemble.kill()
+
+    def _checkpoint(self, path):
+        try:
+            self._ensemble.checkpoint(path)
+        except Exception as e:
+            self._reportError(ProcessControlMessageType.CHECKPOINT, path, e)
+
+    def _resume(self, path):
+        try:
+            self._ensemble.resume(path)
+        except Exception as e:
+            self._reportError(ProcessControlMessageType.RESUME, path, e)
+
+    def _reportError(self, messageType, path, error):
+        """Reports the failure of a control message on the results queue, the ensemble continues from its current
+        state. Without results queue, the error is raised."""
+        if self._resultsQueue is None:
+            raise error
+        self._resultsQueue.put(
+            ProcessErrorResult(messageType.value, path=str(path), error=repr(error), taskId=self._ensemble._taskId)
+        )
 
     def run(self):
         self._status = ProcessStatus.RUNNING
@@ -581,8 +1055,23 @@ class ProgressiveEnsembleKMeansProcess(Process):
         msg = ProcessControlMessage.PAUSE()
         self._controlsQueue.put(msg)
 
-    def resume(self):
-        msg = ProcessControlMessage.RESUME()
+    def resume(self, path=None):
+        """Resumes the paused process. If path is given, the state of the ensemble is restored from the checkpoint:
+        immediately if the process is not started, otherwise by the process before its next iteration
+        (if the checkpoint cannot be loaded, a ProcessErrorResult is put on the results queue)."""
+        if path is not None and self.pid is None:
+            self._ensemble.resume(path)
+            return
+        msg = ProcessControlMessage.RESUME(path)
+        self._controlsQueue.put(msg)
+
+    def checkpoint(self, path):
+        """Asks the process to save a checkpoint of the ensemble in path, before its next iteration.
+        If the checkpoint fails, a ProcessErrorResult is put on the results queue."""
+        if self.pid is None:
+            self._ensemble.checkpoint(path)
+            return
+        msg = ProcessControlMessage.CHECKPOINT(path)
         self._controlsQueue.put(msg)
 
     def kill(self):
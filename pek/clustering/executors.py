@@ -0,0 +1,322 @@
+"""Executors of the runs of an ensemble.
+An executor owns the runs and computes the next iteration of a subset of them (executeNextIterations),
+or advances them independently until a deadline (executeUntil, used by the asynchronous ensemble)."""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait as waitConnections
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from sklearn.utils._openmp_helpers import _openmp_effective_n_threads
+from sklearn.utils.fixes import threadpool_limits
+
+from .engines import _multiRunLloydIter
+from .run import RunPartialResult
+from .shared import _attachedArray, _toSharedMemory
+
+ALL_EXECUTORS = ["processes", "serial", "threads"]
+
+
+def _checkBatched(executor, batched):
+    """Raises ValueError if the batched iterations are requested with an executor other than 'serial'."""
+    if batched and executor != "serial":
+        raise ValueError(f"The batched iterations are supported only by the 'serial' executor, got '{executor}'.")
+
+
+def _threadsPerJob(n_jobs):
+    """Splits the OpenMP threads budget among the jobs."""
+    return max(1, _openmp_effective_n_threads() // n_jobs)
+
+
+def _defaultJobs(n_jobs, n_runs):
+    if n_jobs is None:
+        return max(1, min(n_runs, os.cpu_count() or 1))
+    return max(1, min(n_jobs, n_runs))
+
+
+class _SerialExecutor:
+    """Executes the iterations of the runs one after another, in the current process.
+    If batched, the Lloyd iterations of the runs are computed together, with a single pass over X."""
+
+    def __init__(self, runs, batched=False):
+        self._runs = runs
+        self._batched = batched
+
+    def hasNextIteration(self, run):
+        return self._runs[run].hasNextIteration()
+
+    def executeNextIterations(self, runIndices):
+        """Executes the next iteration of the given runs. Returns a dict {runIndex: RunPartialResult}."""
+        results = {}
+
+        if self._batched:
+            batchedRuns = [i for i in runIndices if self._runs[i]._nextIterationIsLloyd()]
+            if len(batchedRuns) > 1:
+                runs = [self._runs[i] for i in batchedRuns]
+                data = runs[0]._data
+                update_centers = [r._nextIterationUpdatesCenters() for r in runs]
+                with threadpool_limits(limits=runs[0]._n_threads, user_api="blas"):
+                    _multiRunLloydIter(
+                        data.X,
+                        data.sample_weight,
+                        [r._centers for r in runs],
+                        [r._centers_new for r in runs],
+                        [r._weight_in_clusters for r in runs],
+                        [r._labels for r in runs],
+                        [r._center_shift for r in runs],
+                        update_centers,
+                    )
+                for i, r, u in zip(batchedRuns, runs, update_centers):
+                    results[i] = r._completeIteration(u)
+
+        for i in runIndices:
+            if i not in results:
+                results[i] = self._runs[i].executeNextIteration()
+
+        return dict(sorted(results.items()))
+
+    def executeUntil(self, runIndices, deadline):
+        """Executes rounds of iterations of the given runs until the deadline (timestamp) is passed.
+        At least one round is executed. Returns a dict {runIndex: latest RunPartialResult}."""
+        results = {}
+        while True:
+            results.update(self.executeNextIterations(runIndices))
+            runIndices = [i for i in runIndices if self.hasNextIteration(i)]
+            if len(runIndices) == 0 or time.time() >= deadline:
+                break
+        return dict(sorted(results.items()))
+
+    def runs(self):
+        """Returns the runs, with their current state (no iteration in progress)."""
+        return self._runs
+
+    def kill(self, run):
+        self._runs[run].kill()
+
+    def close(self):
+        pass
+
+
+class _ThreadsExecutor(_SerialExecutor):
+    """Executes the iterations of the runs concurrently on a pool of threads.
+    The sklearn kernels release the GIL, the OpenMP threads budget is split among the threads."""
+
+    def __init__(self, runs, n_jobs=None):
+        super().__init__(runs)
+        n_jobs = _defaultJobs(n_jobs, len(runs))
+        for r in runs:
+            r._n_threads = _threadsPerJob(n_jobs)
+        self._pool = ThreadPoolExecutor(max_workers=n_jobs)
+        self._pending = {}  # runIndex -> future of the iteration in progress (executeUntil)
+        self._hasResult = [r._iteration is not None for r in runs]
+
+    def hasNextIteration(self, run):
+        return run in self._pending or self._runs[run].hasNextIteration()
+
+    def executeNextIterations(self, runIndices):
+        futures = {i: self._pool.submit(self._runs[i].executeNextIteration) for i in runIndices}
+        return {i: f.result() for i, f in futures.items()}
+
+    def _iterationSnapshot(self, run):
+        """Executes the next iteration of the run, and copies the labels and centroids,
+        because the run can start its next iteration before the result is consumed."""
+        rp = self._runs[run].executeNextIteration()
+        return RunPartialResult(rp.info, rp.metrics, rp.centroids.copy(), rp.labels.copy())
+
+    def executeUntil(self, runIndices, deadline):
+        """Each run executes its iterations independently, a new one as soon as the previous ends, until the deadline.
+        The iterations in progress at the deadline are not waited (unless no result or not all the runs have
+        produced a result yet), and are collected by the next call. Returns a dict {runIndex: latest RunPartialResult}.
+        """
+        for i in runIndices:
+            if i not in self._pending:
+                self._pending[i] = self._pool.submit(self._iterationSnapshot, i)
+
+        results = {}
+        while len(self._pending) > 0:
+            mustWait = len(results) == 0 or not all(self._hasResult)
+            timeout = None if mustWait else max(0.0, deadline - time.time())
+            done, _ = wait(list(self._pending.values()), timeout=timeout, return_when=FIRST_COMPLETED)
+            if len(done) == 0:
+                break
+            for i in [i for i, f in self._pending.items() if f in done]:
+                results[i] = self._pending.pop(i).result()
+                self._hasResult[i] = True
+                if time.time() < deadline and self._runs[i].hasNextIteration():
+                    self._pending[i] = self._pool.submit(self._iterationSnapshot, i)
+            if time.time() >= deadline and len(results) > 0 and all(self._hasResult):
+                break
+        return dict(sorted(results.items()))
+
+    def runs(self):
+        # the iterations in progress are completed, their results are still collected by the next executeUntil
+        wait(list(self._pending.values()))
+        return self._runs
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._pending = {}
+
+
+def _processesWorker(conn, runs, labelsBuffer, n_threads):
+    """Loop of a worker process. Owns a subset of the runs, and executes their iterations on request:
+    a single iteration ("step"), rounds of iterations until a deadline ("until"), or a copy of the runs ("runs").
+    The labels of the runs are written in the shared labels buffer, only info, metrics and centroids are sent back."""
+    name, shape, dtype = labelsBuffer
+    labels = _attachedArray(SharedMemory(name=name), shape, dtype)
+    for i, r in runs.items():
+        r._n_threads = n_threads
+        r._labels = labels[i]
+
+    while True:
+        command, runIndices, deadline = conn.recv()
+        if command == "close":
+            break
+        if command == "runs":
+            conn.send(runs)
+            continue
+        result = {}
+        while True:
+            for i in runIndices:
+                rp = runs[i].executeNextIteration()
+                result[i] = (i, rp.info, rp.metrics, rp.centroids)
+            runIndices = [i for i in runIndices if runs[i].hasNextIteration()]
+            if command == "step" or len(runIndices) == 0 or time.time() >= deadline:
+                break
+        conn.send(list(result.values()))
+    conn.close()
+
+
+class _ProcessesExecutor:
+    """Executes the iterations of the runs concurrently on worker processes.
+    The runs are distributed among the workers, X is shared through shared memory: shared is the SharedData of the
+    runs in shared memory (see SharedData.share). The labels of all the runs are written by the workers in a shared
+    (n_runs, n_samples) buffer. The OpenMP threads budget is split among the workers."""
+
+    def __init__(self, runs, shared, n_jobs=None):
+        n_runs = len(runs)
+        n_jobs = _defaultJobs(n_jobs, n_runs)
+        self._runs = runs
+
+        self._labelsShm, self._labels = _toSharedMemory(np.stack([r._labels for r in runs]))
+        labelsBuffer = (self._labelsShm.name, self._labels.shape, self._labels.dtype)
+
+        self._completed = [not r.hasNextIteration() for r in runs]
+        self._killed = [False for _ in runs]
+        self._runWorker = [i % n_jobs for i in range(n_runs)]
+        self._connections = []
+        self._workers = []
+        for j in range(n_jobs):
+            jobRuns = {}
+            for i in range(n_runs):
+                if self._runWorker[i] == j:
+                    runs[i]._data = shared
+                    runs[i].X = shared.X
+                    jobRuns[i] = runs[i]
+            parentConn, childConn = Pipe()
+            w = Process(target=_processesWorker, args=(childConn, jobRuns, labelsBuffer, _threadsPerJob(n_jobs)))
+            w.daemon = True
+            w.start()
+            self._connections.append(parentConn)
+            self._workers.append(w)
+        self._busy = [False for _ in range(n_jobs)]
+        self._hasResult = [r._iteration is not None for r in runs]
+        self._undelivered = {}  # results received out of executeUntil, returned by the next call
+        self._closed = False
+
+    def hasNextIteration(self, run):
+        return not self._completed[run] and not self._killed[run]
+
+    def _send(self, command, runIndices, deadline=None):
+        """Sends the command to the idle workers owning the runs. Returns the list of workers."""
+        requests = {}
+        for i in runIndices:
+            if not self._busy[self._runWorker[i]]:
+                requests.setdefault(self._runWorker[i], []).append(i)
+        for j, indices in requests.items():
+            self._connections[j].send((command, indices, deadline))
+            self._busy[j] = True
+        return list(requests)
+
+    def _receive(self, j, results, copyLabels=False):
+        """Receives the results of the worker j (now idle). The labels are views of the shared buffer, valid until the
+        worker resumes: copyLabels for the results delivered after that."""
+        for i, info, metrics, centroids in self._connections[j].recv():
+            labels = self._labels[i].copy() if copyLabels else self._labels[i]
+            results[i] = RunPartialResult(info, metrics, centroids, labels)
+            self._completed[i] = info.isLast
+            self._hasResult[i] = True
+        self._busy[j] = False
+
+    def executeNextIterations(self, runIndices):
+        results, self._undelivered = self._undelivered, {}
+        for j in self._send("step", runIndices):
+            self._receive(j, results)
+        return dict(sorted(results.items()))
+
+    def executeUntil(self, runIndices, deadline):
+        """Each worker executes rounds of iterations of its runs until the deadline. The workers still busy at the
+        deadline are not waited (unless no result or not all the runs have produced a result yet), their results are
+        collected by the next call. The labels of a run are read only when its worker is idle.
+        Returns a dict {runIndex: latest RunPartialResult}."""
+        self._send("until", runIndices, deadline)
+
+        results, self._undelivered = self._undelivered, {}
+        while any(self._busy):
+            mustWait = len(results) == 0 or not all(self._hasResult)
+            timeout = None if mustWait else max(0.0, deadline - time.time())
+            busy = [self._connections[j] for j in range(len(self._connections)) if self._busy[j]]
+            ready = waitConnections(busy, timeout=timeout)
+            if len(ready) == 0:
+                break
+            for conn in ready:
+                self._receive(self._connections.index(conn), results)
+            if time.time() >= deadline and len(results) > 0 and all(self._hasResult):
+                break
+        return dict(sorted(results.items()))
+
+    def runs(self):
+        """Returns a copy of the runs, received from the workers (after the end of the iterations in progress).
+        After close, returns the runs received at closing time."""
+        if self._closed:
+            return self._runs
+        for j in range(len(self._connections)):
+            if self._busy[j]:
+                # returned by the next executeNextIterations or executeUntil, after the workers resume
+                self._receive(j, self._undelivered, copyLabels=True)
+        runs = {}
+        for conn in self._connections:
+            conn.send(("runs", None, None))
+        for conn in self._connections:
+            runs.update(conn.recv())
+        return [runs[i] for i in range(len(runs))]
+
+    def kill(self, run):
+        self._killed[run] = True
+
+    def close(self):
+        if self._closed:
+            return
+        self._runs = self.runs()
+        self._closed = True
+        for conn in self._connections:
+            conn.send(("close", None, None))
+        for w in self._workers:
+            w.join()
+        self._labelsShm.unlink()
+
+
+def _getExecutor(executor, runs, n_jobs=None, batched=False, shared=None):
+    """Returns the executor of the runs given its name. shared is the SharedData of the runs in shared memory,
+    for the 'processes' executor. Only the 'serial' executor computes the batched iterations."""
+    _checkBatched(executor, batched)
+    if executor == "serial":
+        return _SerialExecutor(runs, batched=batched)
+    elif executor == "threads":
+        return _ThreadsExecutor(runs, n_jobs=n_jobs)
+    elif executor == "processes":
+        return _ProcessesExecutor(runs, shared, n_jobs=n_jobs)
+    raise ValueError(f"The executor '{executor}' does not exist.")
@@ -0,0 +1,82 @@
+import tempfile
+
+import numpy as np
+
+"""Out-of-core data of the progressive k-means.
+The dataset stays on disk (HDF5) and the passes over X stream fixed-size chunks of rows,
+so that only O(chunk_size * n_features) values of X are in memory at a time."""
+
+_CHUNK_ELEMENTS = 2**23  # default number of values of X read at a time (64MB of float64)
+
+
+class _ChunkedArray:
+    """Read-only view of a 2-D HDF5 dataset (h5py.Dataset), read by chunks of rows as float64.
+    Supports the row reads needed by the engines: slices and arrays of row indices (e.g. the samples
+    of the initialization and the mini-batches)."""
+
+    def __init__(self, dataset, chunk_size=None):
+        if dataset.ndim != 2:
+            raise ValueError(f"Expected a 2D dataset, got a dataset of shape {dataset.shape}.")
+        self._dataset = dataset
+        if chunk_size is None:
+            chunk_size = max(1, _CHUNK_ELEMENTS // max(1, dataset.shape[1]))
+            # multiple of the rows of the HDF5 chunks, so that each chunk is decompressed once
+            if dataset.chunks is not None:
+                chunk_size = max(dataset.chunks[0], chunk_size - chunk_size % dataset.chunks[0])
+        self.chunk_size = int(chunk_size)
+
+    @property
+    def shape(self):
+        return self._dataset.shape
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float64)
+
+    def chunks(self):
+        """Yields (start, end, X[start:end]) for consecutive chunks of rows."""
+        for start in range(0, self.shape[0], self.chunk_size):
+            end = min(start + self.chunk_size, self.shape[0])
+            yield start, end, self[start:end]
+
+    def __getitem__(self, rows):
+        if isinstance(rows, slice):
+            return np.ascontiguousarray(self._dataset[rows], dtype=np.float64)
+        # HDF5 reads need increasing indices without duplicates
+        rows = np.asarray(rows)
+        unique, inverse = np.unique(rows, return_inverse=True)
+        return np.ascontiguousarray(self._dataset[unique], dtype=np.float64)[inverse]
+
+    def __len__(self):
+        return self.shape[0]
+
+
+def _isOutOfCore(X):
+    return isinstance(X, _ChunkedArray)
+
+
+def _diskBuffer(shape, dtype):
+    """Zero-filled array backed by an anonymous temporary file, removed when the array is garbage collected."""
+    with tempfile.TemporaryFile() as f:
+        # the memory map keeps the (already unlinked) file alive after closing it
+        return np.memmap(f, dtype=dtype, mode="w+", shape=shape)
+
+
+# validation metrics that do not need X in memory: the inertia, and the sampled silhouette, which reads the rows
+# of its samples
+_OUT_OF_CORE_METRICS = {"inertia", "sampled_silhouette", "sampled_silhouette_low", "sampled_silhouette_high"}
+
+
+def _checkOutOfCoreMetrics(X, *validationMetrics):
+    """Raises ValueError if validation metrics not in _OUT_OF_CORE_METRICS are requested on out-of-core data."""
+    if not _isOutOfCore(X):
+        return
+    unsupported = sorted(
+        {name for metrics in validationMetrics for name in metrics if name not in _OUT_OF_CORE_METRICS}
+    )
+    if len(unsupported) > 0:
+        raise ValueError(f"The validation metrics {unsupported} do not support out-of-core data.")
@@ -0,0 +1,62 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from sklearn.utils.fixes import threadpool_limits
+
+from .ensemble import ProgressiveEnsembleKMeans
+from .executors import _threadsPerJob
+
+"""Parallel computation of the k of the elbow.
+The ensemble of each k runs to completion in a worker process, which attaches the dataset through shared memory,
+so that several k are computed at once. The last partial result of each ensemble is sent back to the elbow,
+which emits the elbow partial results in completion order. The ensembles in the workers are not checkpointed:
+the k not completed yet are computed again after a resume."""
+
+ALL_ELBOW_EXECUTORS = ["processes", "serial"]
+
+_workerData = None
+
+
+def _initElbowWorker(data, n_threads):
+    global _workerData
+    _workerData = data
+    # the OpenMP and BLAS threads budget is split among the workers
+    threadpool_limits(limits=n_threads)
+
+
+def _workerRunEnsemble(params):
+    return ProgressiveEnsembleKMeans(_workerData, **params).executeAllIterations()
+
+
+class _ParallelElbow:
+    """Computes the ensembles of the k of the elbow with a pool of n_jobs worker processes.
+    data is the SharedData of the elbow, shared with the workers."""
+
+    def __init__(self, data, n_jobs, n_tasks):
+        if n_jobs is None:
+            n_jobs = max(1, min(n_tasks, os.cpu_count() or 1))
+        self._pool = ProcessPoolExecutor(
+            max_workers=n_jobs, initializer=_initElbowWorker, initargs=(data.share(), _threadsPerJob(n_jobs))
+        )
+        self._futures = {}  # k -> future of the last partial result of its ensemble
+
+    def submit(self, k, params):
+        """Submits the ensemble of k, params are the arguments of ProgressiveEnsembleKMeans. No-op if already
+        submitted."""
+        if k not in self._futures:
+            self._futures[k] = self._pool.submit(_workerRunEnsemble, params)
+
+    def nextCompleted(self):
+        """Waits for the first completed ensemble. Returns its k and its last partial result.
+        Among the ensembles completed at the same time, the first submitted is returned."""
+        done, _ = wait(self._futures.values(), return_when=FIRST_COMPLETED)
+        k = next(k for k, future in self._futures.items() if future in done)
+        return k, self._futures.pop(k).result()
+
+    def close(self):
+        """Stops the workers, the ensembles not completed are discarded."""
+        processes = list((self._pool._processes or {}).values())
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        for p in processes:  # the running ensembles are not waited for
+            p.terminate()
+        self._futures = {}
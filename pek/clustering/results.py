@@ -16,7 +16,15 @@ class _Result(Bunch):
 
 class EnsemblePartialResult(_Result):
     def __init__(
-        self, info=None, metrics=None, centroids=None, labels=None, partitions=None, runsStatus=None, taskId=None
+        self,
+        info=None,
+        metrics=None,
+        centroids=None,
+        labels=None,
+        partitions=None,
+        runsStatus=None,
+        taskId=None,
+        keyframe=True,
     ):
         super().__init__(
             info=checkInstance(info, EnsemblePartialResultInfo, "info"),
@@ -27,6 +35,7 @@ class EnsemblePartialResult(_Result):
             partitions=partitions,
             runsStatus=checkInstance(runsStatus, EnsemblePartialResultRunsStatus, "runsStatus"),
             taskId=taskId,
+            keyframe=keyframe,
         )
 
     def _setEarlyTermination(self, name, boolean):
@@ -65,6 +74,9 @@ class EnsemblePartialResultMetrics(_Result):
         partitionsValidationMetrics=None,
         partitionsComparisonMetrics=None,
         partitionsProgressionMetrics=None,
+        staleness=None,
+        iteration=None,
+        sampleSize=None,
     ):
         super().__init__(
             labelsValidationMetrics=checkInstance(labelsValidationMetrics, MetricGroup, "labelsValidationMetrics"),
@@ -79,6 +91,9 @@ class EnsemblePartialResultMetrics(_Result):
             partitionsProgressionMetrics=checkInstance(
                 partitionsProgressionMetrics, MetricGroup, "partitionsProgressionMetrics"
             ),
+            staleness=checkInstance(staleness, MetricGroup, "staleness", allowsNone=True),
+            iteration=iteration,
+            sampleSize=sampleSize,
         )
 
 
@@ -87,6 +102,23 @@ class EnsemblePartialResultEarlyTermination(_Result):
         super().__init__(**kwargs)
 
 
+class ProcessErrorResult(_Result):
+    """Failure of a control message of a task process (checkpoint, resume), sent on the results queue of the process
+    in place of a partial result. messageType is the value of the ProcessControlMessageType, error the description
+    of the exception."""
+
+    def __init__(self, messageType, path=None, error=None, taskId=None):
+        super().__init__(messageType=messageType, path=path, error=error, taskId=taskId)
+
+
+class ArrayDelta(_Result):
+    """Changes of an array in a delta-encoded partial result: the flat indices of the changed elements
+    and their new values."""
+
+    def __init__(self, indices=None, values=None):
+        super().__init__(indices=indices, values=values)
+
+
 ########################################################################################################################
 ########################################################################################################################
 ########################################################################################################################
@@ -94,12 +126,13 @@ class EnsemblePartialResultEarlyTermination(_Result):
 
 
 class ElbowPartialResult(_Result):
-    def __init__(self, info=None, metrics=None, labels=None, taskId=None):
+    def __init__(self, info=None, metrics=None, labels=None, taskId=None, keyframe=True):
         super().__init__(
             info=checkInstance(info, ElbowPartialResultInfo, "info"),
             metrics=checkInstance(metrics, ElbowPartialResultMetrics, "metrics"),
             labels=labels,
             taskId=taskId,
+            keyframe=keyframe,
         )
 
 
@@ -122,6 +155,7 @@ class ElbowPartialResultMetrics(_Result):
         labelsValidationMetrics=None,
         partitionsValidationMetrics=None,
         partitionsComparisonMetrics=None,
+        sampleSize=None,
     ):
         super().__init__(
             labelsValidationMetrics=checkInstance(labelsValidationMetrics, MetricGroup, "labelsValidationMetrics"),
@@ -131,4 +165,5 @@ class ElbowPartialResultMetrics(_Result):
             partitionsComparisonMetrics=checkInstance(
                 partitionsComparisonMetrics, MetricGroup, "partitionsComparisonMetrics"
             ),
+            sampleSize=sampleSize,
         )
@@ -1,12 +1,11 @@
 import warnings
 
 import numpy as np
-import scipy.sparse as sp
 from sklearn.cluster._k_means_lloyd import (
     lloyd_iter_chunked_dense,
     lloyd_iter_chunked_sparse,
 )
-from sklearn.cluster._kmeans import _BaseKMeans, _tolerance
+from sklearn.cluster._kmeans import _BaseKMeans
 from sklearn.utils import Bunch, check_random_state
 from sklearn.utils._openmp_helpers import _openmp_effective_n_threads
 from sklearn.utils._param_validation import (
@@ -16,11 +15,16 @@ from sklearn.utils._param_validation import (
     StrOptions,
     validate_params,
 )
-from sklearn.utils.extmath import row_norms
 from sklearn.utils.fixes import threadpool_limits
-from sklearn.utils.validation import _check_sample_weight
 
-from ..metrics.validation import inertia as inertia_fn
+from .engines import (
+    ALL_ALGORITHMS,
+    _getIterFn,
+    _LabelsInertia,
+    _miniBatchStep,
+)
+from .seeding import ALL_INITS, _seedsFromCandidates
+from .shared import SharedData
 
 # from ..utils.clustering import best_labels_dtype
 
@@ -54,14 +58,15 @@ def _composePartialResult(iteration, completed, inertia, centroids, labels):
 
 
 class ProgressiveKMeans(_BaseKMeans):
-    """Progressive KMeans Algorithm. Using Lloyd Algorithm.\n
+    """Progressive KMeans Algorithm. Using Lloyd, Elkan or Hamerly Algorithm.\n
     Code edited from scikit-learn 1.3.0\n
     https://github.com/scikit-learn/scikit-learn/blob/main/sklearn/cluster/_kmeans.py
 
     Parameters
     ----------
-    X : {ndarray, sparse matrix} of shape (n_samples, n_features)
+    X : {ndarray, sparse matrix, SharedData} of shape (n_samples, n_features)
         The observations to cluster. If sparse matrix, must be in CSR format.
+        Pass a SharedData to share the validated data among many runs without copies.
 
     n_clusters : int, default=4
         The number of clusters to form as well as the number of
@@ -83,21 +88,60 @@ class ProgressiveKMeans(_BaseKMeans):
         an int to make the randomness deterministic.
         See :term:`Glossary <random_state>`.
 
-    init : {'k-means++', 'random'}, Method for initialization, default=k-means++
+    init : {'k-means++', 'k-means||', 'random'}, Method for initialization, default=k-means++
+        'k-means||' draws the seeds from a pool of candidates oversampled in a few passes over X.
+        The pool is cached in the SharedData, so the runs sharing it pay for the passes only once.
+
+    algorithm : {'lloyd', 'elkan', 'hamerly'}, default=lloyd
+        Iteration engine. 'elkan' and 'hamerly' keep per-point bounds across the progressive
+        iterations to skip most distance computations when few labels change.
+        'elkan' needs n_samples x n_clusters extra memory, 'hamerly' only 2 x n_samples.
+        Ignored in mini-batch mode, where full assignments always use 'lloyd'.
+
+    batch_size : int or None, default=None
+        If not None, enables the mini-batch mode: each iteration performs mini-batch steps
+        of `batch_size` random samples instead of a full pass over X, and the initial centroids
+        are computed on a random subset of 3 * batch_size samples.
+
+    reassignment_ratio : float, default=0.01
+        Mini-batch mode only. Centers with an accumulated weight lower than this fraction
+        of the maximum are moved to random samples of the batch. 0 disables the reassignment.
+
+    full_assignment_freq : int or None, default=10
+        Mini-batch mode only. Number of mini-batch steps per iteration, after which all
+        samples are assigned to the centers, so that each partial result has exact labels and inertia.
+        If None, each iteration is a single mini-batch step that only refreshes the labels of the batch,
+        and the inertia is estimated from the batches.
     """
 
     @validate_params(
         {
-            "X": ["array-like", "sparse matrix"],
+            "X": [SharedData, "array-like", "sparse matrix"],
             "n_clusters": [Interval(Integral, 1, None, closed="left")],
             "max_iter": [Interval(Integral, 1, None, closed="left")],
             "tol": [Interval(Real, 0, None, closed="left")],
             "random_state": ["random_state"],
-            "init": [StrOptions({"k-means++", "random"})],
+            "init": [StrOptions(set(ALL_INITS))],
+            "algorithm": [StrOptions(set(ALL_ALGORITHMS))],
+            "batch_size": [None, Interval(Integral, 1, None, closed="left")],
+            "reassignment_ratio": [Interval(Real, 0, None, closed="left")],
+            "full_assignment_freq": [None, Interval(Integral, 1, None, closed="left")],
         },
         prefer_skip_nested_validation=True,
     )
-    def __init__(self, X, n_clusters=4, max_iter=300, tol=1e-4, random_state=None, init="k-means++"):
+    def __init__(
+        self,
+        X,
+        n_clusters=4,
+        max_iter=300,
+        tol=1e-4,
+        random_state=None,
+        init="k-means++",
+        algorithm="lloyd",
+        batch_size=None,
+        reassignment_ratio=0.01,
+        full_assignment_freq=10,
+    ):
         super().__init__(
             n_clusters=n_clusters,
             init=init,
@@ -108,32 +152,40 @@ class ProgressiveKMeans(_BaseKMeans):
             random_state=random_state,
         )
 
-        self.X = self._validate_data(
-            X, accept_sparse="csr", dtype=[np.float64, np.float32], order="C", copy=True, accept_large_sparse=False
-        )
+        self._data = SharedData.wrap(X)
+        self.X = self._data.X
+        self.n_features_in_ = self.X.shape[1]
 
         random_state = check_random_state(self.random_state)
-        x_squared_norms = row_norms(self.X, squared=True)
-        centers_init = self._init_centroids(
-            self.X,
-            x_squared_norms=x_squared_norms,
-            init=init,
-            random_state=random_state,
-            sample_weight=np.ones(self.X.shape[0], dtype=np.uint8),
-        )
-
-        if sp.issparse(X):
-            self._iter_fn = lloyd_iter_chunked_sparse
-            # self._inertia_fn = _inertia_sparse
+        if init == "k-means||":
+            candidates, weights = self._data.candidates(n_clusters, random_state)
+            centers_init = _seedsFromCandidates(candidates, weights, n_clusters, random_state)
         else:
-            self._iter_fn = lloyd_iter_chunked_dense
-            # self._inertia_fn = _inertia_dense
+            initX, initNorms, init_size = self.X, self._data.x_squared_norms, self._initSize(batch_size)
+            if self._data.outOfCore:
+                # the initialization reads a random sample of the rows in memory
+                rows = np.sort(random_state.choice(self.X.shape[0], size=min(self.X.shape[0], init_size), replace=False))
+                initX, initNorms, init_size = self.X[rows], initNorms[rows], None
+            centers_init = self._init_centroids(
+                initX,
+                x_squared_norms=initNorms,
+                init=init,
+                random_state=random_state,
+                sample_weight=np.ones(initX.shape[0], dtype=np.uint8),
+                init_size=init_size,
+            )
+
+        self._iter_fn = _getIterFn("lloyd" if batch_size is not None else algorithm, self.X, n_clusters)
 
         self.n_clusters = n_clusters
         self.max_iter = max_iter
-        self.tol = _tolerance(X, tol)
+        self.tol = self._data.tolerance(tol)
         self.random_state = random_state
         self.init = init
+        self.algorithm = algorithm
+        self.batch_size = batch_size
+        self.reassignment_ratio = reassignment_ratio
+        self.full_assignment_freq = full_assignment_freq
 
         self._killed = False
         self._completed = False
@@ -146,11 +198,30 @@ class ProgressiveKMeans(_BaseKMeans):
         # Buffers to avoid new allocations at each iteration.
         self._centers = centers_init
         self._centers_new = np.zeros_like(self._centers)
-        self._labels = np.full(self.X.shape[0], -1, dtype=np.int32)
-        self._labels_old = self._labels.copy()
-        self._weight_in_clusters = np.zeros(n_clusters, dtype=X.dtype)
-        self._center_shift = np.zeros(n_clusters, dtype=X.dtype)
-        self._sample_weight = _check_sample_weight(None, X, dtype=X.dtype)
+        self._labels = self._data.labelsBuffer(self.X.shape[0])
+        self._labels[:] = -1
+        self._labels_old = self._data.labelsBuffer(self.X.shape[0])
+        self._labels_old[:] = self._labels
+        self._weight_in_clusters = np.zeros(n_clusters, dtype=self.X.dtype)
+        self._center_shift = np.zeros(n_clusters, dtype=self.X.dtype)
+        self._sample_weight = self._data.sample_weight
+        self._labelsInertia = _LabelsInertia(n_clusters, self.X.shape[1], self._data.labelsBuffer(self.X.shape[0]))
+
+        # Mini-batch state.
+        self._weight_sums = np.zeros(n_clusters, dtype=self.X.dtype)
+        self._n_since_last_reassign = 0
+        self._ewa_inertia = None
+        self._ewa_inertia_min = None
+        self._no_improvement = 0
+
+    def _initSize(self, batch_size):
+        """Number of random samples used to compute the initial centroids (None for all the samples).
+        In mini-batch mode 3 * batch_size as in sklearn, in out-of-core mode (at most) the samples of a chunk."""
+        if batch_size is not None:
+            return max(3 * batch_size, self.n_clusters)
+        if self._data.outOfCore:
+            return max(3 * self.n_clusters, self.X.chunk_size)
+        return None
 
     def _warn_mkl_vcomp(self, n_active_threads):  # copied fron sklearn
         """Warn when vcomp and mkl are both present"""
@@ -161,31 +232,109 @@ class ProgressiveKMeans(_BaseKMeans):
             f" variable OMP_NUM_THREADS={n_active_threads}."
         )
 
+    def _nextIterationUpdatesCenters(self):
+        """Tells whether the next iteration updates the centers (True) or only assigns the labels (False).
+        The first iteration and the final one, after convergence, only assign the labels."""
+        return not (self._iteration is None or self._iteration == self.max_iter or self._converged)
+
+    def _nextIterationIsLloyd(self):
+        """Tells whether the next iteration is a plain Lloyd step, that can be computed outside of the run
+        (e.g. by a kernel shared among the runs of an ensemble) and then completed with _completeIteration."""
+        if self._iter_fn not in (lloyd_iter_chunked_dense, lloyd_iter_chunked_sparse):
+            return False
+        return self.batch_size is None or not self._nextIterationUpdatesCenters()
+
     def _executeNextIteration(self):
         if self._completed:
             raise RuntimeError("No next iteration to execute.")
 
-        if self._iteration is None:
-            with threadpool_limits(limits=1, user_api="blas"):
-                self._iter_fn(
+        update_centers = self._nextIterationUpdatesCenters()
+
+        if update_centers and self.batch_size is not None:
+            return self._executeNextMiniBatchIteration()
+
+        # Threadpoolctl context to limit the number of threads in second level of
+        # nested parallelism (i.e. BLAS) to avoid oversubscription.
+        with threadpool_limits(limits=1, user_api="blas"):
+            self._iter_fn(
+                self.X,
+                self._sample_weight,
+                self._centers,
+                self._centers_new,
+                self._weight_in_clusters,
+                self._labels,
+                self._center_shift,
+                self._n_threads,
+                update_centers=update_centers,
+            )
+            return self._completeIteration(update_centers)
+
+    def _completeIteration(self, update_centers):
+        """Computes inertia and convergence, and returns the partial result of an iteration whose labels
+        (and centers_new, weight_in_clusters, center_shift if update_centers) have already been computed."""
+        if not update_centers:
+            first = self._iteration is None
+            self._iteration = 0 if first else self._iteration + 1
+            inertia = self._labelsInertia(self.X, self._sample_weight, self._labels, self._centers)
+            self._completed = not first
+            return _composePartialResult(self._iteration, self._completed, inertia, self._centers, self._labels)
+
+        self._iteration += 1
+        inertia = self._labelsInertia(self.X, self._sample_weight, self._labels, self._centers)
+        self._centers, self._centers_new = self._centers_new, self._centers
+
+        if np.array_equal(self._labels, self._labels_old):
+            # First check the labels for strict convergence.
+            self._convergedStrict = True
+            self._converged = True
+            self._completed = True
+        else:
+            # No strict convergence, check for tol based convergence.
+            center_shift_tot = (self._center_shift**2).sum()
+            if center_shift_tot <= self.tol:
+                self._converged = True
+
+        self._labels_old[:] = self._labels
+
+        return _composePartialResult(self._iteration, self._completed, inertia, self._centers, self._labels)
+
+    def _executeNextMiniBatchIteration(self):
+        n_samples = self.X.shape[0]
+        batch_size = min(self.batch_size, n_samples)
+        n_steps = 1 if self.full_assignment_freq is None else self.full_assignment_freq
+        centers_prev = self._centers.copy()
+
+        with threadpool_limits(limits=1, user_api="blas"):
+            for _ in range(n_steps):
+                batch = self.random_state.randint(0, n_samples, batch_size)
+
+                # the random reassignment is done as in sklearn, after 10 * n_clusters samples
+                self._n_since_last_reassign += batch_size
+                random_reassign = self._n_since_last_reassign > 10 * self.n_clusters
+                if random_reassign:
+                    self._n_since_last_reassign = 0
+
+                batchLabels, batchInertia = _miniBatchStep(
                     self.X,
                     self._sample_weight,
+                    batch,
                     self._centers,
                     self._centers_new,
-                    self._weight_in_clusters,
-                    self._labels,
-                    self._center_shift,
+                    self._weight_sums,
+                    self.random_state,
+                    random_reassign,
+                    self.reassignment_ratio,
                     self._n_threads,
-                    update_centers=False,
                 )
-                self._iteration = 0
-                # inertia = self._inertia_fn(self.X, self._sample_weight, self._centers, self._labels, self._n_threads)
-                inertia = inertia_fn(self.X, self._labels)
-                self._completed = False
-                return _composePartialResult(self._iteration, self._completed, inertia, self._centers, self._labels)
-
-        if self._iteration == self.max_iter or self._converged:
-            with threadpool_limits(limits=1, user_api="blas"):
+                self._labels[batch] = batchLabels
+                self._centers, self._centers_new = self._centers_new, self._centers
+                self._updateEwaInertia(batchInertia / batch_size, batch_size)
+
+            self._iteration += 1
+
+            if self.full_assignment_freq is None:
+                inertia = float(self._ewa_inertia * n_samples)
+            else:
                 self._iter_fn(
                     self.X,
                     self._sample_weight,
@@ -197,45 +346,34 @@ class ProgressiveKMeans(_BaseKMeans):
                     self._n_threads,
                     update_centers=False,
                 )
-                self._iteration += 1
-                # inertia = self._inertia_fn(self.X, self._sample_weight, self._centers, self._labels, self._n_threads)
-                inertia = inertia_fn(self.X, self._labels)
-                self._completed = True
-                return _composePartialResult(self._iteration, self._completed, inertia, self._centers, self._labels)
+                inertia = self._labelsInertia(self.X, self._sample_weight, self._labels, self._centers)
 
-        # Threadpoolctl context to limit the number of threads in second level of
-        # nested parallelism (i.e. BLAS) to avoid oversubscription.
-        with threadpool_limits(limits=1, user_api="blas"):
-            self._iter_fn(
-                self.X,
-                self._sample_weight,
-                self._centers,
-                self._centers_new,
-                self._weight_in_clusters,
-                self._labels,
-                self._center_shift,
-                self._n_threads,
-                update_centers=True,
-            )
-            self._iteration += 1
-            # inertia = self._inertia_fn(self.X, self._sample_weight, self._centers, self._labels, self._n_threads)
-            inertia = inertia_fn(self.X, self._labels)
-            self._centers, self._centers_new = self._centers_new, self._centers
+        if self.full_assignment_freq is not None and np.array_equal(self._labels, self._labels_old):
+            # Labels of two consecutive full assignments are equal.
+            self._convergedStrict = True
+            self._converged = True
+            self._completed = True
+        elif ((self._centers - centers_prev) ** 2).sum() <= self.tol or self._no_improvement >= 10:
+            # No strict convergence, check for tol based convergence and for lack of inertia improvement.
+            self._converged = True
 
-            if np.array_equal(self._labels, self._labels_old):
-                # First check the labels for strict convergence.
-                self._convergedStrict = True
-                self._converged = True
-                self._completed = True
-            else:
-                # No strict convergence, check for tol based convergence.
-                center_shift_tot = (self._center_shift**2).sum()
-                if center_shift_tot <= self.tol:
-                    self._converged = True
+        self._labels_old[:] = self._labels
 
-            self._labels_old[:] = self._labels
+        return _composePartialResult(self._iteration, self._completed, inertia, self._centers, self._labels)
 
-            return _composePartialResult(self._iteration, self._completed, inertia, self._centers, self._labels)
+    def _updateEwaInertia(self, batchInertia, batch_size):
+        """Exponentially weighted average of the batch inertia, as in sklearn MiniBatchKMeans."""
+        if self._ewa_inertia is None:
+            self._ewa_inertia = batchInertia
+        else:
+            alpha = min(batch_size * 2.0 / (self.X.shape[0] + 1), 1)
+            self._ewa_inertia = self._ewa_inertia * (1 - alpha) + batchInertia * alpha
+
+        if self._ewa_inertia_min is None or self._ewa_inertia < self._ewa_inertia_min:
+            self._no_improvement = 0
+            self._ewa_inertia_min = self._ewa_inertia
+        else:
+            self._no_improvement += 1
 
     def hasNextIteration(self) -> bool:
         return not self._completed and not self._killed
@@ -251,3 +389,22 @@ class ProgressiveKMeans(_BaseKMeans):
 
     def kill(self):
         self._killed = True
+
+    def __getstate__(self):
+        # X is restored from the SharedData, which is pickled by reference if it is in shared memory
+        state = super().__getstate__().copy()
+        del state["X"], state["_sample_weight"]
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.X = self._data.X
+        self._sample_weight = self._data.sample_weight
+        if self._data.outOfCore:
+            for key in ["_labels", "_labels_old"]:
+                buffer = self._data.labelsBuffer(self.X.shape[0])
+                buffer[:] = getattr(self, key)
+                setattr(self, key, buffer)
+            buffer = self._data.labelsBuffer(self.X.shape[0])
+            buffer[:] = self._labelsInertia.labels
+            self._labelsInertia.labels = buffer
@@ -0,0 +1,134 @@
+import time
+from contextlib import contextmanager
+from numbers import Real
+
+import numpy as np
+from sklearn.utils._param_validation import InvalidParameterError
+
+"""Scheduling of the metrics of the ensemble.
+Each requested metric of each group (e.g. ('partitionsComparisonMetrics', 'ami')) is computed when it is due
+according to its cadence (every N iterations or every T seconds, default every iteration). If a time budget is set,
+the due metrics are computed from the stalest one while their estimated duration fits in the budget; the others
+keep their last value and report its staleness. The stalest due metric is always computed, so that every metric
+is eventually refreshed, and the last partial result has all the metrics up to date.
+The durations are measured; a metric never computed is estimated from the measured ones and its relative cost."""
+
+# cost of a metric relative to a pass over X, for a single partition or pair of partitions
+_RELATIVE_COST = {
+    "calinski_harabasz": 1.0,
+    "davies_bouldin": 2.0,
+    "dunn_index": 4.0,
+    "inertia": 1.0,
+    "silhouette": 100.0,
+    "sampled_silhouette": 0.5,
+    "sampled_silhouette_low": 0.5,
+    "sampled_silhouette_high": 0.5,
+    "simplified_silhouette": 2.0,
+    "ari": 0.5,
+    "ami": 2.0,
+}
+_DEFAULT_RELATIVE_COST = 1.0
+_DURATION_SMOOTHING = 0.5  # weight of the last measure in the moving average of the durations
+
+
+def _checkCadence(cadence):
+    """Validates the cadences {metricName: {"iterations": N} or {"seconds": T}}. Returns {metricName: (unit, value)}."""
+    if cadence is None:
+        return {}
+    result = {}
+    for metricName, c in cadence.items():
+        if not isinstance(c, dict) or len(c) != 1 or next(iter(c)) not in ("iterations", "seconds"):
+            raise InvalidParameterError(
+                f"The cadence of '{metricName}' must be {{'iterations': N}} or {{'seconds': T}}. Got {c} instead."
+            )
+        unit, value = next(iter(c.items()))
+        valid = isinstance(value, Real) and not isinstance(value, bool)
+        if unit == "iterations":
+            valid = valid and value >= 1 and value == int(value)
+        else:
+            valid = valid and value >= 0
+        if not valid:
+            raise InvalidParameterError(f"Invalid cadence of '{metricName}': {c}.")
+        result[metricName] = (unit, value)
+    return result
+
+
+class _MetricsScheduler:
+    """Chooses the metrics computed at each iteration, and keeps track of their staleness.
+    The metrics are identified by keys (group, metricName)."""
+
+    def __init__(self, cadence=None, budget=None):
+        self._cadence = _checkCadence(cadence)
+        self._budget = budget
+        self._iteration = -1
+        self._lastIteration = {}  # key -> iteration of the last computation
+        self._lastTimestamp = {}  # key -> time of the last computation
+        self._durations = {}  # key -> moving average of the duration of a computation
+        self._sizes = {}  # key -> number of partitions or pairs of partitions the metric is computed on
+        self._planned = set()
+
+    def plan(self, sizes, last=False, again=False):
+        """Starts a new iteration. sizes: dict {key: number of partitions (or pairs) the metric is computed on}.
+        Returns the set of the keys to compute in this iteration. If again, the current iteration is planned again
+        instead, without the metrics already computed in it (e.g. with last, when it turns out to be the last)."""
+        if not again:
+            self._iteration += 1
+        self._sizes.update(sizes)
+        now = time.time()
+        due = [key for key in sizes if last or self._isDue(key, now)]
+        if again:
+            due = [key for key in due if self._lastIteration.get(key) != self._iteration]
+        if self._budget is not None and not last:
+            # stalest first, the metrics never computed before the others
+            due.sort(key=lambda key: self._lastIteration.get(key, -1))
+            planned, total = [], 0.0
+            for key in due:
+                cost = self._estimate(key)
+                if len(planned) == 0 or total + cost <= self._budget:
+                    planned.append(key)
+                    total += cost
+            due = planned
+        self._planned = set(due)
+        return self._planned
+
+    def isPlanned(self, key):
+        return key in self._planned
+
+    @contextmanager
+    def measure(self, key):
+        """Context of the computation of the metric key: measures its duration and marks it as up to date."""
+        start = time.perf_counter()
+        yield
+        duration = time.perf_counter() - start
+        if key in self._durations:
+            duration = (1 - _DURATION_SMOOTHING) * self._durations[key] + _DURATION_SMOOTHING * duration
+        self._durations[key] = duration
+        self._lastIteration[key] = self._iteration
+        self._lastTimestamp[key] = time.time()
+
+    def staleness(self, key):
+        """Number of iterations since the last computation of the metric (0 if up to date), None if never computed."""
+        if key not in self._lastIteration:
+            return None
+        return self._iteration - self._lastIteration[key]
+
+    def _isDue(self, key, now):
+        if key not in self._lastIteration:
+            return True
+        unit, value = self._cadence.get(key[1], ("iterations", 1))
+        if unit == "iterations":
+            return self._iteration - self._lastIteration[key] >= value
+        return now - self._lastTimestamp[key] >= value
+
+    def _relativeCost(self, key):
+        return _RELATIVE_COST.get(key[1], _DEFAULT_RELATIVE_COST) * self._sizes.get(key, 1)
+
+    def _estimate(self, key):
+        """Estimated duration of the metric: the measured one, or the relative cost times the measured time
+        per unit of cost of the other metrics. Zero if nothing was measured yet."""
+        if key in self._durations:
+            return self._durations[key]
+        if len(self._durations) == 0:
+            return 0.0
+        unitDuration = np.median([d / self._relativeCost(k) for k, d in self._durations.items()])
+        return self._relativeCost(key) * unitDuration
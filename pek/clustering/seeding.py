@@ -0,0 +1,74 @@
+import numpy as np
+from sklearn.cluster._kmeans import _kmeans_plusplus
+from sklearn.metrics import pairwise_distances_argmin_min
+from sklearn.utils.extmath import row_norms
+
+from .outofcore import _isOutOfCore
+
+"""Initialization of the progressive k-means.
+k-means|| (Bahmani et al., Scalable K-Means++) oversamples a pool of candidate centers in a few passes over X,
+each pass sampling many candidates at once, instead of the k sequential passes of k-means++.
+The candidates are weighted by the number of samples closest to them. The pool is computed once and shared:
+each run draws its seeds with a weighted k-means++ on the (small) pool, using its own random state."""
+
+ALL_INITS = ["k-means++", "k-means||", "random"]
+
+_N_ROUNDS = 5  # number of oversampling passes over X
+_OVERSAMPLING_FACTOR = 2  # expected number of candidates sampled at each pass, in units of n_clusters
+
+
+def _minSquaredDistances(X, candidates):
+    """Index of the closest candidate and squared distance to it, for each sample. Chunked over X."""
+    if _isOutOfCore(X):
+        results = [_minSquaredDistances(Xc, candidates) for _, _, Xc in X.chunks()]
+        return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+    return pairwise_distances_argmin_min(X, candidates, metric="euclidean", metric_kwargs={"squared": True})
+
+
+def _kmeansParallelCandidates(X, sample_weight, n_clusters, random_state):
+    """Computes the k-means|| pool of candidate centers. Returns (candidates, weights).
+    The pool has at least n_clusters candidates (if X has at least n_clusters samples)."""
+    n_samples = X.shape[0]
+    l = _OVERSAMPLING_FACTOR * n_clusters
+
+    chosen = np.zeros(n_samples, dtype=bool)
+    first = random_state.choice(n_samples, p=sample_weight / sample_weight.sum())
+    chosen[first] = True
+    _, distances = _minSquaredDistances(X, X[[first]])
+
+    for _ in range(_N_ROUNDS):
+        cost = np.dot(sample_weight, distances)
+        if cost == 0:
+            break
+        p = np.minimum(1.0, l * sample_weight * distances / cost)
+        new = np.flatnonzero((random_state.uniform(size=n_samples) < p) & ~chosen)
+        if len(new) == 0:
+            continue
+        chosen[new] = True
+        _, newDistances = _minSquaredDistances(X, X[new])
+        np.minimum(distances, newDistances, out=distances)
+
+    # too few candidates (e.g. many duplicated samples): complete the pool with random samples
+    missing = n_clusters - np.count_nonzero(chosen)
+    if missing > 0:
+        others = np.flatnonzero(~chosen)
+        chosen[random_state.choice(others, size=min(missing, len(others)), replace=False)] = True
+
+    candidates = X[np.flatnonzero(chosen)]
+    closest, _ = _minSquaredDistances(X, candidates)
+    weights = np.bincount(closest, weights=sample_weight, minlength=candidates.shape[0])
+    return candidates, weights
+
+
+def _seedsFromCandidates(candidates, weights, n_clusters, random_state):
+    """Draws n_clusters initial centers from the pool, by k-means++ on the candidates weighted by their weights.
+    Candidates with zero weight are kept with a tiny weight, so that the pool has always enough points."""
+    weights = np.maximum(weights, weights.max() * 1e-6).astype(candidates.dtype)
+    centers, _ = _kmeans_plusplus(
+        candidates,
+        n_clusters,
+        x_squared_norms=row_norms(candidates, squared=True),
+        sample_weight=weights,
+        random_state=random_state,
+    )
+    return centers
@@ -0,0 +1,208 @@
+import weakref
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.util import Finalize
+
+import h5py
+import numpy as np
+import scipy.sparse as sp
+from sklearn.utils import check_array, check_random_state
+from sklearn.utils.extmath import row_norms
+from sklearn.utils.validation import _check_sample_weight
+
+from .engines import _totalScatter
+from .outofcore import _ChunkedArray, _diskBuffer
+from .seeding import _kmeansParallelCandidates
+
+
+def _readOnlyView(a):
+    v = a.view()
+    v.flags.writeable = False
+    return v
+
+
+def _attachedArray(shm, shape, dtype):
+    """ndarray on the buffer of the shared memory. The shared memory is closed when the array
+    (and all the views on it) are garbage collected."""
+    a = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    weakref.finalize(a, shm.close)
+    return a
+
+
+def _toSharedMemory(a):
+    """Copies the array in a new shared memory block. Returns (shm, array on the shared memory)."""
+    shm = SharedMemory(create=True, size=max(1, a.nbytes))
+    v = _attachedArray(shm, a.shape, a.dtype)
+    v[...] = a
+    return shm, v
+
+
+def _unlinkAll(shms):
+    for shm in shms:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedData:
+    """Validated, read-only data shared by all the runs of an ensemble and by all the ensembles of an elbow.
+    The data is validated and converted once, without copies if X is already C-contiguous and float.
+    It holds the precomputed squared norms, sample weight, mean and total scatter of the samples.
+
+    Parameters
+    ----------
+    X : {ndarray, sparse matrix, h5py.Dataset} of shape (n_samples, n_features)
+        The observations to cluster. If sparse matrix, must be in CSR format.
+        Dense arrays are exposed through read-only views (the original array is not modified).
+        Sparse matrices share the buffers but are not write protected, because sklearn sparse kernels require
+        writable buffers.
+        An HDF5 dataset enables the out-of-core mode: X stays on disk and is read by chunks of rows
+        (see Dataset.lazyData). Only the 'lloyd' algorithm and the 'serial' and 'threads' executors are supported,
+        and the labels are kept in disk-backed buffers.
+
+    chunk_size : int or None, default=None
+        Out-of-core mode only. Number of rows read at a time. If None, about 64MB of data per chunk.
+    """
+
+    def __init__(self, X, chunk_size=None):
+        if isinstance(X, h5py.Dataset):
+            self._X = _ChunkedArray(X, chunk_size=chunk_size)
+            norms = [row_norms(Xc, squared=True) for _, _, Xc in self._X.chunks()]
+            self._x_squared_norms = _readOnlyView(np.concatenate(norms))
+        else:
+            X = check_array(X, accept_sparse="csr", dtype=[np.float64, np.float32], order="C", accept_large_sparse=False)
+            self._X = X if sp.issparse(X) else _readOnlyView(X)
+            self._x_squared_norms = _readOnlyView(row_norms(self._X, squared=True))
+
+        self._sample_weight = _readOnlyView(_check_sample_weight(None, self._X, dtype=self._X.dtype))
+        self._mean, self._scatter = _totalScatter(self._X, self._sample_weight)
+        self._mean = _readOnlyView(self._mean)
+        self._shmNames = None  # names of the shared memory blocks, if the buffers are in shared memory
+        self._sharedCopy = None
+        self._candidates = {}  # n_clusters -> k-means|| pool of candidates (candidates, weights)
+
+    def share(self):
+        """Returns a SharedData with the same content, whose buffers are in shared memory.
+        The returned object is pickled by reference (names of the shared memory blocks), so that
+        it can be sent to worker processes without copying the data. The copy is created once and cached.
+        The shared memory is released when the returned object is garbage collected in this process."""
+        if self._shmNames is not None:
+            return self
+        if self.outOfCore:
+            raise ValueError("Out-of-core data cannot be shared with worker processes, use the 'threads' executor.")
+        if self._sharedCopy is None:
+            arrays = self._arrays()
+            shared = {}
+            shms = []
+            for key, a in arrays.items():
+                shm, v = _toSharedMemory(a)
+                shms.append(shm)
+                shared[key] = (shm.name, v)
+
+            copy = SharedData.__new__(SharedData)
+            copy.__dict__.update(self.__dict__)
+            copy._sharedCopy = None
+            copy._shmNames = {key: name for key, (name, _) in shared.items()}
+            copy._setArrays({key: v for key, (_, v) in shared.items()}, self._X.shape)
+            # unlinked also at the exit of a child process (e.g. ProgressiveEnsembleKMeansProcess), where the
+            # weakref finalizers are not called
+            Finalize(copy, _unlinkAll, args=(shms,), exitpriority=0)
+            self._sharedCopy = copy
+        return self._sharedCopy
+
+    def _arrays(self):
+        """Dict of the large buffers."""
+        arrays = {"x_squared_norms": self._x_squared_norms, "sample_weight": self._sample_weight}
+        if sp.issparse(self._X):
+            arrays.update(X_data=self._X.data, X_indices=self._X.indices, X_indptr=self._X.indptr)
+        else:
+            arrays.update(X=self._X)
+        return arrays
+
+    def _setArrays(self, arrays, shape):
+        if "X" in arrays:
+            self._X = _readOnlyView(arrays["X"])
+        else:
+            self._X = sp.csr_matrix((arrays["X_data"], arrays["X_indices"], arrays["X_indptr"]), shape=shape, copy=False)
+        self._x_squared_norms = _readOnlyView(arrays["x_squared_norms"])
+        self._sample_weight = _readOnlyView(arrays["sample_weight"])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_sharedCopy"] = None
+        if self._shmNames is not None:
+            # pickled by reference: only the names, shapes and dtypes of the shared buffers
+            arrays = self._arrays()
+            state["_buffers"] = {key: (self._shmNames[key], a.shape, a.dtype) for key, a in arrays.items()}
+            state["_shape"] = self._X.shape
+            del state["_X"], state["_x_squared_norms"], state["_sample_weight"]
+        return state
+
+    def __setstate__(self, state):
+        buffers = state.pop("_buffers", None)
+        shape = state.pop("_shape", None)
+        self.__dict__.update(state)
+        if buffers is not None:
+            arrays = {key: _attachedArray(SharedMemory(name=name), s, dt) for key, (name, s, dt) in buffers.items()}
+            self._setArrays(arrays, shape)
+
+    @staticmethod
+    def wrap(X):
+        """Returns X if it is already a SharedData, otherwise a new SharedData for X."""
+        if isinstance(X, SharedData):
+            return X
+        return SharedData(X)
+
+    def candidates(self, n_clusters, random_state=None):
+        """Returns the k-means|| pool of candidate centers for n_clusters, as (candidates, weights).
+        The pool is computed on the first call (with the given random_state) and cached,
+        so that all the runs draw their seeds from the same pool."""
+        if n_clusters not in self._candidates:
+            self._candidates[n_clusters] = _kmeansParallelCandidates(
+                self._X, self._sample_weight, n_clusters, check_random_state(random_state)
+            )
+        return self._candidates[n_clusters]
+
+    def labelsBuffer(self, shape, dtype=np.int32):
+        """Returns a new zero-filled array for labels. In out-of-core mode it is backed by a temporary file."""
+        if self.outOfCore:
+            return _diskBuffer(shape, dtype)
+        return np.zeros(shape, dtype=dtype)
+
+    def tolerance(self, tol):
+        """Tolerance of the convergence, dependent on the dataset. Same as sklearn _tolerance, without passes over X."""
+        if tol == 0:
+            return 0
+        return self._scatter / (self._sample_weight.sum() * self._X.shape[1]) * tol
+
+    @property
+    def outOfCore(self):
+        return isinstance(self._X, _ChunkedArray)
+
+    @property
+    def X(self):
+        return self._X
+
+    @property
+    def x_squared_norms(self):
+        return self._x_squared_norms
+
+    @property
+    def sample_weight(self):
+        return self._sample_weight
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @property
+    def scatter(self):
+        return self._scatter
+
+    @property
+    def shape(self):
+        return self._X.shape
+
+    @property
+    def dtype(self):
+        return self._X.dtype
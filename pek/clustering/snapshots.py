@@ -0,0 +1,95 @@
+import weakref
+
+import numpy as np
+
+"""Snapshots of the buffers of the progressive objects.
+The partial results expose read-only views (snapshots) of the working buffers instead of copies.
+The working buffer is written in place while no snapshot of it is alive, otherwise it is first copied
+in a buffer recycled from a small pool (copy-on-write), so that the snapshots kept by the consumers never change.
+The snapshots are tracked explicitly: each one is created on a _SnapshotOwner, to which all the views derived from
+it keep a reference, and a buffer is in use as long as one of its owners is alive (weak references)."""
+
+_POOL_SIZE = 2  # free buffers kept for reuse
+
+
+class _SnapshotOwner:
+    """Exposes a buffer to numpy as read-only through the array interface. The arrays created from it, and all
+    their views, reference the owner instead of the buffer (numpy collapses the bases of the views only through
+    arrays), so the owner is alive as long as one of them is."""
+
+    def __init__(self, buffer):
+        interface = dict(buffer.__array_interface__)
+        interface["data"] = (interface["data"][0], True)
+        self.__array_interface__ = interface
+        self._buffer = buffer
+
+
+class _SnapshotBuffer:
+    """Working buffer of the given shape and dtype, published as read-only snapshots with copy-on-write.
+    allocate(shape, dtype) creates the buffers (e.g. SharedData.labelsBuffer)."""
+
+    def __init__(self, allocate, shape, dtype):
+        self._allocate = allocate
+        self._shape = tuple(shape)
+        self._dtype = dtype
+        self._array = allocate(self._shape, self._dtype)
+        self._released = []  # buffers replaced by copy-on-write: in use by snapshots, or free
+        self._owners = {id(self._array): weakref.WeakSet()}  # owners of the live snapshots of each buffer
+
+    def writable(self):
+        """Returns the working buffer, to be modified. If a snapshot of it is still alive, the content is
+        first copied in a free buffer, which becomes the working buffer."""
+        if self._inUse(self._array):
+            buffer = self._acquire()
+            buffer[...] = self._array
+            self._released.append(self._array)
+            self._array = buffer
+        return self._array
+
+    def snapshot(self):
+        """Returns a read-only view of the working buffer, valid until it (and all the views derived from it) is
+        garbage collected."""
+        owner = _SnapshotOwner(self._array)
+        self._owners[id(self._array)].add(owner)
+        return np.asarray(owner)
+
+    def _inUse(self, buffer):
+        return len(self._owners[id(buffer)]) > 0
+
+    def _acquire(self):
+        """Returns a free buffer, or a new one. Free buffers beyond the pool size are released."""
+        free = [i for i in range(len(self._released)) if not self._inUse(self._released[i])]
+        if len(free) == 0:
+            buffer = self._allocate(self._shape, self._dtype)
+            self._owners[id(buffer)] = weakref.WeakSet()
+            return buffer
+        buffer = self._released[free[0]]
+        for i in reversed(free[_POOL_SIZE + 1 :]):
+            del self._owners[id(self._released[i])]
+            del self._released[i]
+        del self._released[free[0]]
+        return buffer
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    def __getstate__(self):
+        # the snapshots are not saved, the working buffer is saved as a plain array
+        state = self.__dict__.copy()
+        state["_array"] = np.asarray(self._array)
+        state["_released"] = []
+        state["_owners"] = None
+        return state
+
+    def __setstate__(self, state):
+        array = state["_array"]
+        self.__dict__.update(state)
+        # the buffer is allocated again, e.g. on disk for the out-of-core mode
+        self._array = self._allocate(self._shape, self._dtype)
+        self._array[...] = array
+        self._owners = {id(self._array): weakref.WeakSet()}
@@ -61,6 +61,14 @@ class Dataset:
             self._data = _read(self._hdf5File, "data")
         return self._data
 
+    @property
+    def lazyData(self):
+        """The data as an HDF5 dataset, read from the file only on access.
+        Pass it as X to cluster the dataset in out-of-core mode, reading it by chunks."""
+        if "data" not in self._hdf5File:
+            return None
+        return self._hdf5File["data"]
+
     @property
     def pca(self):
         if self._pca is None:
@@ -1,5 +1,6 @@
 import numpy as np
 import sklearn.metrics as _skmetrics
+from scipy.special import gammaln
 
 # from sklearn.metrics import a
 from sklearn.utils._param_validation import InvalidParameterError
@@ -8,19 +9,179 @@ from sklearn.utils._param_validation import InvalidParameterError
 def ari(labels_a, labels_b):
     """Rand index adjusted for chance.
     See https://scikit-learn.org/stable/modules/generated/sklearn.metrics.adjusted_rand_score.html"""
-    return _skmetrics.adjusted_rand_score(np.asarray(labels_a, dtype=int), np.asarray(labels_b, dtype=int))
+    return _skmetrics.adjusted_rand_score(np.asarray(labels_a), np.asarray(labels_b))
 
 
 def ami(labels_a, labels_b):
     """Adjusted Mutual Information between two clusterings.
     See https://scikit-learn.org/stable/modules/generated/sklearn.metrics.adjusted_mutual_info_score.html"""
-    return _skmetrics.adjusted_mutual_info_score(np.asarray(labels_a, dtype=int), np.asarray(labels_b, dtype=int))
+    return _skmetrics.adjusted_mutual_info_score(np.asarray(labels_a), np.asarray(labels_b))
 
 
 ALL_COMPARISON_METRICS_DICT = {"ari": ari, "ami": ami}
 ALL_COMPARISON_METRICS = sorted(ALL_COMPARISON_METRICS_DICT.keys())
 
 
+# metrics computed by _pairwiseComparison from the shared contingency tables
+_BATCHED_COMPARISON_METRICS = {"ari", "ami"}
+_MAX_BATCH_CELLS = 2**22  # max cells of the contingency tables (or of the keys) handled at once
+_MAX_DENSE_CLUSTERS = 2**11  # beyond, the contingency tables are too large and the pairs are compared one by one
+_EMI_TAIL_EXPONENT = 80.0  # the terms of the expected mutual information beyond a tail probability exp(-80) are skipped
+
+
+def _pairwiseComparison(partitions, pairs, metricNames):
+    """Comparison metrics of the pairs of partitions, computed from their contingency tables.
+    partitions is an array RxN of non-negative labels, pairs a list of (p, q) indices of partitions, metricNames
+    the names of metrics in _BATCHED_COMPARISON_METRICS. Returns {metricName: array of the values of the pairs}.
+    The pairs are grouped by their first partition p: the tables of p with a batch of partitions q are
+    counted with a single bincount of the keys (batch, label in p, label in q), the pair-counting and the
+    information terms of the metrics are then computed on the batch of tables at once. Same values as sklearn."""
+    partitions = np.asarray(partitions)
+    n_samples = partitions.shape[1]
+    results = {metricName: np.empty(len(pairs), dtype=float) for metricName in metricNames}
+    if len(pairs) == 0:
+        return results
+    n_clusters = int(partitions.max()) + 1
+
+    if n_clusters > _MAX_DENSE_CLUSTERS:
+        for metricName in metricNames:
+            metricFunction = ALL_COMPARISON_METRICS_DICT[metricName]
+            for index, (p, q) in enumerate(pairs):
+                results[metricName][index] = metricFunction(partitions[p], partitions[q])
+        return results
+
+    counts = np.stack([np.bincount(labels, minlength=n_clusters) for labels in partitions])
+    byFirst = {}
+    for index, (p, q) in enumerate(pairs):
+        byFirst.setdefault(p, []).append((q, index))
+
+    batchSize = max(1, _MAX_BATCH_CELLS // (n_clusters * n_clusters))
+    for p, others in byFirst.items():
+        keysP = partitions[p].astype(np.int64) * n_clusters
+        for start in range(0, len(others), batchSize):
+            batch = others[start : start + batchSize]
+            qs = [q for q, _ in batch]
+            indices = [index for _, index in batch]
+            tables = _contingencyTables(keysP, partitions[qs], n_clusters)
+            for metricName in metricNames:
+                if metricName == "ari":
+                    values = _ariFromTables(tables, counts[p], counts[qs], n_samples)
+                else:
+                    values = _amiFromTables(tables, counts[p], counts[qs], n_samples)
+                results[metricName][indices] = values
+    return results
+
+
+def _contingencyTables(keysA, partitionsB, n_clusters):
+    """Contingency tables BxKxK of the labels keysA (multiplied by K) with each of the B partitions."""
+    n_batch, n_samples = partitionsB.shape
+    offsets = (np.arange(n_batch, dtype=np.int64) * n_clusters * n_clusters)[:, None]
+    tables = np.zeros(n_batch * n_clusters * n_clusters, dtype=np.int64)
+    chunkSize = max(1, _MAX_BATCH_CELLS // n_batch)
+    for start in range(0, n_samples, chunkSize):
+        end = min(start + chunkSize, n_samples)
+        keys = partitionsB[:, start:end] + (keysA[start:end] + offsets)
+        tables += np.bincount(keys.ravel(), minlength=tables.size)
+    return tables.reshape(n_batch, n_clusters, n_clusters)
+
+
+def _ariFromTables(tables, countsA, countsB, n_samples):
+    """ARI of the contingency tables BxKxK, from the pair confusion matrices (see sklearn pair_confusion_matrix)."""
+    n = float(n_samples)
+    sumSquares = np.square(tables, dtype=float).sum(axis=(1, 2))
+    sumSquaresA = np.square(countsA, dtype=float).sum()
+    sumSquaresB = np.square(countsB, dtype=float).sum(axis=1)
+    fp = sumSquaresB - sumSquares
+    fn = sumSquaresA - sumSquares
+    tp = sumSquares - n
+    tn = n * n - fp - fn - sumSquares
+    perfect = (fn == 0) & (fp == 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = 2.0 * (tp * tn - fn * fp) / ((tp + fn) * (fn + tn) + (tp + fp) * (fp + tn))
+    return np.where(perfect, 1.0, values)
+
+
+def _entropy(counts):
+    """Entropy of the labels with the given counts per label (0 for a single label), as sklearn entropy."""
+    counts = counts[counts > 0].astype(float)
+    if counts.size <= 1:
+        return 0.0
+    total = counts.sum()
+    return -np.sum((counts / total) * (np.log(counts) - np.log(total)))
+
+
+def _amiFromTables(tables, countsA, countsB, n_samples):
+    """AMI (arithmetic mean normalization) of the contingency tables BxKxK, as sklearn adjusted_mutual_info_score.
+    The mutual information is computed on the batch of tables, the expected mutual information per table."""
+    n = float(n_samples)
+    nonEmptyA = countsA > 0
+    # mutual information (see sklearn mutual_info_score)
+    tablesF = tables.astype(float)
+    nonZero = tables > 0
+    outer = countsA.astype(float)[None, :, None] * countsB.astype(float)[:, None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = (tablesF / n) * (np.log(np.where(nonZero, tablesF, 1.0)) - np.log(n))
+        terms += (tablesF / n) * (-np.log(np.where(nonZero, outer, 1.0)) + 2 * np.log(n))
+    terms = np.where(nonZero & (np.abs(terms) >= np.finfo(float).eps), terms, 0.0)
+    mi = np.clip(terms.sum(axis=(1, 2)), 0.0, None)
+
+    hA = _entropy(countsA)
+    values = np.empty(len(tables), dtype=float)
+    for b in range(len(tables)):
+        nonEmptyB = countsB[b] > 0
+        sizeA, sizeB = np.count_nonzero(nonEmptyA), np.count_nonzero(nonEmptyB)
+        if (sizeA == sizeB == 1) or (sizeA == sizeB == 0):
+            values[b] = 1.0
+            continue
+        if sizeA == 1 or sizeB == 1:
+            mi[b] = 0.0
+        emi = _expectedMutualInformation(countsA[nonEmptyA], countsB[b][nonEmptyB], n_samples)
+        hB = _entropy(countsB[b])
+        denominator = (hA + hB) / 2 - emi
+        eps = np.finfo("float64").eps
+        denominator = min(denominator, -eps) if denominator < 0 else max(denominator, eps)
+        values[b] = (mi[b] - emi) / denominator
+    return values
+
+
+def _expectedMutualInformation(countsA, countsB, n_samples):
+    """Expected mutual information of two labelings with the given (non-zero) counts per label, under the
+    hypergeometric model of randomness (as sklearn expected_mutual_information). The count n_ij of each pair of
+    labels is summed only around its mean: by Hoeffding's inequality the probability of the skipped values is below
+    exp(-_EMI_TAIL_EXPONENT), so the result is the same up to rounding, with far fewer terms."""
+    if countsA.size == 1 or countsB.size == 1:
+        return 0.0
+    n = n_samples
+    a = countsA.astype(np.int64)[:, None]
+    b = countsB.astype(np.int64)[None, :]
+    mean = a * b / n
+    width = np.ceil(np.sqrt(np.minimum(a, b) * _EMI_TAIL_EXPONENT / 2))
+    start = np.maximum(np.maximum(a + b - n, 1), np.floor(mean - width)).astype(np.int64)
+    end = np.minimum(np.minimum(a, b), np.ceil(mean + width)).astype(np.int64) + 1
+    start, end = np.broadcast_to(start, mean.shape).ravel(), np.broadcast_to(end, mean.shape).ravel()
+    lengths = np.maximum(end - start, 0)
+
+    # one term for each cell and each value n_ij in its range
+    cells = np.repeat(np.arange(lengths.size), lengths)
+    nij = (np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + start[cells]).astype(float)
+    ai = np.broadcast_to(a, mean.shape).ravel()[cells].astype(float)
+    bj = np.broadcast_to(b, mean.shape).ravel()[cells].astype(float)
+    term1 = nij / n
+    term2 = np.log(n) + np.log(nij) - np.log(ai) - np.log(bj)
+    gln = (
+        gammaln(ai + 1)
+        + gammaln(bj + 1)
+        + gammaln(n - ai + 1)
+        + gammaln(n - bj + 1)
+        - gammaln(nij + 1)
+        - gammaln(n + 1)
+        - gammaln(ai - nij + 1)
+        - gammaln(bj - nij + 1)
+        - gammaln(n - ai - bj + nij + 1)
+    )
+    return float(np.sum(term1 * term2 * np.exp(gln)))
+
+
 def _checkComparisonMetric(metricName):
     """
     Validate a given metric name against the predefined dictionary of valid comparison metrics.
@@ -102,6 +102,117 @@ ALL_PROGRESSION_METRICS_DICT = {
 ALL_PROGRESSION_METRICS = sorted(ALL_PROGRESSION_METRICS_DICT.keys())
 
 
+# (kind, window) of the progression metrics, window None for all the history
+_PROGRESSION_METRICS_WINDOW = {
+    "entries_stability_2": ("entries", 2),
+    "entries_stability_3": ("entries", 3),
+    "entries_stability_4": ("entries", 3),
+    "entries_stability_5": ("entries", 5),
+    "entries_stability_10": ("entries", 10),
+    "entries_stability_all": ("entries", None),
+    "global_stability_2": ("global", 2),
+    "global_stability_3": ("global", 3),
+    "global_stability_4": ("global", 4),
+    "global_stability_5": ("global", 5),
+    "global_stability_10": ("global", 10),
+    "global_stability_all": ("global", None),
+}
+
+
+class _StabilityTracker:
+    """Stability of R labels arrays (e.g. the partitions of the runs) across the iterations, without keeping
+    the whole history: same values as _entries_stability on the history of each array.
+    The windowed metrics use a ring buffer of the last labels, sized to the largest window. The metrics on
+    all the history use, for each entry, the accumulated weights of the iterations in which it had each label:
+    the weight of its current label is kept in a dense array, the weights of its previous labels in a sorted
+    sparse store, which only grows when an entry gets a label it never had before."""
+
+    def __init__(self, metricNames):
+        windows = {_PROGRESSION_METRICS_WINDOW[metricName][1] for metricName in metricNames}
+        self._ringSize = max([w for w in windows if w is not None], default=0)
+        self._tracksAll = None in windows
+        self._count = 0  # number of labels arrays seen
+        self._ring = None  # (ringSize, R, N) last labels, the current ones at (count - 1) % ringSize
+        self._shape = None
+        self._slotLabels = None  # (R*N) current label of each entry
+        self._slotWeights = None  # (R*N) weight of the previous iterations with the current label
+        self._storeKeys = np.empty(0, dtype=np.int64)  # sorted keys entry * n_keys + label of the previous labels
+        self._storeWeights = np.empty(0, dtype=float)
+        self._values = {}  # window -> entries stability of the current labels
+
+    def update(self, labels):
+        """Adds the labels (R, N) of a new iteration. The labels are copied, no reference is kept."""
+        labels = np.asarray(labels)
+        if self._ringSize > 0:
+            if self._ring is None:
+                self._ring = np.empty((self._ringSize,) + labels.shape, dtype=labels.dtype)
+            self._ring[self._count % self._ringSize] = labels
+        if self._tracksAll:
+            self._updateAll(labels.ravel())
+        self._shape = labels.shape
+        self._count += 1
+        self._values = {}
+
+    def _updateAll(self, labels):
+        if self._slotLabels is None:
+            self._slotLabels = labels.copy()
+            self._slotWeights = np.zeros(labels.size, dtype=float)
+            return
+        # weight of the previous iteration, whose labels are the current labels of the slots
+        self._slotWeights += np.log(2 + self._count - 1)
+        changed = np.flatnonzero(labels != self._slotLabels)
+        if len(changed) == 0:
+            return
+        n_keys = 1 << (8 * min(labels.dtype.itemsize, 4))
+        oldKeys = changed * n_keys + self._slotLabels[changed]
+        newKeys = changed * n_keys + labels[changed]
+        # the weights of the new labels are moved from the store to the slots, and the ones of the old labels back
+        pos = np.searchsorted(self._storeKeys, newKeys)
+        found = pos < len(self._storeKeys)
+        found[found] = self._storeKeys[pos[found]] == newKeys[found]
+        weights = np.zeros(len(changed), dtype=float)
+        weights[found] = self._storeWeights[pos[found]]
+        keep = np.ones(len(self._storeKeys), dtype=bool)
+        keep[pos[found]] = False
+        keys, storeWeights = self._storeKeys[keep], self._storeWeights[keep]
+        pos = np.searchsorted(keys, oldKeys)
+        self._storeKeys = np.insert(keys, pos, oldKeys)
+        self._storeWeights = np.insert(storeWeights, pos, self._slotWeights[changed])
+        self._slotLabels[changed] = labels[changed]
+        self._slotWeights[changed] = weights
+
+    def entries(self, window=None):
+        """Stability (R, N) of each entry of the current labels, in the window (all the history if None)."""
+        if window not in self._values:
+            self._values[window] = self._entries(window)
+        return self._values[window]
+
+    def globalStability(self, window=None):
+        """Mean stability (R) of the entries of the current labels."""
+        return np.mean(self.entries(window), axis=1)
+
+    def _entries(self, window):
+        h = self._count if window is None else min(self._count, window)
+        if h <= 1:
+            return np.zeros(self._shape, dtype=float)
+        weights = np.log(2 + np.arange(h - 1))  # log weights, from the oldest labels
+        if window is None:
+            return (self._slotWeights / np.sum(weights)).reshape(self._shape)
+        current = self._ring[(self._count - 1) % self._ringSize]
+        stability = np.zeros(self._shape, dtype=float)
+        for i in range(h - 1):
+            previous = self._ring[(self._count - h + i) % self._ringSize]
+            stability += (current == previous) * weights[i]
+        return stability / np.sum(weights)
+
+    def value(self, metricName):
+        """List of the values of the progression metric, one for each of the R labels arrays."""
+        kind, window = _PROGRESSION_METRICS_WINDOW[metricName]
+        if kind == "entries":
+            return list(self.entries(window))
+        return [float(v) for v in self.globalStability(window)]
+
+
 def _checkProgressionMetric(metricName):
     """
     Validate a given metric name against the predefined dictionary of valid progression metrics.
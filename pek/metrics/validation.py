@@ -1,62 +1,268 @@
 import numpy as np
 import scipy.sparse as sp
 from sklearn import metrics as skmetrics
-from sklearn.cluster._k_means_common import _inertia_dense, _inertia_sparse
-from sklearn.utils._openmp_helpers import _openmp_effective_n_threads
 from sklearn.utils._param_validation import InvalidParameterError
-from sklearn.utils.validation import _check_sample_weight
-
-from ..utils.clustering import getClusters
 
 """Clustering validation metrics."""
 
 
+_STATISTICS_CHUNK_ELEMENTS = 2**22  # max values of the temporary arrays of a chunk of samples
+_SILHOUETTE_SAMPLE_SIZE = 1000  # samples whose silhouette is computed
+_SILHOUETTE_REFERENCE_SIZE = 5000  # samples the distances are computed to
+_SILHOUETTE_SEED = 0
+_SILHOUETTE_Z = 1.959963984540054  # 95% confidence interval
+
+
+class _ClusterStatistics:
+    """Statistics of the clusters of a partition of data, from which the validation metrics are computed:
+    cluster sizes, sums, centers, within-cluster sums of squares and mean distances of the samples to their center.
+    They are computed in two chunked passes over data (dense or CSR), shared by all the metrics: the sums are a
+    label-indexed reduction (sparse indicator product), then the distances to the centers are reduced by label.
+    The temporaries are O(chunk), for CSR data O(non-zeros of the chunk). The empty clusters are ignored
+    (labels are compacted).
+    metricNames are the requested metrics: if the simplified silhouette is requested, the distances of each
+    sample to all the centers are computed too."""
+
+    def __init__(self, data, labels, metricNames=()):
+        secondClosest = "simplified_silhouette" in metricNames
+        labels = np.asarray(labels)
+        counts = np.bincount(labels)
+        present = counts > 0
+        labels = (np.cumsum(present) - 1)[labels]  # compact labels 0..k-1
+
+        self.n_samples = data.shape[0]
+        self.n_clusters = int(np.count_nonzero(present))
+        self.sizes = counts[present]
+        self.sums = np.zeros((self.n_clusters, data.shape[1]), dtype=float)
+        for start, end in self._chunks(data):
+            sums = _labelsIndicator(labels[start:end], self.n_clusters) @ _rows(data, start, end)
+            self.sums += sums.toarray() if sp.issparse(sums) else sums
+        self.centers = self.sums / self.sizes[:, None]
+        self.mean = self.sums.sum(axis=0) / self.n_samples
+
+        self.sumSquares = np.zeros(self.n_clusters, dtype=float)  # within-cluster sum of squares
+        self.sumDistances = np.zeros(self.n_clusters, dtype=float)  # sum of the distances to the center
+        self.simplifiedSilhouetteSum = 0.0 if secondClosest else None
+        for start, end in self._chunks(data, self.n_clusters if secondClosest else 1):
+            X, chunkLabels = _rows(data, start, end), labels[start:end]
+            squares = _squaredDistancesToCenters(X, self.centers, chunkLabels)
+            distances = np.sqrt(squares)
+            self.sumSquares += np.bincount(chunkLabels, weights=squares, minlength=self.n_clusters)
+            self.sumDistances += np.bincount(chunkLabels, weights=distances, minlength=self.n_clusters)
+            if secondClosest:
+                allDistances = skmetrics.pairwise.euclidean_distances(X, self.centers)
+                A = allDistances[np.arange(end - start), chunkLabels]
+                allDistances[np.arange(end - start), chunkLabels] = np.inf
+                B = np.min(allDistances, axis=1)  # distance to the second closest center
+                self.simplifiedSilhouetteSum += float(np.sum((B - A) / np.maximum(A, B)))
+        self.meanDistances = self.sumDistances / self.sizes
+
+    def _chunks(self, data, width=1):
+        # values per row of the temporaries: the features, or the non-zeros of CSR data
+        rowSize = -(-data.nnz // max(1, self.n_samples)) if sp.issparse(data) else data.shape[1]
+        chunkSize = max(1, _STATISTICS_CHUNK_ELEMENTS // max(rowSize, width))
+        for start in range(0, self.n_samples, chunkSize):
+            yield start, min(start + chunkSize, self.n_samples)
+
+
+def _labelsIndicator(labels, n_clusters):
+    """Sparse matrix KxN with a one in (label, sample) for each sample."""
+    n = len(labels)
+    return sp.csr_matrix((np.ones(n), (labels, np.arange(n))), shape=(n_clusters, n))
+
+
+def _rows(data, start, end):
+    """Rows start:end of data as float64, CSR if data is sparse."""
+    if sp.issparse(data):
+        return sp.csr_matrix(data[start:end], dtype=float)
+    return np.asarray(data[start:end], dtype=float)
+
+
+def _squaredDistancesToCenters(X, centers, labels):
+    """Squared distance of each row of X to the center of its label. For CSR X, computed on the non-zeros
+    as |x|^2 - 2 x.c + |c|^2."""
+    if sp.issparse(X):
+        rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+        dots = np.bincount(rows, weights=X.data * centers[labels[rows], X.indices], minlength=X.shape[0])
+        norms = np.bincount(rows, weights=X.data**2, minlength=X.shape[0])
+        centersNorms = np.einsum("ij,ij->i", centers, centers)
+        return np.maximum(norms - 2 * dots + centersNorms[labels], 0)
+    residuals = X - centers[labels]
+    return np.einsum("ij,ij->i", residuals, residuals)
+
+
+def _centersDistances(centers):
+    """Yields (start, end, distances Bxk of the centers start:end to all the centers), in blocks of bounded
+    memory, so that the metrics on the pairs of centers scale to large k."""
+    k = centers.shape[0]
+    blockSize = max(1, _STATISTICS_CHUNK_ELEMENTS // max(1, k))
+    for start in range(0, k, blockSize):
+        end = min(start + blockSize, k)
+        distances = skmetrics.pairwise.euclidean_distances(centers[start:end], centers)
+        distances[np.arange(end - start), np.arange(start, end)] = 0  # as sklearn for the distances of X to X
+        yield start, end, distances
+
+
+def _checkNumberOfLabels(statistics):
+    """Raises ValueError if the number of clusters is not in [2, n_samples - 1], as sklearn."""
+    if not 1 < statistics.n_clusters < statistics.n_samples:
+        raise ValueError(
+            "Number of labels is %d. Valid values are 2 to n_samples - 1 (inclusive)" % statistics.n_clusters
+        )
+
+
+def _calinskiHarabasz(statistics):
+    _checkNumberOfLabels(statistics)
+    n, k = statistics.n_samples, statistics.n_clusters
+    extraDispersion = np.sum(statistics.sizes * np.sum((statistics.centers - statistics.mean) ** 2, axis=1))
+    intraDispersion = np.sum(statistics.sumSquares)
+    if intraDispersion == 0:
+        return 1.0
+    return float(extraDispersion * (n - k) / (intraDispersion * (k - 1)))
+
+
+def _daviesBouldinIndex(statistics):
+    _checkNumberOfLabels(statistics)
+    intraDistances = statistics.meanDistances
+    if np.allclose(intraDistances, 0):
+        return 0.0
+    scores = np.empty(statistics.n_clusters, dtype=float)
+    maxDistance = 0.0
+    for start, end, distances in _centersDistances(statistics.centers):
+        maxDistance = max(maxDistance, np.max(np.abs(distances)))
+        distances[distances == 0] = np.inf
+        scores[start:end] = np.max((intraDistances[start:end, None] + intraDistances) / distances, axis=1)
+    if np.allclose(maxDistance, 0):  # all the centers are the same
+        return 0.0
+    return float(np.mean(scores))
+
+
+def _dunnIndex(statistics):
+    minDistance = np.inf
+    for start, end, distances in _centersDistances(statistics.centers):
+        upper = np.arange(statistics.n_clusters)[None, :] > np.arange(start, end)[:, None]  # pairs i < j
+        minDistance = min(minDistance, np.min(distances, where=upper, initial=np.inf))
+    return float(minDistance / np.max(statistics.meanDistances))
+
+
+def _inertia(statistics):
+    return float(np.sum(statistics.sumSquares))
+
+
+def _simplifiedSilhouette(statistics):
+    return float(statistics.simplifiedSilhouetteSum / statistics.n_samples)
+
+
+class _SilhouetteEstimate:
+    """Estimate of the silhouette score of a partition, with a 95% confidence interval (low, high).
+    The silhouette of a stratified sample of _SILHOUETTE_SAMPLE_SIZE samples (proportional allocation, at least
+    2 samples per cluster) is computed with the mean distances to the clusters of a second stratified sample of
+    _SILHOUETTE_REFERENCE_SIZE samples, in blocks of bounded memory: O(sample * reference) instead of O(n^2).
+    The samples are drawn with a fixed seed, so the same labels give the same estimate. The score is the weighted
+    mean of the per-cluster means, the interval is given by the variance of the stratified mean (the error of
+    the distances estimated on the reference sample is not included). Exact if the data fits in the samples."""
+
+    def __init__(self, data, labels, metricNames=()):
+        labels = np.asarray(labels)
+        counts = np.bincount(labels)
+        present = counts > 0
+        labels = (np.cumsum(present) - 1)[labels]  # compact labels 0..k-1
+        counts = counts[present]
+        n, k = len(labels), len(counts)
+        if not 1 < k < n:
+            raise ValueError("Number of labels is %d. Valid values are 2 to n_samples - 1 (inclusive)" % k)
+
+        order = np.argsort(labels, kind="stable")  # samples grouped by cluster
+        sample = _stratifiedSample(order, counts, _SILHOUETTE_SAMPLE_SIZE, _SILHOUETTE_SEED)
+        reference = _stratifiedSample(order, counts, _SILHOUETTE_REFERENCE_SIZE, _SILHOUETTE_SEED + 1)
+        sampleLabels, referenceLabels = labels[sample], labels[reference]
+        referenceCounts = np.bincount(referenceLabels, minlength=k)
+        X, Y = data[sample], data[reference]
+        # position of each sample in the reference sample (-1 if absent), its distance to itself is excluded
+        position = np.searchsorted(reference, sample)
+        position[position == len(reference)] = 0
+        position[reference[position] != sample] = -1
+
+        values = np.zeros(len(sample), dtype=float)
+        blockSize = max(1, _STATISTICS_CHUNK_ELEMENTS // max(len(reference), k))
+        for start in range(0, len(sample), blockSize):
+            end = min(start + blockSize, len(sample))
+            rows = np.arange(end - start)
+            distances = skmetrics.pairwise.euclidean_distances(X[start:end], Y)
+            inReference = position[start:end] >= 0
+            distances[rows[inReference], position[start:end][inReference]] = 0
+            clusterDistances = np.asarray(distances @ _labelsIndicator(referenceLabels, k).T)  # block x K
+            blockLabels = sampleLabels[start:end]
+            ownCounts = referenceCounts[blockLabels] - inReference
+            with np.errstate(divide="ignore", invalid="ignore"):
+                a = clusterDistances[rows, blockLabels] / ownCounts
+                clusterDistances /= referenceCounts
+                clusterDistances[rows, blockLabels] = np.inf
+                clusterDistances[:, referenceCounts == 0] = np.inf
+                b = np.min(clusterDistances, axis=1)
+                s = np.nan_to_num((b - a) / np.maximum(a, b))
+            s[(counts[blockLabels] == 1) | (ownCounts == 0)] = 0  # singleton clusters
+            values[start:end] = s
+
+        weights = counts / n
+        sampleCounts = np.bincount(sampleLabels, minlength=k)
+        means = np.bincount(sampleLabels, weights=values, minlength=k) / sampleCounts
+        squares = np.bincount(sampleLabels, weights=(values - means[sampleLabels]) ** 2, minlength=k)
+        variances = np.where(sampleCounts > 1, squares / np.maximum(sampleCounts - 1, 1), 0.0)
+        finite = 1 - sampleCounts / counts  # finite population correction
+        self.estimate = float(np.sum(weights * means))
+        halfWidth = _SILHOUETTE_Z * np.sqrt(np.sum(weights**2 * finite * variances / sampleCounts))
+        self.low = self.estimate - float(halfWidth)
+        self.high = self.estimate + float(halfWidth)
+        self.sampleSize = len(sample)
+
+
+def _silhouetteEstimateValue(estimate):
+    return estimate.estimate
+
+
+def _silhouetteEstimateLow(estimate):
+    return estimate.low
+
+
+def _silhouetteEstimateHigh(estimate):
+    return estimate.high
+
+
+def _stratifiedSample(order, counts, size, seed):
+    """Sorted indices of a stratified sample of about size samples, with proportional allocation and at least
+    2 samples per cluster (if any). order are the indices of the samples grouped by cluster, counts the sizes
+    of the clusters. All the samples if size >= n."""
+    n = len(order)
+    if size >= n:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    allocation = np.minimum(counts, np.maximum(2, np.round(size * counts / n).astype(np.int64)))
+    starts = np.cumsum(counts) - counts
+    sample = [
+        order[start + rng.choice(count, m, replace=False)] for start, count, m in zip(starts, counts, allocation)
+    ]
+    return np.sort(np.concatenate(sample))
+
+
 def calinskiHarabasz(data, labels) -> float:
     """Calinski and Harabasz Score. Better max."""
-    result = skmetrics.calinski_harabasz_score(data, labels)
-    return float(result)  # convert np.float64 to float
+    return _calinskiHarabasz(_ClusterStatistics(data, labels))
 
 
 def daviesBouldinIndex(data, labels) -> float:
     """Davies Bouldin Index. Better min."""
-    result = skmetrics.davies_bouldin_score(data, labels)
-    return float(result)  # convert np.float64 to float
+    return _daviesBouldinIndex(_ClusterStatistics(data, labels))
 
 
 def dunnIndex(data, labels) -> float:
     """Dunn Index. Better max."""
-    clusters, centers = getClusters(data, labels)
-    centers_pairwise_distances = skmetrics.pairwise.euclidean_distances(centers)
-
-    max_cluster_diameter = 0
-    for k in range(len(clusters)):
-        cluster = clusters[k]
-        center = centers[k]
-        distances = skmetrics.pairwise.euclidean_distances(cluster, [center])
-        max_cluster_diameter = max(np.mean(distances), max_cluster_diameter)
-
-    idx = np.triu_indices(centers_pairwise_distances.shape[0], 1)
-    min_centers_distance = np.min(centers_pairwise_distances[idx])
-    result = min_centers_distance / max_cluster_diameter
-    return float(result)  # convert np.float64 to float
+    return _dunnIndex(_ClusterStatistics(data, labels))
 
 
 def inertia(data, labels) -> float:
     """Inertia. Sum of squared distance between each sample and its assigned center. Better min."""
-    if sp.issparse(data):
-        _inertia_fn = _inertia_sparse
-    else:
-        _inertia_fn = _inertia_dense
-
-    # print(data.shape, data.dtype, data.flags)
-    # print(labels.shape, labels.dtype, labels.flags)
-    # print("\n\n\n")
-
-    clusters, centers = getClusters(data, labels)
-    sample_weight = _check_sample_weight(None, data, dtype=data.dtype)
-    n_threads = _openmp_effective_n_threads()
-    result = _inertia_fn(data, sample_weight, centers, labels.astype(np.int32), n_threads)
-    return float(result)  # convert np.float64 to float
+    return _inertia(_ClusterStatistics(data, labels))
 
 
 def silhouette(data, labels) -> float:
@@ -65,21 +271,30 @@ def silhouette(data, labels) -> float:
     return float(result)  # convert np.float64 to float
 
 
-def simplifiedSilhouette(data, labels) -> float:
-    """Simplified Silhouette Coefficient of all samples. Better max."""
-    n = data.shape[0]
-    clusters, centers = getClusters(data, labels)
-    distances = skmetrics.pairwise.euclidean_distances(data, centers)  # distance of each point to all centroids
+def sampledSilhouette(data, labels) -> float:
+    """Silhouette score estimated on a stratified sample, see sampledSilhouetteInterval. Better max."""
+    return _SilhouetteEstimate(data, labels).estimate
+
+
+def sampledSilhouetteInterval(data, labels):
+    """Sampled silhouette score with its 95% confidence interval, as a tuple (estimate, low, high).
+    The silhouette of a fixed stratified sample of the clusters is computed against a second stratified sample,
+    so the cost does not depend on the number of samples."""
+    estimate = _SilhouetteEstimate(data, labels)
+    return estimate.estimate, estimate.low, estimate.high
+
+
+def _sampledSilhouetteLow(data, labels):
+    return sampledSilhouetteInterval(data, labels)[1]
 
-    A = distances[np.arange(n), labels]  # distance of each point to its cluster centroid
-    distances[np.arange(n), labels] = np.Inf  # set to infinite the distance to own centroid
 
-    B = np.min(
-        distances, axis=1
-    )  # distance to each point to the second closer centroid (different from its own cluster)
-    M = np.maximum(A, B)  # max row wise of A and B
-    S = np.mean((B - A) / M)
-    return float(S)
+def _sampledSilhouetteHigh(data, labels):
+    return sampledSilhouetteInterval(data, labels)[2]
+
+
+def simplifiedSilhouette(data, labels) -> float:
+    """Simplified Silhouette Coefficient of all samples. Better max."""
+    return _simplifiedSilhouette(_ClusterStatistics(data, labels, ["simplified_silhouette"]))
 
 
 ALL_VALIDATION_METRICS_DICT = {
@@ -88,11 +303,27 @@ ALL_VALIDATION_METRICS_DICT = {
     "dunn_index": dunnIndex,
     "inertia": inertia,
     # "silhouette": silhouette,
+    "sampled_silhouette": sampledSilhouette,
+    "sampled_silhouette_low": _sampledSilhouetteLow,
+    "sampled_silhouette_high": _sampledSilhouetteHigh,
     "simplified_silhouette": simplifiedSilhouette,
 }
 
 ALL_VALIDATION_METRICS = sorted(ALL_VALIDATION_METRICS_DICT.keys())
 
+# metrics computed from statistics of a partition shared by several metrics: name -> (statistics class, function).
+# The statistics are built as statisticsClass(data, labels, metricNames) with the names of the requested metrics.
+_STATISTICS_VALIDATION_METRICS = {
+    "calinski_harabasz": (_ClusterStatistics, _calinskiHarabasz),
+    "davies_bouldin": (_ClusterStatistics, _daviesBouldinIndex),
+    "dunn_index": (_ClusterStatistics, _dunnIndex),
+    "inertia": (_ClusterStatistics, _inertia),
+    "simplified_silhouette": (_ClusterStatistics, _simplifiedSilhouette),
+    "sampled_silhouette": (_SilhouetteEstimate, _silhouetteEstimateValue),
+    "sampled_silhouette_low": (_SilhouetteEstimate, _silhouetteEstimateLow),
+    "sampled_silhouette_high": (_SilhouetteEstimate, _silhouetteEstimateHigh),
+}
+
 
 def _checkValidationMetric(metricName):
     """
@@ -136,6 +367,8 @@ __all__ = [
     "daviesBouldinIndex",
     "dunnIndex",
     "inertia",
+    "sampledSilhouette",
+    "sampledSilhouetteInterval",
     "silhouette",
     "simplifiedSilhouette",
 ]
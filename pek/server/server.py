@@ -1,3 +1,4 @@
+from ..clustering.results import ProcessErrorResult
 from .listener import ResultsListener
 from .tasks import ElbowTask, EnsembleTask
 from .wss import WebSocketServer
@@ -34,6 +35,10 @@ class PEKServer:
     def sendPartialResult(self, partialResult):
         taskId = partialResult.taskId
 
+        if isinstance(partialResult, ProcessErrorResult):
+            self.wss.sendProcessError(taskId, partialResult)
+            return
+
         self.wss.sendPartialResult(taskId, partialResult)
 
         if partialResult.info.last:
@@ -8,6 +8,9 @@ from ..clustering import (
 )
 from ..data import DatasetLoader
 
+# arguments of the processes that the clients cannot set: the checkpoints are files written by the server
+SERVER_ONLY_ARGS = ["checkpointPath", "checkpointFreq"]
+
 
 class TaskStatus(Enum):
     pending = "pending"
@@ -17,6 +20,12 @@ class TaskStatus(Enum):
     completed = "completed"
 
 
+def _checkClientArgs(args):
+    for name in SERVER_ONLY_ARGS:
+        if name in args:
+            raise ValueError(f"The argument {name} cannot be set by the clients.")
+
+
 class _Task(ABC):
     def __init__(self, queue):
         self.id = str(uuid.uuid4())
@@ -54,7 +63,9 @@ class EnsembleTask(_Task):
         super().__init__(queue)
         self.id = "ENS-" + self.id
 
-        X = DatasetLoader.load(args["dataset"]).data
+        _checkClientArgs(args)
+        dataset = DatasetLoader.load(args["dataset"])
+        X = dataset.lazyData if args.pop("outOfCore", False) else dataset.data
         args["resultsQueue"] = queue
         args["taskId"] = self.id
         self.process = ProgressiveEnsembleKMeansProcess(X, **args)
@@ -70,7 +81,9 @@ class ElbowTask(_Task):
         super().__init__(queue)
         self.id = "ELB-" + self.id
 
-        X = DatasetLoader.load(args["dataset"]).data
+        _checkClientArgs(args)
+        dataset = DatasetLoader.load(args["dataset"])
+        X = dataset.lazyData if args.pop("outOfCore", False) else dataset.data
         args["resultsQueue"] = queue
         args["taskId"] = self.id
         self.process = ProgressiveEnsembleElbowProcess(X, **args)
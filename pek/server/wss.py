@@ -110,6 +110,11 @@ class WebSocketServer(Thread):
 
         socketio.run(app, port=self.port, host="0.0.0.0")
 
+    def sendProcessError(self, taskId, error):
+        """Sends the failure of a control message of the task (e.g. a checkpoint) on the 'task-error' event."""
+        self.socketio.emit("task-error", error.toJson(), to=taskId)
+        Log.print(f"{Log.RED}Failed {error.messageType} ({error.path}): {error.error}", taskId=taskId)
+
     def sendPartialResult(self, taskId, partialResult):
         self.socketio.emit(taskId, partialResult.toJson(), to=taskId)
 
@@ -1,6 +1,9 @@
 import numpy as np
+from scipy.optimize import linear_sum_assignment
 from sklearn.metrics.pairwise import euclidean_distances
 
+_RELABEL_CHUNK_SIZE = 2**16  # columns of the partitions relabeled at a time
+
 
 def getClusters(data, labels):
     """
@@ -15,14 +18,39 @@ def getClusters(data, labels):
     return clusters, centers
 
 
-"""def best_labels_dtype(n_clusters):
-    #Best dtype for the number of distinct label existing
+def best_labels_dtype(n_clusters):
+    """Smallest dtype able to store the labels of n_clusters clusters.
+    Labels are stored compact, the kernels that require int32 labels get a converted view."""
     if n_clusters <= 255:
         return np.uint8
     elif n_clusters <= 65535:
         return np.uint16
     else:
-        return np.uint32"""
+        return np.int32
+
+
+def alignCentroids(reference, centroids):
+    """Optimal alignment of one or many sets of centroids to the reference centroids.
+    - reference: array (k, d).
+    - centroids: array (k, d), or (r, k, d) for r sets of centroids.
+    Returns the permutations perm, of shape (k,) or (r, k), such that centroids[perm] (centroids[s][perm[s]])
+    is aligned to reference: the total squared distance between matched centroids is minimal.
+    The r x k x k distances are computed at once, each assignment is solved by linear_sum_assignment."""
+    single = centroids.ndim == 2
+    C = np.asarray(centroids, dtype=np.float64).reshape(-1, *reference.shape)
+    R = np.asarray(reference, dtype=np.float64)
+
+    # cost[s, j, i] = ||R[j] - C[s, i]||^2
+    cost = np.matmul(R, C.transpose(0, 2, 1))
+    cost *= -2
+    cost += np.einsum("jd,jd->j", R, R)[None, :, None]
+    cost += np.einsum("sid,sid->si", C, C)[:, None, :]
+
+    perms = np.empty(C.shape[:2], dtype=np.intp)
+    for s in range(C.shape[0]):
+        rows, cols = linear_sum_assignment(cost[s])
+        perms[s, rows] = cols
+    return perms[0] if single else perms
 
 
 def adjustLabels(currLabels, currCentroids, prevCentroids):
@@ -43,3 +71,30 @@ def adjustLabels(currLabels, currCentroids, prevCentroids):
         adjustedLabels[currLabels == i] = j
 
     return adjustedLabels
+
+
+def adjustPartitions(partitions, centroids, prevCentroids):
+    """Batched version of adjustLabels for many partitions at once, in place.
+    - partitions: array (r, n) of labels, relabeled in place.
+    - centroids: array (r, k, d), the centroids of each partition, reordered in place to follow the new labels.
+    - prevCentroids: array (k, d), the centroids the labels must be consistent with.
+    The permutation of each partition is the optimal alignment of its centroids to prevCentroids (see alignCentroids).
+    The labels are rewritten with a gather through a (r * k) lookup table, skipped if no label changes."""
+    n_runs, n_clusters = centroids.shape[:2]
+    perms = alignCentroids(prevCentroids, centroids)
+
+    if np.array_equal(perms, np.broadcast_to(np.arange(n_clusters), perms.shape)):
+        return  # the labels are already consistent
+
+    for s in range(n_runs):
+        centroids[s] = centroids[s][perms[s]]
+
+    # label perms[s, j] of the partition s becomes j. The partitions can have a compact dtype, so the indices
+    # in the (r * k) lookup table are computed by chunks of columns, to bound the temporary memory
+    lut = np.empty((n_runs, n_clusters), dtype=partitions.dtype)
+    lut[np.arange(n_runs)[:, None], perms] = np.arange(n_clusters)
+    lut = lut.ravel()
+    offsets = (np.arange(n_runs, dtype=np.intp) * n_clusters)[:, None]
+    for start in range(0, partitions.shape[1], _RELABEL_CHUNK_SIZE):
+        chunk = partitions[:, start : start + _RELABEL_CHUNK_SIZE]
+        chunk[...] = lut[chunk + offsets]
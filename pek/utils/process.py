@@ -21,6 +21,7 @@ class ProcessControlMessageType(Enum):
     RESUME = "resume"
     KILL = "kill"
     KILL_RUN = "kill_run"
+    CHECKPOINT = "checkpoint"
 
 
 class _ProcessControlMessage:
@@ -48,8 +49,9 @@ class ProcessControlMessage(ABC):
         return _ProcessControlMessage(ProcessControlMessageType.PAUSE)
 
     @staticmethod
-    def RESUME():
-        return _ProcessControlMessage(ProcessControlMessageType.RESUME)
+    def RESUME(path=None):
+        messageData = None if path is None else Bunch(path=path)
+        return _ProcessControlMessage(ProcessControlMessageType.RESUME, messageData=messageData)
 
     @staticmethod
     def KILL():
@@ -58,3 +60,7 @@ class ProcessControlMessage(ABC):
     @staticmethod
     def KILL_RUN(runId):
         return _ProcessControlMessage(ProcessControlMessageType.KILL_RUN, messageData=Bunch(runId=runId))
+
+    @staticmethod
+    def CHECKPOINT(path):
+        return _ProcessControlMessage(ProcessControlMessageType.CHECKPOINT, messageData=Bunch(path=path))
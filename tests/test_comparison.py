@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from sklearn import metrics as skmetrics
+
+from pek.metrics import comparison
+from pek.metrics.comparison import _pairwiseComparison
+
+
+def _partitions(n_samples, n_clusters, seed):
+    """Random partitions: independent, imbalanced, a perturbed copy of the first, a single cluster and a copy
+    with permuted labels."""
+    rng = np.random.default_rng(seed)
+    first = rng.integers(0, n_clusters, n_samples)
+    perturbed = first.copy()
+    changed = rng.random(n_samples) < 0.1
+    perturbed[changed] = rng.integers(0, n_clusters, np.count_nonzero(changed))
+    imbalanced = np.minimum(rng.geometric(0.5, n_samples) - 1, n_clusters - 1)
+    independent = rng.integers(0, n_clusters, n_samples)
+    single = np.zeros(n_samples, dtype=np.int64)
+    permuted = rng.permutation(n_clusters)[first]
+    return np.stack([first, perturbed, imbalanced, independent, single, permuted])
+
+
+@pytest.mark.parametrize("n_samples, n_clusters", [(50, 3), (2000, 8), (20000, 40)])
+@pytest.mark.parametrize("batchCells", [None, 64])
+def test_pairwise_comparison_matches_sklearn(monkeypatch, n_samples, n_clusters, batchCells):
+    """ARI and AMI of all the pairs of partitions are those of sklearn, also with the batches of the contingency
+    tables split in several chunks."""
+    if batchCells is not None:
+        monkeypatch.setattr(comparison, "_MAX_BATCH_CELLS", batchCells)
+    partitions = _partitions(n_samples, n_clusters, seed=n_clusters)
+    pairs = [(p, q) for p in range(len(partitions)) for q in range(len(partitions)) if p != q]
+
+    results = _pairwiseComparison(partitions, pairs, ["ari", "ami"])
+
+    for index, (p, q) in enumerate(pairs):
+        ari = skmetrics.adjusted_rand_score(partitions[p], partitions[q])
+        ami = skmetrics.adjusted_mutual_info_score(partitions[p], partitions[q])
+        assert results["ari"][index] == pytest.approx(ari, rel=1e-9, abs=1e-12)
+        assert results["ami"][index] == pytest.approx(ami, rel=1e-7, abs=1e-9)
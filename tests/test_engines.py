@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from sklearn.cluster._k_means_lloyd import lloyd_iter_chunked_dense, lloyd_iter_chunked_sparse
+from sklearn.datasets import make_blobs
+
+from pek.clustering.engines import _multiRunLloydIter
+from pek.clustering.ensemble import ProgressiveEnsembleKMeans
+from pek.clustering.run import ProgressiveKMeans
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_multi_run_lloyd_relocates_empty_clusters(sparse):
+    """The batched kernel gives the labels and centers of the sklearn Lloyd kernel run by run, also when
+    clusters become empty."""
+    rng = np.random.default_rng(0)
+    X = np.vstack([np.repeat(rng.normal(size=(6, 3)), 100, axis=0), 5 * rng.normal(size=(20, 3))])
+    sample_weight = np.ones(X.shape[0])
+    n_runs, n_clusters = 3, 10
+    centers = [X[np.random.default_rng(r).choice(X.shape[0], n_clusters, replace=False)] for r in range(n_runs)]
+    for c in centers:
+        c[1] = c[0]  # the second cluster is empty, the ties are assigned to the first
+    if sparse:
+        X = sp.csr_matrix(X)
+    lloydIter = lloyd_iter_chunked_sparse if sparse else lloyd_iter_chunked_dense
+    expectedCenters = [c.copy() for c in centers]
+
+    for _ in range(10):
+        expectedLabels = []
+        for r in range(n_runs):
+            centers_new, labels = np.zeros_like(centers[r]), np.zeros(X.shape[0], dtype=np.int32)
+            lloydIter(
+                X, sample_weight, expectedCenters[r], centers_new, np.zeros(n_clusters), labels, np.zeros(n_clusters), 1
+            )
+            expectedCenters[r] = centers_new
+            expectedLabels.append(labels)
+
+        centers_new = [np.zeros_like(c) for c in centers]
+        weight_in_clusters = [np.zeros(n_clusters) for _ in range(n_runs)]
+        labels = [np.zeros(X.shape[0], dtype=np.int32) for _ in range(n_runs)]
+        center_shift = [np.zeros(n_clusters) for _ in range(n_runs)]
+        _multiRunLloydIter(
+            X, sample_weight, centers, centers_new, weight_in_clusters, labels, center_shift, [True] * n_runs
+        )
+        centers = centers_new
+
+        for r in range(n_runs):
+            assert np.array_equal(labels[r], expectedLabels[r])
+            assert np.allclose(centers[r], expectedCenters[r])
+            assert np.all(weight_in_clusters[r] > 0)
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_batched_ensemble_matches_runs_lloyd(sparse, dtype):
+    """The runs of a batched ensemble have the labels and centers of the runs iterated one by one."""
+    X, _ = make_blobs(3000, n_features=20, centers=6, cluster_std=3.0, random_state=0)
+    X = X.astype(dtype)
+    if sparse:
+        X = sp.csr_matrix(X)
+    kwargs = dict(n_clusters=6, n_runs=4, random_state=0, tol=0, max_iter=15)
+    ensembles = [ProgressiveEnsembleKMeans(X, batched=batched, **kwargs) for batched in [False, True]]
+
+    while ensembles[0].hasNextIteration():
+        expected, result = [e.executeNextIteration() for e in ensembles]
+        assert np.array_equal(result.partitions, expected.partitions)
+        np.testing.assert_allclose(result.centroids, expected.centroids, rtol=1e-5, atol=1e-5)
+    assert not ensembles[1].hasNextIteration()
+
+
+def _labelsMeansInertia(X, labels):
+    X = X.toarray() if sp.issparse(X) else X
+    X = X.astype(np.float64)
+    return sum(((X[labels == j] - X[labels == j].mean(axis=0)) ** 2).sum() for j in np.unique(labels))
+
+
+@pytest.mark.parametrize("algorithm", ["lloyd", "elkan", "hamerly"])
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_run_inertia_matches_labels_means_inertia(algorithm, sparse, dtype):
+    """The inertia of the iterations is that of the labels w.r.t. their means, also on tight clusters far from the
+    origin, where the rounding errors of the centers are large w.r.t. the distances within the clusters."""
+    X, _ = make_blobs(2000, n_features=5, centers=5, cluster_std=0.05, center_box=(-1, 1), random_state=0)
+    X = (X + 100).astype(dtype)
+    if sparse:
+        X = sp.csr_matrix(X)
+    run = ProgressiveKMeans(X, n_clusters=5, random_state=0, algorithm=algorithm, tol=0, max_iter=10)
+    while run.hasNextIteration():
+        result = run.executeNextIteration()
+        expected = _labelsMeansInertia(X, result.labels)
+        assert result.metrics.inertia == pytest.approx(expected, rel=1e-8)
+
+
+@pytest.mark.parametrize("algorithm", ["elkan", "hamerly"])
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_triangle_inequality_engines_match_lloyd(algorithm, sparse, dtype):
+    """The Elkan and Hamerly engines give the labels and centers of the Lloyd engine at each iteration."""
+    X, _ = make_blobs(3000, n_features=10, centers=8, cluster_std=8.0, random_state=0)
+    X = X.astype(dtype)
+    if sparse:
+        X = sp.csr_matrix(X)
+    kwargs = dict(n_clusters=8, random_state=0, tol=0, max_iter=30)
+    runs = [ProgressiveKMeans(X, algorithm=a, **kwargs) for a in ["lloyd", algorithm]]
+
+    while runs[0].hasNextIteration():
+        expected, result = [run.executeNextIteration() for run in runs]
+        assert result.info.iteration == expected.info.iteration
+        assert np.array_equal(result.labels, expected.labels)
+        rtol = 1e-4 if dtype == np.float32 else 1e-10
+        np.testing.assert_allclose(result.centroids, expected.centroids, rtol=rtol, atol=rtol)
+    assert not runs[1].hasNextIteration()
@@ -0,0 +1,66 @@
+import pytest
+from sklearn.datasets import make_blobs
+
+from pek import ProgressiveEnsembleKMeans
+from pek.termination.earlyTermination import AbstractEarlyTerminator, EarlyTerminationAction, EarlyTerminatorKiller
+
+
+@pytest.mark.parametrize("metricsExecutor", ["serial", "threads"])
+def test_last_partial_result_of_early_termination_has_its_metrics(metricsExecutor):
+    X, _ = make_blobs(5000, centers=8, n_features=4, cluster_std=3, random_state=0)
+    ensemble = ProgressiveEnsembleKMeans(
+        X,
+        n_clusters=8,
+        random_state=0,
+        tol=0,
+        ets=[EarlyTerminatorKiller.custom("kill", 1e-3)],
+        labelsValidationMetrics=["calinski_harabasz"],
+        partitionsComparisonMetrics=["ari"],
+        metricsCadence={"calinski_harabasz": {"iterations": 4}, "ari": {"iterations": 4}},
+        metricsExecutor=metricsExecutor,
+        delta=True,
+    )
+    r = ensemble.executeAllIterations()
+
+    assert r.earlyTermination["kill"] and r.info.last and not r.info.completed
+    assert r.metrics.iteration == r.info.iteration
+    assert all(value == 0 for group in r.metrics.staleness.values() for value in group.values())
+    assert r.keyframe
+
+
+class _MetricsReader(AbstractEarlyTerminator):
+    """Reads the metrics of the checked partial results, kills the ensemble at killIteration."""
+
+    def __init__(self, killIteration):
+        super().__init__("reader")
+        self.killIteration = killIteration
+        self.checked = []
+
+    def checkEarlyTermination(self, partialResult):
+        metrics = partialResult.metrics
+        self.checked.append((partialResult.info.iteration, metrics.iteration, metrics.labelsValidationMetrics))
+        if partialResult.info.iteration == self.killIteration:
+            return EarlyTerminationAction.KILL
+        return EarlyTerminationAction.NONE
+
+
+@pytest.mark.parametrize("metricsExecutor", ["serial", "threads"])
+def test_early_terminators_check_the_metrics_of_the_partial_result(metricsExecutor):
+    X, _ = make_blobs(5000, centers=8, n_features=4, cluster_std=3, random_state=0)
+    reader = _MetricsReader(killIteration=6)
+    ensemble = ProgressiveEnsembleKMeans(
+        X,
+        n_clusters=8,
+        random_state=0,
+        tol=0,
+        ets=[reader],
+        labelsValidationMetrics=["calinski_harabasz"],
+        metricsExecutor=metricsExecutor,
+    )
+    r = ensemble.executeAllIterations()
+
+    assert r.info.iteration == 6 and r.earlyTermination["reader"]
+    assert len(reader.checked) == 7
+    for iteration, metricsIteration, validationMetrics in reader.checked:
+        assert metricsIteration == iteration
+        assert validationMetrics.calinski_harabasz is not None
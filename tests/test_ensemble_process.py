@@ -0,0 +1,117 @@
+import queue
+from multiprocessing import Queue
+
+import pytest
+from sklearn.datasets import make_blobs
+
+from pek.clustering import shared
+from pek.clustering.ensemble import ProgressiveEnsembleKMeans, ProgressiveEnsembleKMeansProcess
+from pek.clustering.results import ProcessErrorResult
+
+
+def _process(X, resultsQueue, asynchronous, **kwargs):
+    return ProgressiveEnsembleKMeansProcess(
+        X,
+        random_state=0,
+        executor="processes",
+        n_jobs=2,
+        asynchronous=asynchronous,
+        freq=0.01 if asynchronous else None,
+        resultsQueue=resultsQueue,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_processes_executor_in_process(asynchronous):
+    """The worker processes of the executor are started and stopped by the process computing the iterations."""
+    X, _ = make_blobs(2000, centers=3, n_features=4, random_state=0)
+    resultsQueue = Queue()
+    process = _process(X, resultsQueue, asynchronous, n_clusters=3, n_runs=4)
+    process.start()
+
+    r = resultsQueue.get(timeout=60)
+    while not r.info.last:
+        r = resultsQueue.get(timeout=60)
+    process.join(timeout=60)
+
+    assert r.info.completed
+    assert r.partitions.shape == (4, 2000)
+    assert process.exitcode == 0
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_processes_executor_kill_in_process(asynchronous):
+    X, _ = make_blobs(20000, centers=8, n_features=4, random_state=0)
+    resultsQueue = Queue()
+    process = _process(X, resultsQueue, asynchronous, n_clusters=8, n_runs=4, tol=0, max_iter=300)
+    process.start()
+
+    resultsQueue.get(timeout=60)
+    process.kill()
+    # the queue is consumed, otherwise the process waits for its results to be read before exiting
+    while process.is_alive() or not resultsQueue.empty():
+        try:
+            resultsQueue.get(timeout=1)
+        except queue.Empty:
+            pass
+    process.join(timeout=60)
+
+    assert process.exitcode == 0
+
+
+def test_control_message_failures_are_reported(tmp_path):
+    X, _ = make_blobs(2000, centers=3, n_features=4, random_state=0)
+    badCheckpoint = tmp_path / "bad.ckpt"
+    badCheckpoint.write_bytes(b"not a checkpoint")
+    resultsQueue = Queue()
+    process = ProgressiveEnsembleKMeansProcess(X, n_clusters=3, random_state=0, tol=0, resultsQueue=resultsQueue)
+    process.pause()
+    process.start()
+    process.checkpoint(tmp_path / "missing" / "x.ckpt")
+    process.resume(badCheckpoint)
+
+    errors, r = [], resultsQueue.get(timeout=60)
+    while isinstance(r, ProcessErrorResult) or not r.info.last:
+        if isinstance(r, ProcessErrorResult):
+            errors.append(r)
+        r = resultsQueue.get(timeout=60)
+    process.join(timeout=60)
+
+    assert [e.messageType for e in errors] == ["checkpoint", "resume"]
+    assert r.info.completed
+    assert process.exitcode == 0
+
+
+@pytest.mark.parametrize("executor", ["threads", "processes"])
+def test_batched_requires_serial_executor(executor):
+    X, _ = make_blobs(200, centers=3, n_features=4, random_state=0)
+    with pytest.raises(ValueError, match="serial"):
+        ProgressiveEnsembleKMeans(X, n_clusters=3, batched=True, executor=executor)
+
+
+def test_runs_and_metrics_workers_share_a_single_copy_of_x(monkeypatch):
+    """The worker processes of the runs and of the background metrics use the same shared memory copy of X."""
+    X, _ = make_blobs(2000, centers=3, n_features=4, random_state=0)
+    copies = []
+
+    def toSharedMemory(a):
+        copies.append(a.shape)
+        return toSharedMemoryFn(a)
+
+    toSharedMemoryFn = shared._toSharedMemory
+    monkeypatch.setattr(shared, "_toSharedMemory", toSharedMemory)
+    ensemble = ProgressiveEnsembleKMeans(
+        X,
+        n_clusters=3,
+        n_runs=4,
+        random_state=0,
+        executor="processes",
+        n_jobs=2,
+        metricsExecutor="processes",
+        labelsValidationMetrics=["inertia"],
+    )
+    while ensemble.hasNextIteration():
+        ensemble.executeNextIteration()
+
+    assert copies.count(X.shape) == 1
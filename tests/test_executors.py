@@ -0,0 +1,30 @@
+import time
+
+import numpy as np
+from sklearn.datasets import make_blobs
+
+from pek.clustering.executors import _ProcessesExecutor
+from pek.clustering.run import ProgressiveKMeans
+from pek.clustering.shared import SharedData
+
+
+def test_processes_executor_undelivered_labels_not_overwritten():
+    """The results collected while the workers are busy keep their labels after the workers resume."""
+    X, _ = make_blobs(400000, centers=8, n_features=4, cluster_std=4.0, random_state=0)
+    data = SharedData(X)
+    runs = [ProgressiveKMeans(data, n_clusters=8, random_state=0, tol=0, max_iter=50)]
+    executor = _ProcessesExecutor(runs, data.share(), n_jobs=1)
+    try:
+        executor.executeNextIterations([0])
+        executor._send("step", [0])
+        expected = executor.runs()[0]._labels.copy()  # the result of the step is undelivered
+
+        # returns the undelivered result at once, while the worker computes the next iteration
+        result = executor.executeUntil([0], time.time())[0]
+        executor.runs()
+
+        assert result.info.iteration == 1
+        assert not np.array_equal(executor.runs()[0]._labels, expected)
+        assert np.array_equal(result.labels, expected)
+    finally:
+        executor.close()
@@ -0,0 +1,24 @@
+import numpy as np
+
+from pek.metrics.progression import ALL_PROGRESSION_METRICS, ALL_PROGRESSION_METRICS_DICT, _StabilityTracker
+
+
+def test_stability_tracker_matches_history_metrics():
+    """The incremental tracker gives the values of the progression metrics computed on the whole history."""
+    rng = np.random.default_rng(0)
+    n_runs, n_iterations = 3, 14
+    # labels that change for a decreasing fraction of the entries, and come back to previous labels
+    partitions = rng.integers(0, 4, size=(n_runs, 200))
+    history = [[] for _ in range(n_runs)]
+    tracker = _StabilityTracker(ALL_PROGRESSION_METRICS)
+    for i in range(n_iterations):
+        changed = rng.random(partitions.shape) < 0.5 / (i + 1)
+        partitions = np.where(changed, rng.integers(0, 4, size=partitions.shape), partitions)
+        tracker.update(partitions)
+        for r in range(n_runs):
+            history[r].append(partitions[r].copy())
+
+        for metricName in ALL_PROGRESSION_METRICS:
+            values = tracker.value(metricName)
+            for r in range(n_runs):
+                np.testing.assert_allclose(values[r], ALL_PROGRESSION_METRICS_DICT[metricName](history[r]), atol=1e-12)
@@ -0,0 +1,14 @@
+from multiprocessing import Queue
+
+import pytest
+
+pytest.importorskip("flask")
+
+from pek.server.tasks import SERVER_ONLY_ARGS, ElbowTask, EnsembleTask
+
+
+@pytest.mark.parametrize("taskClass", [EnsembleTask, ElbowTask])
+@pytest.mark.parametrize("argName", SERVER_ONLY_ARGS)
+def test_clients_cannot_set_checkpoints(taskClass, argName):
+    with pytest.raises(ValueError, match=argName):
+        taskClass({"dataset": "Iris", argName: "/tmp/x.ckpt"}, Queue())
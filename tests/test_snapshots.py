@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from pek.clustering.delta import PartialResultDecoder
+from pek.clustering.ensemble import ProgressiveEnsembleKMeans
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"labelsComparisonMetrics": ["ari"]}, {"delta": True, "keyframeFreq": 4}])
+def test_partitions_buffer_not_copied_when_results_dropped(kwargs):
+    """Without snapshots held by the consumer, the partitions are written in place at each iteration."""
+    X = np.random.default_rng(0).normal(size=(2000, 4))
+    ensemble = ProgressiveEnsembleKMeans(X, n_clusters=8, n_runs=3, random_state=0, tol=0, max_iter=10, **kwargs)
+    ensemble.executeNextIteration()
+    bufferId = id(ensemble._partitions._array)  # a reference to the buffer would trigger the copy
+    while ensemble.hasNextIteration():
+        ensemble.executeNextIteration()
+
+    assert id(ensemble._partitions._array) == bufferId
+
+
+def test_partitions_snapshots_held_by_consumer_unchanged():
+    X = np.random.default_rng(0).normal(size=(2000, 4))
+    ensemble = ProgressiveEnsembleKMeans(X, n_clusters=8, n_runs=3, random_state=0, tol=0, max_iter=10)
+    first = ensemble.executeNextIteration()
+    expected = first.partitions.copy()
+    while ensemble.hasNextIteration():
+        ensemble.executeNextIteration()
+
+    assert np.array_equal(first.partitions, expected)
+
+
+def test_delta_stream_decoded_without_held_snapshots():
+    X = np.random.default_rng(0).normal(size=(2000, 4))
+    kwargs = dict(n_clusters=8, n_runs=3, random_state=0, tol=0, max_iter=10)
+    full = ProgressiveEnsembleKMeans(X, **kwargs)
+    delta = ProgressiveEnsembleKMeans(X, delta=True, keyframeFreq=4, **kwargs)
+    decoder = PartialResultDecoder()
+    while full.hasNextIteration():
+        expected, decoded = full.executeNextIteration(), decoder.decode(delta.executeNextIteration())
+        for name in ["labels", "partitions", "centroids"]:
+            assert np.array_equal(decoded[name], expected[name])
+
+
+def test_partitions_rows_held_by_consumer_unchanged():
+    """A view derived from a snapshot keeps it in use after the partial result is dropped."""
+    X = np.random.default_rng(0).normal(size=(2000, 4))
+    ensemble = ProgressiveEnsembleKMeans(X, n_clusters=8, n_runs=3, random_state=0, tol=0, max_iter=10)
+    row = ensemble.executeNextIteration().partitions[1]
+    expected = row.copy()
+    while ensemble.hasNextIteration():
+        ensemble.executeNextIteration()
+
+    assert np.array_equal(row, expected)
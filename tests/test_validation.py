@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from sklearn import metrics as skmetrics
+from sklearn.datasets import make_blobs
+
+from pek.metrics import validation
+from pek.metrics.validation import (
+    calinskiHarabasz,
+    daviesBouldinIndex,
+    dunnIndex,
+    inertia,
+    sampledSilhouetteInterval,
+    simplifiedSilhouette,
+)
+from pek.utils.clustering import getClusters
+
+
+def _data(sparse, dtype):
+    X, labels = make_blobs(3000, n_features=6, centers=5, cluster_std=2.0, random_state=0)
+    X = X.astype(dtype)
+    # a cluster is split in two, so the labels are not those of the nearest centers
+    labels[(labels == 0) & (X[:, 0] > np.median(X[labels == 0, 0]))] = 5
+    return (sp.csr_matrix(X) if sparse else X), labels
+
+
+def _baselineInertia(data, labels):
+    X = data.toarray() if sp.issparse(data) else data
+    clusters, centers = getClusters(X.astype(float), labels)
+    return sum(float(np.sum((cluster - center) ** 2)) for cluster, center in zip(clusters, centers))
+
+
+def _baselineSimplifiedSilhouette(data, labels):
+    n = data.shape[0]
+    clusters, centers = getClusters(data, labels)
+    distances = skmetrics.pairwise.euclidean_distances(data, centers)
+    A = distances[np.arange(n), labels]
+    distances[np.arange(n), labels] = np.inf
+    B = np.min(distances, axis=1)
+    return float(np.mean((B - A) / np.maximum(A, B)))
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+@pytest.mark.parametrize("chunkElements", [None, 100])
+def test_cluster_statistics_metrics_match_baseline(monkeypatch, sparse, dtype, chunkElements):
+    """The metrics computed from the shared cluster statistics are those of the original implementations
+    (sklearn, and the direct computations on the clusters), also with the passes split in several chunks."""
+    if chunkElements is not None:
+        monkeypatch.setattr(validation, "_STATISTICS_CHUNK_ELEMENTS", chunkElements)
+    data, labels = _data(sparse, dtype)
+    X = data.toarray() if sparse else data
+    rtol = 1e-4 if dtype == np.float32 else 1e-9
+
+    assert calinskiHarabasz(data, labels) == pytest.approx(skmetrics.calinski_harabasz_score(X, labels), rel=rtol)
+    assert inertia(data, labels) == pytest.approx(_baselineInertia(data, labels), rel=rtol)
+    expected = _baselineSimplifiedSilhouette(X, labels)
+    assert simplifiedSilhouette(data, labels) == pytest.approx(expected, rel=rtol)
+
+
+def test_cluster_statistics_ignore_empty_clusters():
+    """Labels with gaps give the metrics of the compacted labels."""
+    data, labels = _data(False, np.float64)
+    gaps = np.array([0, 2, 3, 7, 8, 11])[labels]
+    for metric in [calinskiHarabasz, inertia, simplifiedSilhouette]:
+        assert metric(data, gaps) == pytest.approx(metric(data, labels), rel=1e-12)
+
+
+def test_shared_cluster_statistics_give_the_metrics_functions():
+    """A single _ClusterStatistics built for all the metrics gives the values of the metrics functions."""
+    data, labels = _data(False, np.float64)
+    metrics = validation._STATISTICS_VALIDATION_METRICS
+    names = [name for name, (statisticsClass, _) in metrics.items() if statisticsClass is validation._ClusterStatistics]
+    statistics = validation._ClusterStatistics(data, labels, names)
+    for name in names:
+        function = metrics[name][1]
+        expected = validation.ALL_VALIDATION_METRICS_DICT[name](data, labels)
+        assert function(statistics) == pytest.approx(expected, rel=1e-12)
+
+
+@pytest.mark.parametrize("cluster_std", [1.0, 3.0, 6.0])
+def test_sampled_silhouette_interval_contains_silhouette(cluster_std):
+    """The 95% confidence interval of the sampled silhouette contains the silhouette of all the samples."""
+    X, labels = make_blobs(8000, n_features=5, centers=6, cluster_std=cluster_std, random_state=1)
+    estimate, low, high = sampledSilhouetteInterval(X, labels)
+    assert low <= estimate <= high
+    assert low <= skmetrics.silhouette_score(X, labels) <= high
+
+
+def test_sampled_silhouette_exact_on_small_data():
+    """If the data fits in the samples, the estimate is the silhouette, with an empty interval."""
+    X, labels = make_blobs(600, n_features=4, centers=4, cluster_std=2.0, random_state=0)
+    estimate, low, high = sampledSilhouetteInterval(X, labels)
+    assert estimate == pytest.approx(skmetrics.silhouette_score(X, labels), rel=1e-9)
+    assert low == pytest.approx(estimate) and high == pytest.approx(estimate)
+
+
+def _baselineDunnIndex(data, labels):
+    clusters, centers = getClusters(data, labels)
+    centersDistances = skmetrics.pairwise.euclidean_distances(centers)
+    diameter = max(np.mean(skmetrics.pairwise.euclidean_distances(c, [center])) for c, center in zip(clusters, centers))
+    return float(np.min(centersDistances[np.triu_indices(len(centers), 1)]) / diameter)
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+@pytest.mark.parametrize("chunkElements", [None, 100])
+def test_dunn_and_davies_bouldin_match_baseline(monkeypatch, sparse, dtype, chunkElements):
+    """Dunn and Davies-Bouldin indices are those of the original implementations, also with the distances
+    among the centers computed in several blocks."""
+    if chunkElements is not None:
+        monkeypatch.setattr(validation, "_STATISTICS_CHUNK_ELEMENTS", chunkElements)
+    X, labels = make_blobs(3000, n_features=6, centers=40, cluster_std=1.5, random_state=0)
+    X = X.astype(dtype)
+    data = sp.csr_matrix(X) if sparse else X
+    rtol = 1e-4 if dtype == np.float32 else 1e-9
+
+    assert dunnIndex(data, labels) == pytest.approx(_baselineDunnIndex(X, labels), rel=rtol)
+    assert daviesBouldinIndex(data, labels) == pytest.approx(skmetrics.davies_bouldin_score(X, labels), rel=rtol)